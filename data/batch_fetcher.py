@@ -0,0 +1,116 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from alpaca.data.requests import StockBarsRequest
+
+
+class BatchBarFetcher:
+    def __init__(self, historical_data_client, symbols_per_request=100, max_workers=4, page_days=None,
+                 max_retries=5, backoff_base=1.0, verbose=False):
+        """
+        Fetches bars for many symbols with multi-symbol requests sent concurrently on a bounded thread pool.
+
+        Symbols are grouped into requests of up to `symbols_per_request` symbols. If `page_days` is set,
+        the date range is also split into pages of that many days, so large minute-level queries are
+        spread over several smaller requests instead of one long sequential pagination. Requests that
+        are rate limited (HTTP 429) are retried with exponential backoff and jitter.
+
+        :param historical_data_client: Alpaca StockHistoricalDataClient (or anything with `get_stock_bars`)
+        :param symbols_per_request: Maximum number of symbols per request (default: 100)
+        :param max_workers: Number of requests in flight at once (default: 4)
+        :param page_days: Split the date range into pages of this many days (default: no split)
+        :param max_retries: Retries per request after a rate-limit response (default: 5)
+        :param backoff_base: Initial backoff in seconds, doubled after each retry (default: 1.0)
+        :param verbose: Print each request if True
+        """
+        self.historical_data_client = historical_data_client
+        self.symbols_per_request = symbols_per_request
+        self.max_workers = max_workers
+        self.page_days = page_days
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.verbose = verbose
+
+        self.api_calls = 0
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_rate_limited(error):
+        """ Returns True if the error is an API rate-limit response. """
+        status_code = getattr(error, 'status_code', None)
+        if status_code is None:
+            status_code = getattr(getattr(error, 'response', None), 'status_code', None)
+        return status_code == 429
+
+    def _pages(self, start, end):
+        if self.page_days is None:
+            return [(start, end)]
+        pages = []
+        page_start = start
+        while page_start < end:
+            page_end = min(page_start + pd.Timedelta(days=self.page_days), end)
+            pages.append((page_start, page_end))
+            page_start = page_end
+        return pages
+
+    def _fetch_page(self, symbols, timeframe, start, end):
+        request_params = StockBarsRequest(
+            symbol_or_symbols=symbols,
+            timeframe=timeframe,
+            start=start.to_pydatetime(),
+            end=end.to_pydatetime()
+        )
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self._lock:
+                    self.api_calls += 1
+                if self.verbose:
+                    print(f"Requesting {len(symbols)} symbols from {start} to {end}")
+                bars = self.historical_data_client.get_stock_bars(request_params)
+                return bars.df.reset_index()
+            except Exception as e:
+                if not self.is_rate_limited(e) or attempt == self.max_retries:
+                    raise
+                delay = self.backoff_base * 2 ** attempt
+                delay += random.uniform(0, delay)  # Jitter so workers don't retry in lockstep
+                with self._lock:
+                    self.retries += 1
+                print(f"Rate limited, retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries})")
+                time.sleep(delay)
+
+    def fetch(self, symbols, timeframe, start, end):
+        """
+        Fetches bars for all symbols over [start, end].
+
+        Args:
+            symbols (str or list): Ticker symbol(s).
+            timeframe (TimeFrame): Bar timeframe.
+            start, end: Query bounds (str, datetime or pd.Timestamp; naive values are treated as UTC).
+
+        Returns:
+            pd.DataFrame: Bars in `reset_index()` form with 'symbol' and 'timestamp' columns, empty if none.
+        """
+        symbols = [symbols] if isinstance(symbols, str) else list(symbols)
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        start = start.tz_localize('UTC') if start.tzinfo is None else start.tz_convert('UTC')
+        end = end.tz_localize('UTC') if end.tzinfo is None else end.tz_convert('UTC')
+
+        groups = [symbols[i:i + self.symbols_per_request] for i in range(0, len(symbols), self.symbols_per_request)]
+        jobs = [(group, page_start, page_end) for group in groups for page_start, page_end in self._pages(start, end)]
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, max(len(jobs), 1))) as executor:
+            frames = list(executor.map(lambda job: self._fetch_page(job[0], timeframe, job[1], job[2]), jobs))
+
+        frames = [df for df in frames if not df.empty]
+        if not frames:
+            return pd.DataFrame()
+
+        df = pd.concat(frames, ignore_index=True)
+        if self.page_days is not None:
+            # Page boundaries are inclusive on both ends, so a bar can be returned twice
+            df = df.drop_duplicates(['symbol', 'timestamp'])
+        return df
@@ -0,0 +1,242 @@
+import json
+import os
+from datetime import timedelta
+import pandas as pd
+from alpaca.data.timeframe import TimeFrame
+from data.batch_fetcher import BatchBarFetcher
+from data.resample import resample_bars, timeframe_length
+
+
+class CacheStats:
+    def __init__(self):
+        """
+        Counters describing how much work the bar cache saved.
+
+        hits: symbol queries answered entirely from disk.
+        misses: symbol queries that needed at least one range fetched from the API.
+        api_calls: requests sent to the historical data client.
+        bytes_fetched: in-memory size of the bars returned by the API.
+        bytes_read: in-memory size of the bars answered from disk.
+        """
+        self.hits = 0
+        self.misses = 0
+        self.api_calls = 0
+        self.bytes_fetched = 0
+        self.bytes_read = 0
+
+    def as_dict(self):
+        return dict(hits=self.hits, misses=self.misses, api_calls=self.api_calls,
+                    bytes_fetched=self.bytes_fetched, bytes_read=self.bytes_read)
+
+    def __str__(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0.0
+        return (f"Bar cache: {self.hits} hits, {self.misses} misses ({hit_rate:.0%} hit rate), "
+                f"{self.api_calls} API calls, {self.bytes_fetched / 1e6:.2f} MB fetched, "
+                f"{self.bytes_read / 1e6:.2f} MB read from disk")
+
+
+class BarCache:
+    def __init__(self, historical_data_client, cache_dir="cache/bars", verbose=False, batch_fetcher=None):
+        """
+        On-disk bar store in front of Alpaca's historical data client.
+
+        Bars are stored as one Parquet file per symbol, partitioned by timeframe
+        (`{cache_dir}/{timeframe}/{symbol}.parquet`). A per-timeframe coverage index records which
+        date ranges have been fetched, so symbols without bars on holidays are not refetched and
+        only the missing gaps of a query are requested from the API.
+
+        :param historical_data_client: Alpaca StockHistoricalDataClient (or anything with `get_stock_bars`)
+        :param cache_dir: Root directory of the store (default: cache/bars)
+        :param verbose: Print each fetched gap if True
+        :param batch_fetcher: BatchBarFetcher used for missing ranges (default: one over historical_data_client)
+        """
+        self.historical_data_client = historical_data_client
+        self.batch_fetcher = batch_fetcher or BatchBarFetcher(historical_data_client, verbose=verbose)
+        self.cache_dir = cache_dir
+        self.verbose = verbose
+        self.stats = CacheStats()
+        self._coverage = {}
+
+    @staticmethod
+    def _to_utc(value):
+        ts = pd.Timestamp(value)
+        return ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')
+
+    def _partition_dir(self, timeframe):
+        return os.path.join(self.cache_dir, str(timeframe))
+
+    def _partition_path(self, symbol, timeframe):
+        return os.path.join(self._partition_dir(timeframe), f"{symbol}.parquet")
+
+    def _coverage_path(self, timeframe):
+        return os.path.join(self._partition_dir(timeframe), "_coverage.json")
+
+    def _load_coverage(self, timeframe):
+        key = str(timeframe)
+        if key not in self._coverage:
+            path = self._coverage_path(timeframe)
+            coverage = {}
+            if os.path.exists(path):
+                with open(path) as f:
+                    coverage = {symbol: [(pd.Timestamp(s), pd.Timestamp(e)) for s, e in ranges]
+                                for symbol, ranges in json.load(f).items()}
+            self._coverage[key] = coverage
+        return self._coverage[key]
+
+    def _save_coverage(self, timeframe):
+        coverage = self._load_coverage(timeframe)
+        os.makedirs(self._partition_dir(timeframe), exist_ok=True)
+        path = self._coverage_path(timeframe)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({symbol: [[s.isoformat(), e.isoformat()] for s, e in ranges]
+                       for symbol, ranges in coverage.items()}, f)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _merge_ranges(ranges):
+        merged = []
+        for start, end in sorted(ranges):
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        return merged
+
+    def missing_ranges(self, symbol, timeframe, start, end):
+        """
+        Returns the parts of [start, end] that are not covered by the cache for this symbol.
+
+        Args:
+            symbol (str): Ticker symbol.
+            timeframe (TimeFrame): Bar timeframe.
+            start, end: Query bounds (str, datetime or pd.Timestamp; naive values are treated as UTC).
+
+        Returns:
+            list: (start, end) pd.Timestamp pairs still to be fetched.
+        """
+        start, end = self._to_utc(start), self._to_utc(end)
+        gaps = []
+        cursor = start
+        for covered_start, covered_end in self._load_coverage(timeframe).get(symbol, []):
+            if covered_end < cursor:
+                continue
+            if covered_start > end:
+                break
+            if covered_start > cursor:
+                gaps.append((cursor, covered_start))
+            cursor = max(cursor, covered_end)
+        if cursor < end:
+            gaps.append((cursor, end))
+        return gaps
+
+    def _fetch(self, symbols, timeframe, start, end):
+        """ Fetches one range for a group of symbols and returns it in `reset_index()` form. """
+        calls_before = self.batch_fetcher.api_calls
+        df = self.batch_fetcher.fetch(symbols, timeframe, start, end)
+        self.stats.api_calls += self.batch_fetcher.api_calls - calls_before
+
+        if not df.empty:
+            self.stats.bytes_fetched += int(df.memory_usage(deep=True).sum())
+        return df
+
+    def _store(self, symbol, timeframe, df):
+        """ Merges newly fetched bars into the symbol's partition. """
+        path = self._partition_path(symbol, timeframe)
+        if os.path.exists(path):
+            df = pd.concat([pd.read_parquet(path), df])
+        df = df.drop_duplicates('timestamp', keep='last').sort_values('timestamp')
+
+        os.makedirs(self._partition_dir(timeframe), exist_ok=True)
+        tmp_path = path + ".tmp"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    def _mark_covered(self, symbol, timeframe, start, end):
+        # Bars from the last day may still change (open session, late prints), so never mark them final
+        settled = pd.Timestamp.now(tz='UTC') - timedelta(days=1)
+        end = min(end, settled)
+        if end <= start:
+            return
+        coverage = self._load_coverage(timeframe)
+        coverage[symbol] = self._merge_ranges(coverage.get(symbol, []) + [(start, end)])
+
+    def _read(self, symbol, timeframe, start, end):
+        path = self._partition_path(symbol, timeframe)
+        if not os.path.exists(path):
+            return None
+        df = pd.read_parquet(path, filters=[('timestamp', '>=', start), ('timestamp', '<=', end)])
+        if df.empty:
+            return None
+        self.stats.bytes_read += int(df.memory_usage(deep=True).sum())
+        return df
+
+    def get_bars(self, symbols, timeframe, start, end):
+        """
+        Returns bars for the given symbols, fetching only the date ranges missing from the cache.
+
+        Args:
+            symbols (str or list): Ticker symbol(s).
+            timeframe (TimeFrame): Bar timeframe.
+            start, end: Query bounds (str, datetime or pd.Timestamp; naive values are treated as UTC).
+
+        Returns:
+            pd.DataFrame: Bars with 'symbol' and 'timestamp' columns, empty if none are available.
+        """
+        symbols = [symbols] if isinstance(symbols, str) else list(symbols)
+        start, end = self._to_utc(start), self._to_utc(end)
+
+        # Group symbols missing the same range so each range is fetched with multi-symbol requests
+        pending = {}
+        for symbol in symbols:
+            gaps = self.missing_ranges(symbol, timeframe, start, end)
+            if gaps:
+                self.stats.misses += 1
+                for gap in gaps:
+                    pending.setdefault(gap, []).append(symbol)
+            else:
+                self.stats.hits += 1
+
+        for (gap_start, gap_end), gap_symbols in pending.items():
+            if self.verbose:
+                print(f"Fetching {len(gap_symbols)} symbols of {timeframe} bars from {gap_start} to {gap_end}")
+            df = self._fetch(gap_symbols, timeframe, gap_start, gap_end)
+            if not df.empty:
+                for symbol, symbol_df in df.groupby('symbol'):
+                    self._store(symbol, timeframe, symbol_df)
+            for symbol in gap_symbols:
+                self._mark_covered(symbol, timeframe, gap_start, gap_end)
+        if pending:
+            self._save_coverage(timeframe)
+
+        frames = []
+        for symbol in symbols:
+            df = self._read(symbol, timeframe, start, end)
+            if df is not None:
+                frames.append(df)
+
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
+    def get_resampled(self, symbols, timeframe, start, end, session_aligned=False):
+        """
+        Returns bars of any timeframe built from the cached minute bars, so switching timeframes
+        needs no new API requests once the minute bars are on disk.
+
+        Args:
+            symbols (str or list): Ticker symbol(s).
+            timeframe (TimeFrame): Target timeframe (minutes, hours or one day).
+            start, end: Query bounds (str, datetime or pd.Timestamp; naive values are treated as UTC).
+            session_aligned (bool): Align bars to regular sessions and drop extended-hours bars.
+
+        Returns:
+            pd.DataFrame: Bars with 'symbol' and 'timestamp' columns, empty if none are available.
+        """
+        minute_bars = self.get_bars(symbols, TimeFrame.Minute, start, end)
+        if minute_bars.empty:
+            return minute_bars
+        if timeframe_length(timeframe) == pd.Timedelta(minutes=1) and not session_aligned:
+            return minute_bars
+        return resample_bars(minute_bars, timeframe, session_aligned)
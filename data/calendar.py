@@ -0,0 +1,165 @@
+from datetime import date, timedelta
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+EASTERN = 'US/Eastern'
+OPEN_TIME = pd.Timedelta(hours=9, minutes=30)
+CLOSE_TIME = pd.Timedelta(hours=16)
+EARLY_CLOSE_TIME = pd.Timedelta(hours=13)
+
+# Unscheduled full-day closures (national days of mourning, weather, 9/11)
+SPECIAL_CLOSURES = [
+    '2001-09-11', '2001-09-12', '2001-09-13', '2001-09-14', '2004-06-11', '2007-01-02',
+    '2012-10-29', '2012-10-30', '2018-12-05', '2025-01-09',
+]
+
+
+def easter(year):
+    """ Gregorian Easter Sunday (anonymous Gregorian algorithm). """
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def nth_weekday(year, month, weekday, n):
+    """ The n-th given weekday (Monday=0) of a month; n=-1 is the last one. """
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year, month + 1, 1) - timedelta(days=1) if month < 12 else date(year, 12, 31)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def observed(day):
+    """ Fixed-date holidays on a Saturday are observed on Friday, on a Sunday on Monday. """
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+
+def nyse_holidays(year):
+    """ Full-day NYSE holidays of a year. """
+    holidays = [
+        nth_weekday(year, 1, 0, 3),  # Martin Luther King Jr. Day
+        nth_weekday(year, 2, 0, 3),  # Washington's Birthday
+        easter(year) - timedelta(days=2),  # Good Friday
+        nth_weekday(year, 5, 0, -1),  # Memorial Day
+        observed(date(year, 7, 4)),  # Independence Day
+        nth_weekday(year, 9, 0, 1),  # Labor Day
+        nth_weekday(year, 11, 3, 4),  # Thanksgiving
+        observed(date(year, 12, 25)),  # Christmas
+    ]
+    # New Year's Day falling on a Saturday is not observed on the previous Friday
+    if date(year, 1, 1).weekday() != 5:
+        holidays.append(observed(date(year, 1, 1)))
+    if year >= 2022:
+        holidays.append(observed(date(year, 6, 19)))  # Juneteenth
+    return holidays
+
+
+def nyse_early_closes(year):
+    """ Candidate 1:00 pm early closes of a year (dropped later if they fall on a weekend or holiday). """
+    return [
+        date(year, 7, 3),  # Day before Independence Day
+        nth_weekday(year, 11, 3, 4) + timedelta(days=1),  # Day after Thanksgiving
+        date(year, 12, 24),  # Christmas Eve
+    ]
+
+
+class MarketCalendar:
+    def __init__(self, start_year=1990, end_year=2040):
+        """
+        Precomputed NYSE regular sessions with open and close times in UTC.
+
+        Sessions are all weekdays minus holidays and special closures; half days close at 1:00 pm.
+        Opens and closes are localized in US/Eastern before conversion, so DST is handled per date.
+        Tagging a timestamp column is a single searchsorted over the sorted session opens.
+
+        Args:
+            start_year (int): First year covered.
+            end_year (int): Last year covered.
+        """
+        years = range(start_year, end_year + 1)
+        holidays = pd.DatetimeIndex([d for year in years for d in nyse_holidays(year)] + SPECIAL_CLOSURES)
+        early_closes = pd.DatetimeIndex([d for year in years for d in nyse_early_closes(year)])
+
+        self.sessions = pd.bdate_range(f"{start_year}-01-01", f"{end_year}-12-31").difference(holidays)
+        self.early_closes = self.sessions.isin(early_closes)
+        close_times = pd.TimedeltaIndex(np.where(self.early_closes, EARLY_CLOSE_TIME.value, CLOSE_TIME.value))
+
+        # Session bounds as UTC nanoseconds
+        self.opens = (self.sessions + OPEN_TIME).tz_localize(EASTERN).as_unit('ns').asi8
+        self.closes = (self.sessions + close_times).tz_localize(EASTERN).as_unit('ns').asi8
+
+    @staticmethod
+    def _to_utc_ns(timestamps):
+        return pd.DatetimeIndex(pd.to_datetime(timestamps, utc=True)).as_unit('ns').asi8
+
+    def session_index(self, timestamps):
+        """
+        Index into `sessions` of the session each timestamp falls in, or -1 outside regular hours.
+
+        Args:
+            timestamps (array-like): Timestamps; naive values are treated as UTC.
+
+        Returns:
+            np.array: int64 session indices.
+        """
+        ts = self._to_utc_ns(timestamps)
+        idx = np.searchsorted(self.opens, ts, side='right') - 1
+        in_session = (idx >= 0) & (ts <= self.closes[np.clip(idx, 0, None)])
+        return np.where(in_session, idx, -1)
+
+    def is_trading(self, timestamps):
+        """
+        Whether each timestamp falls inside a regular session (open and close inclusive).
+
+        Args:
+            timestamps (array-like): Timestamps; naive values are treated as UTC.
+
+        Returns:
+            np.array: bool array.
+        """
+        return self.session_index(timestamps) >= 0
+
+    @staticmethod
+    def _to_local_date(day):
+        day = pd.Timestamp(day)
+        if day.tzinfo is not None:
+            day = day.tz_convert(EASTERN).tz_localize(None)
+        return day.normalize()
+
+    def is_session(self, day):
+        """ Whether the market has a regular session on a given date. """
+        return self._to_local_date(day) in self.sessions
+
+    def sessions_before(self, end, count):
+        """
+        The `count` most recent sessions up to and including `end`.
+
+        Args:
+            end (str or datetime): Last date to consider.
+            count (int): Number of sessions.
+
+        Returns:
+            pd.DatetimeIndex: Session dates in ascending order.
+        """
+        stop = self.sessions.searchsorted(self._to_local_date(end), side='right')
+        return self.sessions[max(stop - count, 0):stop]
+
+
+@lru_cache(maxsize=1)
+def default_calendar():
+    """ Shared calendar instance, built on first use. """
+    return MarketCalendar()
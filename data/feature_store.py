@@ -0,0 +1,320 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+import torch
+from torch.utils.data import Dataset, IterableDataset, get_worker_info
+from data.calendar import EASTERN, default_calendar
+from data.processor.dense import BAR_FEATURES
+from data.processor.labels import compute_labels
+from data.processor.windows import sliding_windows
+
+HEADER_FILE = "header.json"
+VALUES_FILE = "values.f32"
+MASK_FILE = "mask.u1"
+
+
+def _select(days, first, stop):
+    """ Index of the `first` to `stop` traded days of a ticker, given its `FeatureStore.traded_days`. """
+    if isinstance(days, slice):
+        return slice(days.start + first, days.start + stop)
+    return days[first:stop]
+
+
+def _num_days(days):
+    return days.stop - days.start if isinstance(days, slice) else len(days)
+
+
+class FeatureStore:
+    def __init__(self, path, mode='r'):
+        """
+        Disk-backed dense feature tensor of shape (days, tickers, features).
+
+        The store is a directory holding a small JSON header (tickers, features, session dates) next to a raw
+        float32 `values.f32` file and a uint8 `mask.u1` file (1 where the ticker had a bar that day), both in
+        C order. They are opened with `np.memmap`, so only the pages actually read are loaded, and windows over a
+        ticker are strided views into the mapping.
+
+        Args:
+            path (str): Store directory, created with `FeatureStore.create` or `FeatureStore.build`.
+            mode (str): 'r' for read-only, 'r+' to write bars into an existing store.
+        """
+        self.path = path
+        self.mode = mode
+        with open(os.path.join(path, HEADER_FILE)) as f:
+            header = json.load(f)
+
+        self.tickers = header["tickers"]
+        self.features = header["features"]
+        self.timestamps = pd.DatetimeIndex(header["timestamps"])
+        self.ticker_index = {ticker: i for i, ticker in enumerate(self.tickers)}
+        self.feature_index = {feature: k for k, feature in enumerate(self.features)}
+
+        shape = (len(self.timestamps), len(self.tickers), len(self.features))
+        self.values = np.memmap(os.path.join(path, VALUES_FILE), dtype=np.float32, mode=mode, shape=shape)
+        self.mask = np.memmap(os.path.join(path, MASK_FILE), dtype=np.uint8, mode=mode, shape=shape[:2])
+
+    @classmethod
+    def create(cls, path, tickers, timestamps, features=BAR_FEATURES):
+        """
+        Creates an empty (zero-filled) store and opens it for writing.
+
+        Args:
+            path (str): Store directory.
+            tickers (list): Ticker symbols, in the order of the ticker axis.
+            timestamps (pd.DatetimeIndex): Day axis (e.g. session dates); bars are matched by their US/Eastern date.
+            features (tuple): Feature columns, in the order of the feature axis.
+
+        Returns:
+            FeatureStore: Store opened in 'r+' mode.
+        """
+        os.makedirs(path, exist_ok=True)
+        timestamps = pd.DatetimeIndex(timestamps)
+        header = dict(tickers=list(tickers), features=list(features),
+                      timestamps=[ts.isoformat() for ts in timestamps])
+
+        shape = (len(timestamps), len(tickers), len(features))
+        np.memmap(os.path.join(path, VALUES_FILE), dtype=np.float32, mode='w+', shape=shape).flush()
+        np.memmap(os.path.join(path, MASK_FILE), dtype=np.uint8, mode='w+', shape=shape[:2]).flush()
+
+        # Header last, so a half-created store can't be opened
+        with open(os.path.join(path, HEADER_FILE), "w") as f:
+            json.dump(header, f)
+        return cls(path, mode='r+')
+
+    @classmethod
+    def build(cls, path, data_fetcher, tickers, batch_size=500, features=BAR_FEATURES):
+        """
+        Builds a store over the regular sessions of a fetcher's date range, fetching `batch_size` tickers
+        at a time so only one batch of bars is ever held in memory.
+
+        Args:
+            path (str): Store directory.
+            data_fetcher (StockDataFetcher): Fetcher with the date range (and optional bar cache) to use.
+            tickers (list): Ticker symbols.
+            batch_size (int): Tickers fetched and written per batch.
+            features (tuple): Feature columns.
+
+        Returns:
+            FeatureStore: Store opened in 'r+' mode.
+        """
+        sessions = default_calendar().sessions
+        sessions = sessions[(sessions >= pd.Timestamp(data_fetcher.start_date))
+                            & (sessions <= pd.Timestamp(data_fetcher.end_date))]
+        store = cls.create(path, tickers, sessions, features)
+
+        for i in range(0, len(tickers), batch_size):
+            batch = tickers[i:i + batch_size]
+            try:
+                stock_data = data_fetcher.fetch_data(batch)
+            except ValueError as e:
+                print(f"Skipping tickers {batch[0]}..{batch[-1]}: {e}")
+                continue
+            store.write(stock_data)
+            print(f"Wrote {min(i + batch_size, len(tickers))}/{len(tickers)} tickers to {path}")
+
+        store.flush()
+        return store
+
+    def __getstate__(self):
+        # Reopen the memory map in DataLoader worker processes instead of pickling its contents
+        return dict(path=self.path, mode=self.mode)
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['mode'])
+
+    def _day_codes(self, timestamps):
+        """ Position of each bar's US/Eastern date on the day axis, -1 if it is not on it. """
+        days = pd.DatetimeIndex(pd.to_datetime(timestamps, utc=True)).tz_convert(EASTERN).normalize()
+        return self.timestamps.get_indexer(days.tz_localize(None))
+
+    def write(self, stock_data):
+        """
+        Writes bars into the store; symbols and days outside the store are ignored.
+
+        Args:
+            stock_data (pd.DataFrame): Bar data with 'symbol', 'timestamp' and feature columns.
+        """
+        day_codes = self._day_codes(stock_data['timestamp'])
+        ticker_codes = pd.Categorical(stock_data['symbol'], categories=self.tickers).codes
+
+        keep = (day_codes >= 0) & (ticker_codes >= 0)
+        rows = stock_data[self.features].to_numpy(dtype=np.float32)[keep]
+        self.values[day_codes[keep], ticker_codes[keep]] = rows
+        self.mask[day_codes[keep], ticker_codes[keep]] = 1
+
+    def flush(self):
+        self.values.flush()
+        self.mask.flush()
+
+    def traded_days(self, ticker):
+        """
+        The days a ticker had a bar, the ones the processors build its single-ticker windows from: a slice of the
+        day axis if they are consecutive, otherwise (e.g. around halts) an array of day indices.
+        """
+        days = np.flatnonzero(self.mask[:, self.ticker_index[ticker]])
+        if len(days) == 0:
+            return slice(0, 0)
+        if days[-1] - days[0] + 1 == len(days):
+            return slice(int(days[0]), int(days[-1]) + 1)
+        return days
+
+    def ticker_values(self, ticker):
+        """
+        The ticker's features on its traded days, shape (days, features): a view into the store, or a copy of its
+        rows if it has days without a bar (e.g. halts) between its first and last one.
+        """
+        return self.values[self.traded_days(ticker), self.ticker_index[ticker]]
+
+    def windows(self, ticker, window_size, count=None):
+        """ Read-only strided windows of shape (windows, window_size, features) over a ticker's span. """
+        return sliding_windows(self.ticker_values(ticker), window_size, count)
+
+    def nbytes(self):
+        return self.values.nbytes + self.mask.nbytes
+
+
+class FeatureStoreDataset(Dataset):
+    def __init__(self, store, window_size, pred_days, tickers=None, input_size=None, target='high_open',
+                 normalization='minmax'):
+        """
+        Torch dataset of (window, label) pairs read straight from a FeatureStore.
+
+        Samples are the single-ticker windows over every ticker's traded days, labelled like the Transformer processor
+        labels a single ticker: the target (by default the high/open ratio) of the day `pred_days` after the window,
+        one label per horizon when `pred_days` is a list. Only the requested window is copied out of the memory map.
+
+        Args:
+            store (FeatureStore): Store to read from.
+            window_size (int): Number of days in each window.
+            pred_days (int or list): Days ahead to predict, or the horizons of the label columns.
+            tickers (list, optional): Tickers to serve (default: all tickers in the store).
+            input_size (int, optional): Zero-pad the feature axis to this size, as the model expects.
+            target (str): Label target registered in data.processor.labels.
+            normalization (str): Label normalization registered in data.processor.labels.
+        """
+        self.store = store
+        self.window_size = window_size
+        self.pred_days = pred_days
+        self.horizons = np.atleast_1d(pred_days).astype(int)
+        self.tickers = list(tickers) if tickers is not None else list(store.tickers)
+        self.input_size = input_size
+        self.target = target
+        self.normalization = normalization
+
+        # Per ticker: traded days and number of windows; samples are laid out ticker after ticker
+        self.days = []
+        counts = []
+        for ticker in self.tickers:
+            days = store.traded_days(ticker)
+            self.days.append(days)
+            counts.append(max(_num_days(days) - window_size - int(self.horizons.max()), 0))
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+        self.columns = [store.ticker_index[ticker] for ticker in self.tickers]
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def locate(self, idx):
+        """ Maps a sample index to (position in tickers, window index among the ticker's windows). """
+        position = int(np.searchsorted(self.offsets, idx, side='right')) - 1
+        return position, idx - int(self.offsets[position])
+
+    def __getitem__(self, idx):
+        position, first = self.locate(idx)
+        days = _select(self.days[position], first, first + self.window_size + int(self.horizons.max()) + 1)
+        rows = np.array(self.store.values[days, self.columns[position]])
+
+        window = rows[:self.window_size]
+        if self.input_size is not None and window.shape[-1] < self.input_size:
+            window = np.pad(window, ((0, 0), (0, self.input_size - window.shape[-1])), 'constant')
+
+        targets = rows[self.window_size + self.horizons]
+        label = compute_labels(targets[:, None], self.target, self.normalization, self.store.features)[:, 0]
+
+        return torch.from_numpy(window), torch.from_numpy(label)
+
+
+class StreamingWindowDataset(IterableDataset):
+    def __init__(self, store, window_size, pred_days, batch_size, tickers=None, input_size=None, shard_size=4096,
+                 shards_per_buffer=4, shuffle=True, seed=0, target='high_open', normalization='minmax'):
+        """
+        Iterable dataset that streams shuffled (windows, labels) batches from a FeatureStore.
+
+        Each ticker's samples are split into shards of `shard_size` consecutive windows. Every epoch the shard order
+        is shuffled, shards are divided between DataLoader workers, and each worker reads `shards_per_buffer` shards
+        at a time and yields their windows in shuffled batches. Memory per worker is bounded by one buffer no matter
+        how many tickers or days the store holds. Use with `DataLoader(dataset, batch_size=None)`.
+
+        Args:
+            store (FeatureStore): Store to read from.
+            window_size (int): Number of days in each window.
+            pred_days (int or list): Days ahead to predict, or the horizons of the label columns.
+            batch_size (int): Samples per yielded batch.
+            tickers (list, optional): Tickers to serve (default: all tickers in the store).
+            input_size (int, optional): Zero-pad the feature axis to this size, as the model expects.
+            shard_size (int): Windows per shard.
+            shards_per_buffer (int): Shards mixed together before shuffling.
+            shuffle (bool): Shuffle shards and samples.
+            seed (int): Base seed; the epoch is added so every epoch gets a new order.
+            target (str): Label target registered in data.processor.labels.
+            normalization (str): Label normalization registered in data.processor.labels.
+        """
+        self.store = store
+        self.window_size = window_size
+        self.pred_days = pred_days
+        self.horizons = np.atleast_1d(pred_days).astype(int)
+        self.batch_size = batch_size
+        self.input_size = input_size
+        self.shards_per_buffer = shards_per_buffer
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+        self.target = target
+        self.normalization = normalization
+
+        # Shards as (ticker column, traded days, first window, number of windows)
+        self.shards = []
+        for ticker in (tickers if tickers is not None else store.tickers):
+            days = store.traded_days(ticker)
+            count = max(_num_days(days) - window_size - int(self.horizons.max()), 0)
+            for first in range(0, count, shard_size):
+                self.shards.append((store.ticker_index[ticker], days, first, min(shard_size, count - first)))
+        self.num_samples = sum(count for _, _, _, count in self.shards)
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def read_shard(self, shard):
+        """ Reads one shard's rows once and returns its (windows, labels). """
+        column, days, first, count = shard
+        offset = self.window_size + int(self.horizons.max())
+        rows = np.array(self.store.values[_select(days, first, first + count + offset), column])
+
+        X = sliding_windows(rows, self.window_size, count)
+        # Target rows of every horizon at once: (count * horizons, 1 ticker, features)
+        targets = rows[np.arange(count)[:, None] + self.window_size + self.horizons]
+        y = compute_labels(targets.reshape(-1, 1, targets.shape[-1]), self.target, self.normalization,
+                           self.store.features)
+        return X, y.reshape(count, len(self.horizons))
+
+    def __iter__(self):
+        # Every worker draws the same shard order and keeps its own slice of it
+        rng = np.random.default_rng(self.seed + self.epoch)
+        order = rng.permutation(len(self.shards)) if self.shuffle else np.arange(len(self.shards))
+        worker = get_worker_info()
+        if worker is not None:
+            order = order[worker.id::worker.num_workers]
+            rng = np.random.default_rng([self.seed + self.epoch, worker.id])
+
+        for i in range(0, len(order), self.shards_per_buffer):
+            blocks = [self.read_shard(self.shards[j]) for j in order[i:i + self.shards_per_buffer]]
+            X = np.concatenate([X for X, _ in blocks])
+            y = np.concatenate([y for _, y in blocks])
+            if self.input_size is not None and X.shape[-1] < self.input_size:
+                X = np.pad(X, ((0, 0), (0, 0), (0, self.input_size - X.shape[-1])), 'constant')
+
+            index = rng.permutation(len(X)) if self.shuffle else np.arange(len(X))
+            for b in range(0, len(index), self.batch_size):
+                batch = index[b:b + self.batch_size]
+                yield torch.from_numpy(X[batch]), torch.from_numpy(y[batch])
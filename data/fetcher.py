@@ -1,61 +1,60 @@
 # stock_data_fetcher.py
 from datetime import datetime
-from alpaca.data.requests import StockBarsRequest
 from alpaca.data.timeframe import TimeFrame
-import pandas as pd
+from data.batch_fetcher import BatchBarFetcher
+from data.resample import is_intraday
 
 
 class StockDataFetcher:
-    def __init__(self, api_connection, start_date, end_date, verbose=False):
+    def __init__(self, api_connection, start_date, end_date, verbose=False, cache=None, timeframe=TimeFrame.Day):
         """
         Initialize the data fetcher to retrieve historical data from Alpaca's Historical Data API.
+        If a BarCache is given, bars are served from it and only missing date ranges hit the API.
+        Intraday timeframes are then resampled from the cached minute bars, so every intraday
+        timeframe shares one minute-level fetch. Daily bars keep using Alpaca's own daily bars.
         """
         self.api_connection = api_connection
         self.start_date = start_date
         self.end_date = end_date
         self.verbose = verbose
+        self.cache = cache
+        self.timeframe = timeframe
 
     def fetch_data(self, tickers):
         """
         Fetch stock data for one or more tickers using Alpaca's Historical Data API.
-        If a single ticker is provided, fetch data for that ticker alone.
+        Tickers are fetched together in multi-symbol requests rather than one request per ticker.
         """
-        all_data = []
-
         # Handle multiple tickers or single ticker
         tickers = [tickers] if isinstance(tickers, str) else tickers
 
-        for ticker in tickers:
-            # Create a request for a single ticker
-            request_params = StockBarsRequest(
-                symbol_or_symbols=ticker,
-                timeframe=TimeFrame.Day,
-                start=datetime.strptime(self.start_date, '%Y-%m-%d'),
-                end=datetime.strptime(self.end_date, '%Y-%m-%d')
-            )
-
-            bars = self.api_connection.historical_data_client.get_stock_bars(request_params)
-
-            # Ensure data for the ticker is not empty
-            if bars.df.empty:
-                print(f"No data available for ticker {ticker}. Skipping.")
-                continue
-
-            # Reset index to ensure 'symbol' is a column
-            df = bars.df.reset_index()
+        start = datetime.strptime(self.start_date, '%Y-%m-%d')
+        end = datetime.strptime(self.end_date, '%Y-%m-%d')
 
-            # Debugging: Print the first few rows to inspect
+        if self.cache is not None:
+            if is_intraday(self.timeframe):
+                full_df = self.cache.get_resampled(tickers, self.timeframe, start, end)
+            else:
+                full_df = self.cache.get_bars(tickers, self.timeframe, start, end)
             if self.verbose:
-                print(f"Data for ticker {ticker}:")
-                print(df.head())
-                print(df.columns)
+                print(self.cache.stats)
+        else:
+            batch_fetcher = BatchBarFetcher(self.api_connection.historical_data_client, verbose=self.verbose)
+            full_df = batch_fetcher.fetch(tickers, self.timeframe, start, end)
+
+        # Report tickers without data
+        fetched = set(full_df['symbol']) if not full_df.empty else set()
+        for ticker in tickers:
+            if ticker not in fetched:
+                print(f"No data available for ticker {ticker}. Skipping.")
 
-            all_data.append(df)
+        # Debugging: Print the first few rows to inspect
+        if self.verbose and not full_df.empty:
+            print(full_df.head())
+            print(full_df.columns)
 
-        # Combine all fetched data into a single DataFrame
-        if len(all_data) == 0:
+        if len(fetched) == 0:
             raise ValueError("No valid stock data fetched for any of the tickers.")
-        full_df = pd.concat(all_data)
 
         # Return the combined DataFrame
         return full_df
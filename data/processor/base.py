@@ -1,60 +1,209 @@
 from abc import ABC, abstractmethod
+import numpy as np
+import pandas as pd
+from data.processor.dense import pivot_bars
+from data.processor.features import RAW_SCHEMA
+from data.processor.normalization import RunningStats
+from data.processor.state import ProcessorState
+
+# Missing bars of days older than this are taken as real gaps (halts, listings) rather than not yet published
+MISSING_BAR_GRACE = pd.Timedelta(days=5)
 
 class StockDataProcessor(ABC):
-    def __init__(self, window_size, pred_days, verbose=False):
+    def __init__(self, window_size, pred_days, verbose=False, feature_schema=None):
         """
         Base processor with window and prediction size.
 
         Args:
             window_size (int): Number of days to use in the window for prediction.
             pred_days (int): Number of days ahead to predict.
+            feature_schema (FeatureSchema, optional): Per-ticker features computed from the bars (default: the raw
+                bar columns).
         """
         self.window_size = window_size
         self.pred_days = pred_days
         self.verbose = verbose
+        self.feature_schema = feature_schema if feature_schema is not None else RAW_SCHEMA
+        self.timestamps = None
+        self.mask = None
+        self.features = None  # Feature rows of the last preprocessed data, which its windows are views of
+        self.feature_stats = None  # RunningStats of the feature columns of those rows
+
+    def extract_dense(self, stock_data, tickers):
+        """
+        Pivots the stock data into a dense (days x tickers x features) array with a missing-data mask.
+
+        Args:
+            stock_data (pd.DataFrame): DataFrame containing the stock data.
+            tickers (list): List of ticker symbols.
+
+        Returns:
+            values (np.array): float32 array of shape (days, tickers, features), zero where data is missing.
+            mask (np.array): bool array of shape (days, tickers), True where the ticker had a bar that day.
+        """
+        if self.verbose:
+            print(stock_data.head(), stock_data.columns)  # For debugging purposes
+
+        values, mask, timestamps = pivot_bars(stock_data, tickers)
+
+        # Keep the day axis and mask around so callers can tell real zeros from missing bars
+        self.timestamps = timestamps
+        self.mask = mask
+
+        if self.verbose and not mask.all():
+            print(f"Missing bars for {(~mask).sum()} of {mask.size} ticker-days.")
+
+        return values, mask
+
+    def extract_bars(self, stock_data, tickers):
+        """
+        Extracts the raw bar columns for each day and ticker, and handles missing data.
+
+        Args:
+            stock_data (pd.DataFrame): DataFrame containing the stock data.
+            tickers (list): List of ticker symbols.
+
+        Returns:
+            np.array: float32 array of shape (days, 7 * len(tickers)) with one bar vector per day.
+        """
+        values, _ = self.extract_dense(stock_data, tickers)
+        return values.reshape(values.shape[0], -1)
 
     def extract_features(self, stock_data, tickers):
         """
-        Extracts features for each day and ticker, and handles missing data.
+        Extracts the schema's features for each day and ticker.
 
         Args:
             stock_data (pd.DataFrame): DataFrame containing the stock data.
             tickers (list): List of ticker symbols.
 
         Returns:
-            list: List of feature vectors for each day.
+            np.array: float32 array of shape (days, width * len(tickers)) with one feature vector per day, ticker-major
+            so a ticker's feature sits at `feature_schema.column(ticker_idx, name)`.
         """
-        all_features = []
+        bars = self.extract_bars(stock_data, tickers)
+        return self.feature_schema.compute_flat(bars, len(tickers), self.mask)
+
+    def open_state(self, state_dir, tickers, num_features, start_date=None):
+        """ Opens this processor's incremental state for the given tickers and start date. """
+        return ProcessorState.open(state_dir, type(self).__name__, tickers, self.window_size, self.pred_days,
+                                   num_features, start_date=start_date)
+
+    def preprocess_incremental(self, stock_data, tickers, state_dir, start_date=None):
+        """
+        Preprocesses like `preprocess`, but keeps the bar rows and labels of earlier runs in `state_dir` and only
+        computes those of days newer than the last stored one. `stock_data` then only needs to cover the new days;
+        bars of days already in the state are ignored. The state holds raw bars, so schema features are computed over
+        its full history, and running feature statistics that only the new days are folded into.
+
+        Stored days are never revisited, so new days are only stored up to the last final one (see final_days).
+        Later unsettled days, or days still missing tickers, are held back and fetched again on the next run.
+
+        Args:
+            stock_data (pd.DataFrame): DataFrame containing the stock data of (at least) the new days.
+            tickers (list): List of ticker symbols.
+            state_dir (str): Directory of the persisted processor state.
+            start_date (str, optional): Start date of the history; a state built from another one is rebuilt.
+
+        Returns:
+            Preprocessed data in the same form as `preprocess`, over all days in the state.
+        """
+        values, _ = self.extract_dense(stock_data, tickers)
+        state = self.open_state(state_dir, tickers, values.shape[1] * values.shape[2], start_date)
+
+        new_days = np.ones(len(self.timestamps), dtype=bool)
+        if state.last_timestamp is not None:
+            new_days = self.timestamps > state.last_timestamp
+
+        # Days after the last final one may still change, so they stay out of the append-only state for now
+        final = np.flatnonzero(new_days & self.final_days(self.mask))
+        cutoff = final[-1] + 1 if len(final) else 0
+        held_back = int(new_days[cutoff:].sum())
+        new_days[cutoff:] = False
+        if held_back:
+            print(f"Holding back {held_back} recent days with unsettled or missing bars until a later run.")
+
+        self.mask = None
+        if not new_days.any():
+            # A rerun without new final days leaves the state as it is
+            self.timestamps = state.timestamps
+            return self.preprocess_state(state, tickers)
+
+        new_rows = values[new_days].reshape(int(new_days.sum()), values.shape[1] * values.shape[2])
+        self.update_state_stats(state, new_rows, tickers)
+        state.append(new_rows, self.timestamps[new_days])
+
+        labels = self.extend_labels(state.features, state.num_labels, tickers)
+        if labels is not None:
+            state.append([], [], labels)
 
         if self.verbose:
-            print(stock_data.head(), stock_data.columns)  # For debugging purposes
+            print(f"Appended {new_days.sum()} new days to the processor state ({state.num_days} days in total).")
+
+        self.timestamps = state.timestamps
+        return self.preprocess_state(state, tickers)
 
-        # Sort by date for proper sequencing
-        stock_data = stock_data.sort_values('timestamp')
+    def final_days(self, mask, now=None):
+        """
+        Days of the last extracted data whose bars can be stored for good: settled (at least a day old, as BarCache
+        treats bars) and either with a bar for every ticker or older than MISSING_BAR_GRACE.
 
-        # Group by 'timestamp' to collect data by date
-        grouped_data = stock_data.groupby('timestamp')
+        Args:
+            mask (np.array): bool array of shape (days, tickers), True where the ticker had a bar that day.
+            now (pd.Timestamp, optional): Current time (default: now).
 
-        # Process the data day by day
-        for timestamp, group in grouped_data:
-            day_vector = []
+        Returns:
+            np.array: bool array of shape (days,).
+        """
+        now = now if now is not None else pd.Timestamp.now(tz='UTC')
+        settled = np.asarray(self.timestamps <= now - pd.Timedelta(days=1))
+        grace_passed = np.asarray(self.timestamps <= now - MISSING_BAR_GRACE)
+        return settled & (mask.all(axis=1) | grace_passed)
 
-            # Loop through each ticker to extract features
-            for ticker in tickers:
-                company_data = group[group['symbol'] == ticker]
+    def update_state_stats(self, state, new_rows, tickers):
+        """
+        Folds the schema features of new bar rows into the state's running statistics. The whole history is only
+        scanned when there are no statistics yet or they were computed for another feature schema.
+        """
+        schema = self.feature_schema
+        rescan = state.stats is None or state.stats_features != list(schema.features)
+        if rescan or not schema.is_raw:
+            # Indicators of the new days depend on earlier ones, so they are computed over the full history
+            rows = schema.compute_flat(np.concatenate([state.features, new_rows]), len(tickers))
+            if not rescan:
+                rows = rows[len(rows) - len(new_rows):]
+        else:
+            rows = new_rows
+
+        if rescan:
+            state.stats = RunningStats(rows.shape[1])
+            state.stats_features = list(schema.features)
+        state.stats.update(rows)
+
+    def training_stats(self, num_rows):
+        """
+        Feature statistics of the first `num_rows` rows of the last preprocessed data, e.g. the days a model trains on
+        before its validation tail. The running statistics cover every row, so only the later rows are scanned.
+        """
+        return RunningStats.from_dict(self.feature_stats.to_dict()).remove(self.features[num_rows:])
 
-                if not company_data.empty:
-                    # Extract 7 relevant features (e.g., open, high, etc.)
-                    day_vector.extend(company_data.iloc[0, 2:].values.tolist())
-                else:
-                    # Fill missing data with zeros
-                    day_vector.extend([0] * 7)
+    def extend_labels(self, all_features, start, tickers):
+        """
+        Labels of the sequences from index `start` on that the features now allow; None if the processor keeps none.
+        """
+        return None
 
-            # Ensure that the day vector is complete
-            if len(day_vector) == 7 * len(tickers):
-                all_features.append(day_vector)
+    @abstractmethod
+    def preprocess_state(self, state, tickers):
+        """
+        Abstract method to be implemented by subclasses to build the `preprocess` output from an incremental
+        processor state.
 
-        return all_features
+        Args:
+            state (ProcessorState): State holding the bar rows (and labels) of all days so far.
+            tickers (list): List of ticker symbols.
+        """
+        pass
 
     @abstractmethod
     def preprocess(self, stock_data, tickers):
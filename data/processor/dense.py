@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+# Per-ticker bar features, in the order Alpaca returns them after `reset_index()`
+BAR_FEATURES = ('open', 'high', 'low', 'close', 'volume', 'trade_count', 'vwap')
+
+
+def safe_divide(numerator, denominator):
+    """ Element-wise division that returns 0 wherever the denominator is 0, in the inputs' result dtype. """
+    numerator = np.asarray(numerator)
+    denominator = np.asarray(denominator)
+    out = np.zeros(np.broadcast(numerator, denominator).shape, np.result_type(numerator, denominator, np.float32))
+    return np.divide(numerator, denominator, out=out, where=denominator != 0)
+
+
+def pivot_bars(stock_data, tickers, features=BAR_FEATURES, fill_value=0.0):
+    """
+    Pivots a long bar frame into a dense (days x tickers x features) float32 array in one pass.
+
+    Args:
+        stock_data (pd.DataFrame): Bar data with 'symbol', 'timestamp' and feature columns.
+        tickers (list): Ticker symbols, in the order of the ticker axis.
+        features (tuple): Feature columns, in the order of the feature axis.
+        fill_value (float): Value written where a ticker has no bar for a day.
+
+    Returns:
+        values (np.array): float32 array of shape (days, tickers, features).
+        mask (np.array): bool array of shape (days, tickers), True where a bar was present.
+        timestamps (pd.DatetimeIndex): Sorted timestamps of the day axis.
+    """
+    features = list(features)
+
+    # Every timestamp in the frame defines a day, even if none of the requested tickers traded on it
+    day_codes, timestamps = pd.factorize(stock_data['timestamp'], sort=True)
+    ticker_codes = pd.Categorical(stock_data['symbol'], categories=list(tickers)).codes
+
+    # Keep the first bar per (day, ticker) and drop symbols that were not requested
+    keep = ticker_codes >= 0
+    flat_index = np.where(keep, day_codes * len(tickers) + ticker_codes, -1)
+    keep &= ~pd.Series(flat_index).duplicated().to_numpy()
+
+    values = np.full((len(timestamps), len(tickers), len(features)), fill_value, dtype=np.float32)
+    mask = np.zeros((len(timestamps), len(tickers)), dtype=bool)
+
+    rows = stock_data[features].to_numpy(dtype=np.float32)[keep]
+    values[day_codes[keep], ticker_codes[keep]] = rows
+    mask[day_codes[keep], ticker_codes[keep]] = True
+
+    return values, mask, pd.DatetimeIndex(timestamps)
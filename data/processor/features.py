@@ -0,0 +1,250 @@
+import inspect
+import numpy as np
+from data.processor.dense import BAR_FEATURES, safe_divide
+
+# Registered indicators: name -> (function, lookback). Functions take the dense raw bars as a float64
+# (days, tickers, features) array, the names of its feature axis and the indicator parameter, and return
+# (days, tickers). The lookback, in multiples of the parameter, is how much history the value depends on.
+INDICATORS = {}
+
+
+def register_indicator(name, lookback=1):
+    """
+    Registers an indicator usable in a FeatureSchema as `name` or `name_<param>`.
+    Indicators must run in O(days) per ticker: cumulative sums or recursive filters, never a loop over windows.
+    """
+    def decorator(func):
+        INDICATORS[name] = (func, lookback)
+        return func
+    return decorator
+
+
+def _bar(bars, features, name):
+    return bars[..., list(features).index(name)]
+
+
+def rolling_mean(x, window):
+    """
+    Trailing mean over `window` days along the first axis, from one cumulative sum. The first days average
+    over the history available so far.
+    """
+    window = max(int(window), 1)
+    cumsum = np.concatenate([np.zeros((1,) + x.shape[1:]), np.cumsum(x, axis=0)])
+    days = np.arange(len(x))
+    first = np.maximum(days - window + 1, 0)
+    counts = (days + 1 - first).reshape((-1,) + (1,) * (x.ndim - 1))
+    return (cumsum[days + 1] - cumsum[first]) / counts
+
+
+def rolling_std(x, window):
+    """
+    Trailing population standard deviation over `window` days, from a sliding Welford update of the mean and the
+    summed squared deviations, so price-level inputs keep their precision. The first days use the history so far.
+    """
+    window = max(int(window), 1)
+    out = np.empty_like(x)
+    mean = np.zeros(x.shape[1:])
+    m2 = np.zeros(x.shape[1:])
+    for day in range(len(x)):
+        if day < window:
+            count = day + 1
+            delta = x[day] - mean
+            mean = mean + delta / count
+            m2 = m2 + delta * (x[day] - mean)
+        else:
+            # The day leaving the window is swapped for the new one in a single update
+            count = window
+            old = x[day - window]
+            new_mean = mean + (x[day] - old) / window
+            m2 = m2 + (x[day] - old) * (x[day] - new_mean + old - mean)
+            mean = new_mean
+        out[day] = np.sqrt(np.maximum(m2 / count, 0.0))
+    return out
+
+
+def ema(x, span=None, alpha=None):
+    """
+    Exponential moving average along the first axis as a first-order recursive filter, seeded with the first day.
+    Pass either `span` (alpha = 2 / (span + 1)) or `alpha`.
+    """
+    alpha = alpha if alpha is not None else 2.0 / (span + 1)
+    out = np.empty_like(x)
+    if len(x):
+        out[0] = x[0]
+    for day in range(1, len(x)):
+        out[day] = alpha * x[day] + (1 - alpha) * out[day - 1]
+    return out
+
+
+def pct_change(x, periods=1):
+    """ Return over `periods` days; 0 where there is no earlier value or it is 0. """
+    if periods < 1:
+        raise ValueError(f"pct_change needs periods >= 1, got {periods}.")
+    previous = np.zeros_like(x)
+    previous[periods:] = x[:-periods]
+    return np.where(previous != 0, safe_divide(x, previous) - 1, 0.0)
+
+
+@register_indicator('sma')
+def simple_moving_average(bars, features, window=20):
+    """ Close relative to its trailing `window`-day mean, minus 1. """
+    close = _bar(bars, features, 'close')
+    return safe_divide(close, rolling_mean(close, window)) - (close != 0)
+
+
+@register_indicator('ema', lookback=4)
+def exponential_moving_average(bars, features, span=12):
+    """ Close relative to its `span`-day EMA, minus 1. """
+    close = _bar(bars, features, 'close')
+    return safe_divide(close, ema(close, span)) - (close != 0)
+
+
+@register_indicator('return')
+def close_return(bars, features, periods=1):
+    """ Close-to-close return over `periods` days. """
+    return pct_change(_bar(bars, features, 'close'), periods)
+
+
+@register_indicator('volatility')
+def volatility(bars, features, window=20):
+    """ Trailing `window`-day standard deviation of daily close-to-close returns. """
+    return rolling_std(pct_change(_bar(bars, features, 'close')), window)
+
+
+@register_indicator('rsi', lookback=4)
+def relative_strength_index(bars, features, period=14):
+    """ Wilder's RSI over `period` days, scaled to [0, 1]; 0.5 while there have been no moves. """
+    close = _bar(bars, features, 'close')
+    change = np.diff(close, axis=0, prepend=close[:1])
+    gains = ema(np.maximum(change, 0.0), alpha=1.0 / period)
+    losses = ema(np.maximum(-change, 0.0), alpha=1.0 / period)
+    total = gains + losses
+    return np.where(total != 0, safe_divide(gains, total), 0.5)
+
+
+@register_indicator('vwap_dev', lookback=0)
+def vwap_deviation(bars, features, _=None):
+    """ Close relative to the day's VWAP, minus 1. """
+    close = _bar(bars, features, 'close')
+    return safe_divide(close, _bar(bars, features, 'vwap')) - (close != 0)
+
+
+@register_indicator('range', lookback=0)
+def intraday_range(bars, features, _=None):
+    """ (high - low) / open of the day. """
+    return safe_divide(_bar(bars, features, 'high') - _bar(bars, features, 'low'), _bar(bars, features, 'open'))
+
+
+class FeatureSchema:
+    def __init__(self, features=BAR_FEATURES, bar_features=BAR_FEATURES):
+        """
+        Ordered list of the per-ticker model features: raw bar columns by name, and indicators as `name` or
+        `name_<param>`, e.g. ('open', 'high', 'close', 'sma_20', 'ema_12', 'rsi_14', 'volatility_20', 'return_1',
+        'vwap_dev'). Processors address features by name through the schema instead of fixed offsets.
+
+        Args:
+            features (tuple): Feature names, in the order of the feature axis.
+            bar_features (tuple): Raw bar columns the features are computed from.
+        """
+        self.features = tuple(features)
+        self.bar_features = tuple(bar_features)
+        self.index = {feature: k for k, feature in enumerate(self.features)}
+        if len(self.index) != len(self.features):
+            raise ValueError(f"Duplicate features in schema {self.features}.")
+
+        self._steps = [self._parse(feature) for feature in self.features]
+
+    def _parse(self, feature):
+        if feature in self.bar_features:
+            return None
+        name, _, param = feature.rpartition('_')
+        if not (name and param.isdigit()):
+            name, param = feature, None
+        if name not in INDICATORS:
+            raise ValueError(f"Unknown feature '{feature}'. Use a bar column {self.bar_features} or an indicator "
+                             f"from {sorted(INDICATORS)}.")
+        if param is None:
+            # A bare indicator name uses the function's default parameter
+            param = list(inspect.signature(INDICATORS[name][0]).parameters.values())[2].default
+        return name, int(param) if param is not None else None
+
+    def __len__(self):
+        return len(self.features)
+
+    @property
+    def width(self):
+        return len(self.features)
+
+    @property
+    def is_raw(self):
+        """ True if the features are exactly the raw bar columns, so computing them is a no-op. """
+        return self.features == self.bar_features
+
+    @property
+    def lookback(self):
+        """ Days of history the indicators depend on (approximately, for the recursive ones). """
+        days = [0]
+        for step in self._steps:
+            if step is not None:
+                name, param = step
+                days.append(INDICATORS[name][1] * (param or 1))
+        return max(days)
+
+    def column(self, ticker_idx, feature):
+        """ Index of a ticker's feature in flattened (days, tickers * width) rows. """
+        return ticker_idx * self.width + self.index[feature]
+
+    def compute(self, bars, mask=None):
+        """
+        Computes the schema's features from dense raw bars, vectorized over days and tickers. Indicators only see
+        the days a ticker traded, as if it were computed alone; on days without a bar they carry the ticker's last
+        value (0 before its first bar), while its bar columns keep the zero fill.
+
+        Args:
+            bars (np.array): Raw bars of shape (days, tickers, len(bar_features)), in day order.
+            mask (np.array, optional): bool array of shape (days, tickers), True where the ticker had a bar
+                (default: days whose bar columns are all zero, the fill of missing bars, count as missing).
+
+        Returns:
+            np.array: float32 array of shape (days, tickers, width). The input itself if the schema is raw.
+        """
+        if self.is_raw:
+            return bars
+
+        if mask is None:
+            mask = np.any(bars != 0, axis=2)
+        if mask.all():
+            return self._compute_dense(bars)
+
+        # Move each ticker's traded days to the front, in order, so one dense pass sees only traded days
+        order = np.argsort(~mask, axis=0, kind='stable')
+        traded = self._compute_dense(np.take_along_axis(np.asarray(bars), order[:, :, None], axis=0))
+
+        # Every day takes the values of the ticker's last traded day; bar columns of missing days stay zero
+        last = np.cumsum(mask, axis=0) - 1
+        values = np.take_along_axis(traded, np.maximum(last, 0)[:, :, None], axis=0)
+        indicators = np.array([step is not None for step in self._steps])
+        keep = (mask[:, :, None] | indicators) & (last >= 0)[:, :, None]
+        return np.where(keep, values, np.float32(0))
+
+    def _compute_dense(self, bars):
+        """ `compute` with every day counted as traded. """
+        raw = np.asarray(bars, dtype=np.float64)
+        values = np.empty(raw.shape[:2] + (self.width,), dtype=np.float32)
+        for k, (feature, step) in enumerate(zip(self.features, self._steps)):
+            if step is None:
+                values[..., k] = _bar(raw, self.bar_features, feature)
+            else:
+                name, param = step
+                values[..., k] = INDICATORS[name][0](raw, self.bar_features, param)
+        return values
+
+    def compute_flat(self, rows, num_tickers, mask=None):
+        """ `compute` for flattened (days, tickers * bar_features) rows; returns (days, tickers * width). """
+        rows = np.asarray(rows)
+        if self.is_raw:
+            return rows
+        return self.compute(rows.reshape(len(rows), num_tickers, -1), mask).reshape(len(rows), -1)
+
+
+RAW_SCHEMA = FeatureSchema()
@@ -0,0 +1,100 @@
+import numpy as np
+from data.processor.dense import BAR_FEATURES, safe_divide
+
+# Registered label definitions: name -> function over the dense label-day rows
+TARGETS = {}
+NORMALIZATIONS = {}
+
+
+def register_target(name):
+    """
+    Registers a label target. The function gets the bars of the label days as a (days, tickers, features) array
+    and the names of the feature axis, and returns the raw target, shape (days, tickers), using array operations
+    only.
+    """
+    def decorator(func):
+        TARGETS[name] = func
+        return func
+    return decorator
+
+
+def register_normalization(name):
+    """
+    Registers a cross-sectional normalization. The function gets raw targets of shape (days, tickers) and
+    returns them normalized across tickers, day by day.
+    """
+    def decorator(func):
+        NORMALIZATIONS[name] = func
+        return func
+    return decorator
+
+
+def feature(days, features, name):
+    """ One bar feature of the dense rows, shape (days, tickers). """
+    return days[..., list(features).index(name)]
+
+
+@register_target('high_open')
+def high_open_ratio(days, features):
+    """ Intraday upside: high / open. """
+    return safe_divide(feature(days, features, 'high'), feature(days, features, 'open'))
+
+
+@register_target('close_open')
+def close_open_ratio(days, features):
+    """ Intraday return: close / open. """
+    return safe_divide(feature(days, features, 'close'), feature(days, features, 'open'))
+
+
+@register_target('low_open')
+def low_open_ratio(days, features):
+    """ Intraday downside: low / open. """
+    return safe_divide(feature(days, features, 'low'), feature(days, features, 'open'))
+
+
+@register_normalization('none')
+def no_normalization(values):
+    return values
+
+
+@register_normalization('minmax')
+def minmax_normalization(values):
+    """ Scales each day to [0, 1]; days where all values are the same are left as they are. """
+    low = values.min(axis=1, keepdims=True, initial=np.inf)
+    spread = values.max(axis=1, keepdims=True, initial=-np.inf) - low
+    return np.where(spread != 0, (values - low) / np.where(spread != 0, spread, 1), values)
+
+
+@register_normalization('rank')
+def rank_normalization(values):
+    """ Each ticker's rank within its day scaled to [0, 1], ties broken by ticker order; 0 for a single ticker. """
+    ranks = np.argsort(np.argsort(values, axis=1, kind='stable'), axis=1, kind='stable')
+    return (ranks / max(values.shape[1] - 1, 1)).astype(np.float32)
+
+
+@register_normalization('zscore')
+def zscore_normalization(values):
+    """ Subtracts each day's mean and divides by its standard deviation; 0 on days without dispersion. """
+    return safe_divide(values - values.mean(axis=1, keepdims=True), values.std(axis=1, keepdims=True))
+
+
+def compute_labels(days, target='high_open', normalization='minmax', features=BAR_FEATURES):
+    """
+    Computes labels for every day and ticker at once from the dense bars of the label days.
+
+    Args:
+        days (np.array): Bars of the label days, shape (days, tickers, features).
+        target (str): Registered target name (see TARGETS).
+        normalization (str): Registered cross-sectional normalization name (see NORMALIZATIONS).
+        features (tuple): Names of the feature axis.
+
+    Returns:
+        np.array: float32 labels of shape (days, tickers).
+    """
+    if target not in TARGETS:
+        raise ValueError(f"Unknown label target '{target}'. Choose one of {sorted(TARGETS)}.")
+    if normalization not in NORMALIZATIONS:
+        raise ValueError(f"Unknown label normalization '{normalization}'. Choose one of {sorted(NORMALIZATIONS)}.")
+
+    values = TARGETS[target](np.asarray(days, dtype=np.float32), features)
+    return NORMALIZATIONS[normalization](values).astype(np.float32)
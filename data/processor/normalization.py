@@ -0,0 +1,92 @@
+import numpy as np
+
+
+class RunningStats:
+    def __init__(self, num_features):
+        """
+        Streaming per-column mean and variance (Welford's algorithm, merged batch-wise with Chan's update), so new
+        rows can be folded in without rescanning the ones already seen. Columns of flattened day rows are the
+        per-ticker, per-feature statistics.
+
+        Args:
+            num_features (int): Number of columns.
+        """
+        self.count = 0
+        self.mean = np.zeros(num_features, dtype=np.float64)
+        self.m2 = np.zeros(num_features, dtype=np.float64)  # Sum of squared deviations from the mean
+
+    @classmethod
+    def from_rows(cls, rows):
+        """ Statistics of the rows of a (rows, features) array. """
+        rows = np.asarray(rows)
+        stats = cls(rows.shape[-1])
+        stats.update(rows)
+        return stats
+
+    @classmethod
+    def from_windows(cls, X):
+        """ Statistics of the distinct days covered by sliding windows of shape (windows, window_size, features). """
+        if len(X) == 0:
+            return cls(X.shape[-1])
+        return cls.from_rows(np.concatenate([X[:, 0], X[-1, 1:]]))
+
+    @property
+    def num_features(self):
+        return len(self.mean)
+
+    def update(self, rows):
+        """ Folds new rows of shape (rows, features) into the statistics. """
+        rows = np.asarray(rows, dtype=np.float64).reshape(-1, self.num_features)
+        if len(rows) == 0:
+            return self
+
+        batch_mean = rows.mean(axis=0)
+        batch_m2 = ((rows - batch_mean) ** 2).sum(axis=0)
+        self._combine(len(rows), batch_mean, batch_m2)
+        return self
+
+    def remove(self, rows):
+        """ Takes rows folded in earlier back out of the statistics, the inverse of `update`. """
+        rows = np.asarray(rows, dtype=np.float64).reshape(-1, self.num_features)
+        if len(rows) == 0:
+            return self
+        if len(rows) >= self.count:
+            raise ValueError(f"Cannot remove {len(rows)} rows from statistics of {self.count} rows.")
+
+        batch_mean = rows.mean(axis=0)
+        batch_m2 = ((rows - batch_mean) ** 2).sum(axis=0)
+        count = self.count - len(rows)
+        mean = (self.mean * self.count - batch_mean * len(rows)) / count
+        delta = batch_mean - mean
+        self.m2 = np.maximum(self.m2 - batch_m2 - delta ** 2 * count * len(rows) / self.count, 0.0)
+        self.mean = mean
+        self.count = count
+        return self
+
+    def _combine(self, count, mean, m2):
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * count / total
+        self.m2 = self.m2 + m2 + delta ** 2 * self.count * count / total
+        self.count = total
+
+    @property
+    def variance(self):
+        """ Population variance per column (0 before any rows are seen). """
+        return self.m2 / self.count if self.count else np.zeros_like(self.m2)
+
+    def scale(self):
+        """ float32 (mean, std) for standardizing; columns without variance get std 1 so they pass through shifted. """
+        std = np.sqrt(self.variance)
+        return self.mean.astype(np.float32), np.where(std > 1e-12, std, 1.0).astype(np.float32)
+
+    def to_dict(self):
+        return dict(count=self.count, mean=self.mean.tolist(), m2=self.m2.tolist())
+
+    @classmethod
+    def from_dict(cls, state):
+        stats = cls(len(state["mean"]))
+        stats.count = state["count"]
+        stats.mean = np.asarray(state["mean"], dtype=np.float64)
+        stats.m2 = np.asarray(state["m2"], dtype=np.float64)
+        return stats
@@ -1,5 +1,5 @@
-import numpy as np
 from data.processor.base import StockDataProcessor
+from data.processor.windows import sliding_windows
 
 class StockDataRegressionProcessor(StockDataProcessor):
     def preprocess(self, stock_data, tickers):
@@ -21,12 +21,17 @@ class StockDataRegressionProcessor(StockDataProcessor):
 
         return open_high_data
 
+    def preprocess_state(self, state, tickers):
+        """ Builds the open-high sequences over the memory-mapped bar rows of an incremental state. """
+        return self.extract_open_high_sequences(self.feature_schema.compute_flat(state.features, len(tickers)),
+                                                tickers)
+
     def extract_open_high_sequences(self, all_features, tickers):
         """
         Extract open-to-high sequences for multiple time windows.
 
         Args:
-            all_features (list): List of feature vectors for each day.
+            all_features (np.array): Feature vectors for each day, shape (days, width * tickers).
             tickers (list): List of ticker symbols.
 
         Returns:
@@ -37,39 +42,32 @@ class StockDataRegressionProcessor(StockDataProcessor):
 
         for ticker_idx, ticker in enumerate(tickers):
             open_high_data[ticker] = {}
+            open_column = self.feature_schema.column(ticker_idx, 'open')
+            high_column = self.feature_schema.column(ticker_idx, 'high')
             for window in windows:
-                X, y = self.get_open_high_for_window(all_features, window, ticker_idx)
+                X, y = self.get_open_high_for_window(all_features, window, open_column, high_column)
                 open_high_data[ticker][window] = {"X": X, "y": y}
 
         return open_high_data
 
     @staticmethod
-    def get_open_high_for_window(all_features, window, ticker_idx):
+    def get_open_high_for_window(all_features, window, open_column, high_column):
         """
         Extract open and high prices for a given time window and ticker.
 
         Args:
-            all_features (list): List of feature vectors for each day.
+            all_features (np.array): Feature vectors for each day, shape (days, width * tickers).
             window (int): Number of days to include in the window.
-            ticker_idx (int): Index of the ticker in the feature vector.
+            open_column (int): Column of the ticker's open price in the feature vector.
+            high_column (int): Column of the ticker's high price in the feature vector.
 
         Returns:
-            tuple: X (open prices), y (high prices) for the specified window.
+            tuple: X (open prices), y (high prices) for the specified window, as strided views.
         """
-        X = []
-        y = []
-
-        for i in range(len(all_features) - window):
-            open_prices = []
-            high_prices = []
-
-            for j in range(window):
-                open_price = all_features[i + j][ticker_idx * 7]    # Open price
-                high_price = all_features[i + j][ticker_idx * 7 + 1]  # High price
-                open_prices.append(open_price)
-                high_prices.append(high_price)
+        num_windows = len(all_features) - window
 
-            X.append(open_prices)
-            y.append(high_prices)
+        # Strided views over the open and high columns of this ticker
+        X = sliding_windows(all_features[:, open_column], window, num_windows)  # Open prices
+        y = sliding_windows(all_features[:, high_column], window, num_windows)  # High prices
 
-        return np.array(X), np.array(y)
+        return X, y
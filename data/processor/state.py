@@ -0,0 +1,149 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from data.processor.normalization import RunningStats
+
+STATE_FILE = "state.json"
+FEATURES_FILE = "features.f32"
+TIMESTAMPS_FILE = "timestamps.i8"
+LABELS_FILE = "labels.f32"
+
+
+class ProcessorState:
+    def __init__(self, path, processor, tickers, window_size, pred_days, num_features, labels=None, start_date=None):
+        """
+        Append-only on-disk state of an incremental processor: the day feature rows seen so far, their timestamps,
+        the labels computed from them and running statistics of the model features.
+
+        Rows and labels live in raw binary files that new days are appended to, and `state.json` records how many
+        of them are valid. The JSON is rewritten last, so bytes appended by an interrupted update are ignored and
+        overwritten on the next one.
+
+        Args:
+            path (str): State directory.
+            processor (str): Name of the processor class the state belongs to.
+            tickers (list): Ticker symbols, in feature order.
+            window_size (int): Processor window size.
+            pred_days (int or list): Processor prediction horizon(s).
+            num_features (int): Width of a day's feature row.
+            labels (dict, optional): JSON-serializable label settings, e.g. the target and normalization.
+            start_date (str, optional): First date the state's history was fetched from.
+        """
+        self.path = path
+        self.processor = processor
+        self.tickers = list(tickers)
+        self.window_size = window_size
+        self.pred_days = pred_days
+        self.num_features = num_features
+        self.labels_config = labels
+        self.start_date = start_date
+        self.num_days = 0
+        self.label_shape = None  # Shape of one label, known once the first labels are appended
+        self.num_labels = 0
+        self.stats = None  # RunningStats of the model features over all rows, updated by the processor
+        self.stats_features = None  # Feature names the statistics were computed for
+
+    @classmethod
+    def open(cls, path, processor, tickers, window_size, pred_days, num_features, labels=None, start_date=None):
+        """
+        Loads the state in `path`, or starts an empty one if there is none or it was built with other settings,
+        including another start date.
+        """
+        state = cls(path, processor, tickers, window_size, pred_days, num_features, labels, start_date)
+        state_path = os.path.join(path, STATE_FILE)
+        if not os.path.exists(state_path):
+            return state
+
+        with open(state_path) as f:
+            saved = json.load(f)
+        settings = dict(processor=processor, tickers=list(tickers), window_size=window_size, pred_days=pred_days,
+                        num_features=num_features, labels=labels, start_date=start_date)
+        if any(saved.get(key) != value for key, value in settings.items()):
+            print(f"Processor state in {path} was built with different settings. Rebuilding it.")
+            return state
+
+        state.num_days = saved["num_days"]
+        state.num_labels = saved["num_labels"]
+        state.label_shape = tuple(saved["label_shape"]) if saved["label_shape"] is not None else None
+        if saved.get("stats") is not None:
+            state.stats = RunningStats.from_dict(saved["stats"])
+            state.stats_features = saved["stats_features"]
+        return state
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _append(self, name, array, valid_bytes):
+        with open(self._file(name), "ab") as f:
+            f.truncate(valid_bytes)  # Drop anything left by an interrupted update
+            f.write(np.ascontiguousarray(array).tobytes())
+
+    def _save(self):
+        state = dict(processor=self.processor, tickers=self.tickers, window_size=self.window_size,
+                     pred_days=self.pred_days, num_features=self.num_features, labels=self.labels_config,
+                     start_date=self.start_date, num_days=self.num_days,
+                     num_labels=self.num_labels, label_shape=self.label_shape,
+                     stats=self.stats.to_dict() if self.stats is not None else None, stats_features=self.stats_features)
+        tmp_path = self._file(STATE_FILE) + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self._file(STATE_FILE))
+
+    @property
+    def features(self):
+        """ All day feature rows, shape (days, num_features), memory-mapped read-only. """
+        if self.num_days == 0:
+            return np.empty((0, self.num_features), dtype=np.float32)
+        return np.memmap(self._file(FEATURES_FILE), dtype=np.float32, mode='r', shape=(self.num_days, self.num_features))
+
+    @property
+    def timestamps(self):
+        if self.num_days == 0:
+            return pd.DatetimeIndex([], tz='UTC')
+        values = np.fromfile(self._file(TIMESTAMPS_FILE), dtype=np.int64, count=self.num_days)
+        return pd.to_datetime(values, utc=True)
+
+    @property
+    def labels(self):
+        """ All labels, shape (num_labels, ...), memory-mapped read-only. """
+        if self.num_labels == 0:
+            return np.empty((0,) + (self.label_shape or ()), dtype=np.float32)
+        return np.memmap(self._file(LABELS_FILE), dtype=np.float32, mode='r',
+                         shape=(self.num_labels,) + self.label_shape)
+
+    @property
+    def last_timestamp(self):
+        if self.num_days == 0:
+            return None
+        with open(self._file(TIMESTAMPS_FILE), "rb") as f:
+            f.seek((self.num_days - 1) * 8)
+            return pd.Timestamp(int(np.frombuffer(f.read(8), dtype=np.int64)[0]), tz='UTC')
+
+    def append(self, features, timestamps, labels=None):
+        """
+        Appends new day rows (and optionally labels) and commits them, together with the current statistics.
+
+        Args:
+            features (np.array): New rows, shape (new_days, num_features).
+            timestamps (pd.DatetimeIndex): Timestamps of the new rows.
+            labels (np.array, optional): New labels, shape (new_labels, ...).
+        """
+        os.makedirs(self.path, exist_ok=True)
+        features = np.asarray(features, dtype=np.float32)
+        if len(features):
+            row_bytes = self.num_features * 4
+            self._append(FEATURES_FILE, features, self.num_days * row_bytes)
+            timestamps = pd.DatetimeIndex(timestamps)
+            timestamps = timestamps.tz_localize('UTC') if timestamps.tz is None else timestamps.tz_convert('UTC')
+            ns = timestamps.as_unit('ns').asi8
+            self._append(TIMESTAMPS_FILE, ns, self.num_days * 8)
+            self.num_days += len(features)
+
+        if labels is not None and len(labels):
+            labels = np.asarray(labels, dtype=np.float32)
+            self.label_shape = tuple(labels.shape[1:])
+            self._append(LABELS_FILE, labels, self.num_labels * int(np.prod(self.label_shape, dtype=int)) * 4)
+            self.num_labels += len(labels)
+
+        self._save()
@@ -1,8 +1,43 @@
 from data.processor.base import StockDataProcessor
-from utils.model_size import find_best_head_size, pad_input
+from data.processor.labels import compute_labels
+from data.processor.normalization import RunningStats
+from data.processor.state import ProcessorState
+from data.processor.windows import sliding_windows
+from utils.model_size import format_plan, plan_transformer_shape
 import numpy as np
 
 class StockDataTransformerProcessor(StockDataProcessor):
+    def __init__(self, window_size, pred_days, verbose=False, horizons=None, target='high_open',
+                 normalization='minmax', feature_schema=None, shape_budget=None):
+        """
+        Transformer processor that can label several prediction horizons at once.
+
+        Args:
+            window_size (int): Number of days to use in the window for prediction.
+            pred_days (int): Number of days ahead to predict.
+            verbose (bool): Print debugging output if True.
+            horizons (list, optional): Days ahead of each label column (default: [pred_days]). Labels then have
+                one column per horizon and ticker, horizon-major.
+            target (str): Label target registered in data.processor.labels (default: high/open ratio).
+            normalization (str): Cross-sectional label normalization registered in data.processor.labels.
+            feature_schema (FeatureSchema, optional): Per-ticker input features (default: the raw bar columns).
+                Labels are always computed from the raw bars.
+            shape_budget (dict, optional): Cost limits for the model shape planner (max_flops, max_params,
+                max_memory_mb, ... of utils.model_size.plan_transformer_shape).
+        """
+        super().__init__(window_size, pred_days, verbose, feature_schema)
+        self.horizons = [int(h) for h in horizons] if horizons else [pred_days]
+        self.target = target
+        self.normalization = normalization
+        self.shape_budget = dict(shape_budget or {})
+        self.shape_plan = None  # Shape plan of the last preprocessed data
+
+    def open_state(self, state_dir, tickers, num_features, start_date=None):
+        """ Opens this processor's incremental state; states built with other labels are rebuilt. """
+        return ProcessorState.open(state_dir, type(self).__name__, tickers, self.window_size, self.horizons,
+                                   num_features, labels=dict(target=self.target, normalization=self.normalization),
+                                   start_date=start_date)
+
     def preprocess(self, stock_data, tickers):
         """
         Preprocesses data specifically for the Transformer model.
@@ -14,100 +49,206 @@ class StockDataTransformerProcessor(StockDataProcessor):
         Returns:
             Processed data ready for Transformer training.
         """
-        # Extract features for each day and ticker
-        all_features = self.extract_features(stock_data, tickers)
+        # Extract bars and features for each day and ticker
+        bars = self.extract_bars(stock_data, tickers)
+        all_features = self.feature_schema.compute_flat(bars, len(tickers), self.mask)
+        self.features = all_features
+        self.feature_stats = RunningStats.from_rows(all_features)
 
         # Create input-output sequences based on window size
-        X, y = self.create_sequences(all_features, tickers)
+        X, y = self.create_sequences(all_features, tickers, bars)
 
         # Check for valid sequences
         self.check_valid_sequences(X)
 
         # Adjust the data for Transformer model requirements
-        X_padded, input_size, num_heads, hidden_dim = self.adjust_for_transformer(X)
+        X_padded, input_size, num_heads, hidden_dim = self.adjust_for_transformer(X, y.shape[1])
 
         return X_padded, y, tickers, input_size, num_heads, hidden_dim
 
-    def create_sequences(self, all_features, tickers):
+    def extend_labels(self, all_features, start, tickers):
+        """ Labels of the sequences from index `start` on, computed from the stored bar rows only. """
+        num_sequences = len(all_features) - self.window_size - max(self.horizons)
+        if num_sequences <= start:
+            return None
+        return self.calculate_labels(all_features, tickers, start, num_sequences)
+
+    def preprocess_state(self, state, tickers):
         """
-        Creates input-output sequences from the feature data.
+        Builds the `preprocess` output from an incremental state: windows are views over the memory-mapped
+        bar rows (or over the schema features computed from them); labels and feature statistics are the stored ones.
+        """
+        all_features = self.feature_schema.compute_flat(state.features, len(tickers))
+        self.features = all_features
+        self.feature_stats = state.stats
+        if state.stats_features != list(self.feature_schema.features):
+            self.feature_stats = RunningStats.from_rows(all_features)  # Stored for another schema
+        X = sliding_windows(all_features, self.window_size, state.num_labels)
+        y = np.asarray(state.labels)
+
+        self.check_valid_sequences(X)
+        X_padded, input_size, num_heads, hidden_dim = self.adjust_for_transformer(X, y.shape[1])
+
+        return X_padded, y, tickers, input_size, num_heads, hidden_dim
+
+    def preprocess_batch(self, stock_data, tickers):
+        """
+        Preprocesses every ticker as its own single-ticker problem from one shared dense array.
+        Each ticker gets the same windows and labels a single-ticker `preprocess` would build.
 
         Args:
-            all_features (list): List of feature vectors for each day.
+            stock_data (pd.DataFrame): DataFrame containing the stock data for all tickers.
             tickers (list): List of ticker symbols.
 
         Returns:
-            X (list): Input sequences for the model.
-            y (list): Target output labels for the model.
+            dict: Maps each ticker with valid sequences to (X_padded, y, input_size, num_heads, hidden_dim).
         """
-        X = []
-        y = []
+        values, mask = self.extract_dense(stock_data, tickers)
 
-        # Create input-output sequences based on window size
-        for i in range(len(all_features) - self.window_size - self.pred_days):
-            X.append(all_features[i:i + self.window_size])  # Collect a window of days
+        processed = {}
+        for ticker_idx, ticker in enumerate(tickers):
+            # Only the days this ticker traded, as a single-ticker fetch would return
+            bars = values[mask[:, ticker_idx], ticker_idx]
+            features = self.feature_schema.compute(bars[:, None])[:, 0]
+
+            X, y = self.create_sequences(features, [ticker], bars)
+            if X.shape[0] == 0:
+                print(f"No valid sequences for ticker {ticker}. Skipping.")
+                continue
+
+            X_padded, input_size, num_heads, hidden_dim = self.adjust_for_transformer(X, y.shape[1])
+            processed[ticker] = (X_padded, y, input_size, num_heads, hidden_dim)
+
+        return processed
+
+    def preprocess_store(self, store, tickers):
+        """
+        Preprocesses every ticker as its own single-ticker problem straight from a FeatureStore, over the same traded
+        days as `preprocess_batch`. Windows of raw-schema features are strided views into the store's memory map
+        unless the ticker has days without a bar between its first and last one.
+
+        Args:
+            store (FeatureStore): Disk-backed dense feature store.
+            tickers (list): List of ticker symbols.
+
+        Returns:
+            dict: Maps each ticker with valid sequences to (X_padded, y, input_size, num_heads, hidden_dim).
+        """
+        if tuple(store.features) != self.feature_schema.bar_features:
+            raise ValueError(f"Feature store columns {store.features} do not match the schema's bar columns "
+                             f"{self.feature_schema.bar_features}.")
+
+        processed = {}
+        for ticker in tickers:
+            if ticker not in store.ticker_index:
+                print(f"Ticker {ticker} is not in the feature store. Skipping.")
+                continue
+
+            bars = store.ticker_values(ticker)
+            X, y = self.create_sequences(self.feature_schema.compute(bars[:, None])[:, 0], [ticker], bars)
+            if X.shape[0] == 0:
+                print(f"No valid sequences for ticker {ticker}. Skipping.")
+                continue
+
+            X_padded, input_size, num_heads, hidden_dim = self.adjust_for_transformer(X, y.shape[1])
+            processed[ticker] = (X_padded, y, input_size, num_heads, hidden_dim)
+
+        return processed
+
+    def preprocess_latest(self, stock_data, tickers):
+        """
+        Builds only the most recent window of each ticker, for scoring the next day. Schema features are computed
+        over all the given days, so pass `feature_schema.lookback` extra days for indicators to warm up.
+
+        Args:
+            stock_data (pd.DataFrame): DataFrame containing at least `window_size` days of stock data.
+            tickers (list): List of ticker symbols.
+
+        Returns:
+            dict: Maps each ticker with enough history to (window, last_timestamp), window of shape
+            (window_size, width).
+        """
+        values, mask = self.extract_dense(stock_data, tickers)
 
-            # Calculate prediction labels based on high/open price ratio
-            day_pred = self.calculate_day_prediction(all_features, i, tickers)
-            y.append(day_pred)
+        latest = {}
+        for ticker_idx, ticker in enumerate(tickers):
+            days = np.flatnonzero(mask[:, ticker_idx])
+            if len(days) < self.window_size:
+                print(f"Not enough history for ticker {ticker}. Skipping.")
+                continue
+            features = self.feature_schema.compute(values[days, ticker_idx][:, None])[:, 0]
+            latest[ticker] = (features[-self.window_size:], self.timestamps[days[-1]])
 
-        # Convert lists to numpy arrays
-        X = np.array(X)
-        y = np.array(y)
+        return latest
+
+    def create_sequences(self, all_features, tickers, bars=None):
+        """
+        Creates input-output sequences from the feature data.
+
+        Args:
+            all_features (np.array): Feature vectors for each day, shape (days, width * tickers).
+            tickers (list): List of ticker symbols.
+            bars (np.array, optional): Raw bar rows the labels are computed from, shape (days, 7 * tickers)
+                (default: all_features, which must then be the raw bars).
+
+        Returns:
+            X (np.array): Read-only view of shape (samples, window_size, features) over all_features.
+            y (np.array): Target labels of shape (samples, horizons * tickers).
+        """
+        num_sequences = max(len(all_features) - self.window_size - max(self.horizons), 0)
+
+        # Windows are strided views over all_features, so no per-window copies are made
+        X = sliding_windows(all_features, self.window_size, num_sequences)
+
+        # Calculate prediction labels based on high/open price ratio
+        y = self.calculate_labels(all_features if bars is None else bars, tickers, 0, num_sequences)
 
         return X, y
 
-    def calculate_day_prediction(self, all_features, index, tickers):
+    def calculate_labels(self, bars, tickers, start, stop):
         """
-        Calculates the prediction label based on the ratio of high/open prices.
+        Calculates the labels of sequences `start` to `stop` for every horizon in one pass: the processor's target
+        (by default the high/open ratio) of each ticker on the day `horizon` days after the window, normalized
+        across tickers per day (by default min-max).
 
         Args:
-            all_features (list): List of feature vectors for each day.
-            index (int): Current index in the feature vector list.
+            bars (np.array): Raw bar rows for each day, shape (days, 7 * tickers).
             tickers (list): List of ticker symbols.
+            start (int): First sequence index.
+            stop (int): Sequence index to stop before.
 
         Returns:
-            list: Normalized ratio of high/open price for each ticker.
+            np.array: float32 labels of shape (stop - start, horizons * tickers), horizon-major.
         """
-        day_pred = []
-        for j in range(len(tickers)):
-            high = all_features[index + self.window_size + self.pred_days][j * 7 + 1]  # High price
-            open_ = all_features[index + self.window_size + self.pred_days][j * 7]  # Open price
-            ratio = high / open_ if open_ != 0 else 0  # Avoid division by zero
-            day_pred.append(ratio)
+        bar_features = self.feature_schema.bar_features
+        labels = []
+        for horizon in self.horizons:
+            offset = self.window_size + horizon
+            days = np.asarray(bars[start + offset:stop + offset]).reshape(-1, len(tickers), len(bar_features))
+            labels.append(compute_labels(days, self.target, self.normalization, bar_features))
 
-        # Normalize ratios between 0 and 1
-        min_ratio = min(day_pred)
-        max_ratio = max(day_pred)
-        if max_ratio - min_ratio != 0:
-            normalized_pred = [(r - min_ratio) / (max_ratio - min_ratio) for r in day_pred]
-        else:
-            normalized_pred = day_pred  # Handle case where all values are the same
+        return np.concatenate(labels, axis=1)
 
-        return normalized_pred
+    def plan_shape(self, input_size, num_outputs=1):
+        """ Plans the transformer shape for inputs of `input_size` features under the processor's shape budget. """
+        return plan_transformer_shape(input_size, self.window_size, num_outputs, **self.shape_budget)
 
-    @staticmethod
-    def adjust_for_transformer(X):
+    def adjust_for_transformer(self, X, num_outputs=1):
         """
-        Adjusts the input data for use in a Transformer model, calculating the number of attention heads
-        and padding the input data if necessary.
+        Picks the Transformer architecture for the input data with the compute-aware shape planner. The embedding
+        maps any number of features to the planned width, so the data is returned unpadded.
 
         Args:
             X (np.array): Input data sequences.
+            num_outputs (int): Number of label columns the model predicts.
 
         Returns:
-            X_padded (np.array): Padded input data.
+            X (np.array): Input data, unchanged.
             input_size (int): Size of the input data.
-            num_heads (int): Best number of heads for multi-head attention.
-            hidden_dim (int): Hidden dimension size for the Transformer.
-        """
-        input_size = X.shape[-1]
-        num_heads = find_best_head_size(input_size)
-        hidden_dim = input_size * 2
-        if hidden_dim % num_heads != 0:
-            padding_size = num_heads - (hidden_dim % num_heads)
-            X_padded, new_input_size = pad_input(X, input_size + padding_size)
-            hidden_dim = new_input_size * 2
-        else:
-            X_padded, new_input_size = X, input_size
-        return X_padded, new_input_size, num_heads, hidden_dim
+            num_heads (int): Planned number of heads for multi-head attention.
+            hidden_dim (int): Planned hidden dimension size for the Transformer.
+        """
+        self.shape_plan = self.plan_shape(X.shape[-1], num_outputs)
+        if self.verbose:
+            print(f"Transformer shape: {format_plan(self.shape_plan)}")
+        return X, self.shape_plan['input_size'], self.shape_plan['num_heads'], self.shape_plan['hidden_dim']
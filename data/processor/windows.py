@@ -0,0 +1,77 @@
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+
+def sliding_windows(array, window_size, count=None):
+    """
+    Returns read-only sliding windows over the first axis of `array` without copying it.
+
+    Args:
+        array (np.array): Array of shape (days, ...).
+        window_size (int): Number of consecutive days in each window.
+        count (int, optional): Number of leading windows to keep (default: all full windows).
+
+    Returns:
+        np.array: Strided view of shape (windows, window_size, ...) sharing memory with `array`.
+    """
+    array = np.asarray(array)
+    if array.shape[0] < window_size:
+        return np.empty((0, window_size) + array.shape[1:], dtype=array.dtype)
+
+    # sliding_window_view appends the window axis last; move it next to the window index
+    windows = np.lib.stride_tricks.sliding_window_view(array, window_size, axis=0)
+    windows = np.moveaxis(windows, -1, 1)
+
+    if count is not None:
+        windows = windows[:max(count, 0)]
+    return windows
+
+
+def window_rows(windows):
+    """
+    Recovers the day rows behind one-day-step sliding windows, the inverse of `sliding_windows`.
+
+    Args:
+        windows (np.array): Windows of shape (windows, window_size, ...), each starting one day after the previous.
+
+    Returns:
+        np.array: Array of shape (windows + window_size - 1, ...); a view of the rows if `windows` is a
+        `sliding_windows` view, otherwise a copy of one row per day.
+    """
+    windows = np.asarray(windows)
+    if len(windows) == 0:
+        return windows[:0, 0]
+    if windows.base is not None and windows.strides[0] == windows.strides[1]:
+        # A strided view: rebuild the view of the underlying rows without copying them
+        num_rows = len(windows) + windows.shape[1] - 1
+        return np.lib.stride_tricks.as_strided(windows[:, 0], (num_rows,) + windows.shape[2:],
+                                               (windows.strides[0],) + windows.strides[2:], writeable=False)
+    return np.concatenate([windows[:, 0], windows[-1, 1:]])
+
+
+class WindowDataset(Dataset):
+    def __init__(self, features, window_size, labels=None, count=None):
+        """
+        Torch dataset that serves windows from one contiguous feature array, copying only the requested item.
+
+        Args:
+            features (np.array): Feature array of shape (days, features).
+            window_size (int): Number of days in each window.
+            labels (np.array, optional): Labels aligned with the windows, shape (windows, ...).
+            count (int, optional): Number of windows to expose (default: all full windows, or len(labels)).
+        """
+        self.features = np.ascontiguousarray(features, dtype=np.float32)
+        self.labels = None if labels is None else np.asarray(labels, dtype=np.float32)
+        if count is None and self.labels is not None:
+            count = len(self.labels)
+        self.windows = sliding_windows(self.features, window_size, count)
+
+    def __len__(self):
+        return len(self.windows)
+
+    def __getitem__(self, idx):
+        window = torch.from_numpy(np.array(self.windows[idx]))
+        if self.labels is None:
+            return window
+        return window, torch.from_numpy(np.array(self.labels[idx]))
@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+from alpaca.data.timeframe import TimeFrameUnit
+from data.calendar import EASTERN, default_calendar
+from data.ticks import reduce_runs
+
+UNIT_LENGTHS = {
+    TimeFrameUnit.Minute: pd.Timedelta(minutes=1),
+    TimeFrameUnit.Hour: pd.Timedelta(hours=1),
+}
+
+
+def is_intraday(timeframe):
+    """ Whether a TimeFrame is shorter than a day (minutes or hours). """
+    return timeframe.unit_value in UNIT_LENGTHS
+
+
+def timeframe_length(timeframe):
+    """
+    Bar length of an intraday TimeFrame, or None for daily bars.
+
+    Raises:
+        ValueError: For weekly/monthly or multi-day timeframes, which minute bars are not resampled to.
+    """
+    if is_intraday(timeframe):
+        return UNIT_LENGTHS[timeframe.unit_value] * timeframe.amount_value
+    if timeframe.unit_value == TimeFrameUnit.Day and timeframe.amount_value == 1:
+        return None
+    raise ValueError(f"Cannot resample bars to {timeframe}.")
+
+
+def bucket_starts(timestamps, timeframe, session_aligned=False, calendar=None):
+    """
+    Start of the bar each timestamp falls into, as UTC nanoseconds.
+
+    Without alignment intraday bars are aligned to the clock (e.g. 10:00, 10:05) and daily bars to midnight
+    US/Eastern, which is how Alpaca stamps its daily bars. With session alignment only timestamps inside a regular
+    session are kept (the others get -1): intraday bars are counted from each session's open (9:30, 10:30, ...
+    for hourly bars) and daily bars cover the regular session only.
+
+    Args:
+        timestamps (array-like): Bar timestamps; naive values are treated as UTC.
+        timeframe (TimeFrame): Target timeframe.
+        session_aligned (bool): Align bars to regular sessions.
+        calendar (MarketCalendar, optional): Session calendar (default: the shared NYSE calendar).
+
+    Returns:
+        np.array: int64 bucket starts, -1 for dropped timestamps.
+    """
+    length = timeframe_length(timeframe)
+    timestamps = pd.DatetimeIndex(pd.to_datetime(timestamps, utc=True)).as_unit('ns')
+    ts = timestamps.asi8
+
+    if not session_aligned:
+        if length is None:
+            return timestamps.tz_convert(EASTERN).normalize().as_unit('ns').asi8
+        return ts - ts % length.value
+
+    calendar = calendar or default_calendar()
+    idx = calendar.session_index(timestamps)
+    inside = idx >= 0
+    safe_idx = np.where(inside, idx, 0)
+    if length is None:
+        midnights = calendar.sessions.tz_localize(EASTERN).as_unit('ns').asi8
+        buckets = midnights[safe_idx]
+    else:
+        opens = calendar.opens[safe_idx]
+        buckets = opens + (ts - opens) // length.value * length.value
+    return np.where(inside, buckets, -1)
+
+
+def resample_bars(bars, timeframe, session_aligned=False, calendar=None):
+    """
+    Builds coarser bars (e.g. 5m/15m/1h/daily) from finer ones with vectorized group reductions.
+
+    Rows are sorted once by symbol and time; every run of rows sharing a symbol and bucket is then reduced with
+    reduceat (open first, high max, low min, close last, volume and trade count summed, vwap volume-weighted).
+
+    Args:
+        bars (pd.DataFrame): Bars with 'timestamp', 'open', 'high', 'low', 'close', 'volume' and optionally
+            'symbol', 'trade_count' and 'vwap' columns.
+        timeframe (TimeFrame): Target timeframe.
+        session_aligned (bool): Align bars to regular sessions and drop extended-hours bars.
+        calendar (MarketCalendar, optional): Session calendar (default: the shared NYSE calendar).
+
+    Returns:
+        pd.DataFrame: Resampled bars with the same columns, timestamped with each bar's start in UTC.
+    """
+    if bars.empty:
+        return bars.copy()
+
+    has_symbol = 'symbol' in bars.columns
+    sort_keys = ['symbol', 'timestamp'] if has_symbol else ['timestamp']
+    bars = bars.sort_values(sort_keys, kind='stable')
+
+    buckets = bucket_starts(bars['timestamp'], timeframe, session_aligned, calendar)
+    keep = buckets >= 0
+    bars, buckets = bars[keep], buckets[keep]
+    if bars.empty:
+        return bars.reset_index(drop=True)
+
+    boundary = np.r_[True, buckets[1:] != buckets[:-1]]
+    if has_symbol:
+        codes = pd.factorize(bars['symbol'])[0]
+        boundary |= np.r_[True, codes[1:] != codes[:-1]]
+    starts = np.flatnonzero(boundary)
+
+    def column(name, default=None):
+        if name in bars.columns:
+            return bars[name].to_numpy(dtype=np.float64)
+        return default
+
+    close = column('close')
+    volume = column('volume')
+    counts = column('trade_count', np.zeros(len(bars)))
+    vwap = column('vwap', close)
+    reduced = reduce_runs(starts, column('open'), column('high'), column('low'), close, volume, counts,
+                          vwap * volume)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        reduced_vwap = np.where(reduced['volume'] > 0, reduced['pv'] / reduced['volume'], reduced['close'])
+
+    result = {}
+    if has_symbol:
+        result['symbol'] = bars['symbol'].to_numpy()[starts]
+    result['timestamp'] = pd.to_datetime(buckets[starts], utc=True)
+    for name in ('open', 'high', 'low', 'close', 'volume'):
+        result[name] = reduced[name]
+    if 'trade_count' in bars.columns:
+        result['trade_count'] = reduced['trade_count']
+    if 'vwap' in bars.columns:
+        result['vwap'] = reduced_vwap
+
+    # Preserve the input's column order and dtypes
+    resampled = pd.DataFrame(result)
+    columns = [c for c in bars.columns if c in resampled.columns]
+    return resampled[columns].astype({c: bars[c].dtype for c in columns if c not in ('symbol', 'timestamp')})
@@ -0,0 +1,180 @@
+import numpy as np
+import pandas as pd
+from alpaca.data.requests import StockTradesRequest
+
+BAR_COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume', 'trade_count', 'vwap']
+
+
+def trades_to_frame(trades):
+    """
+    Converts a list of Alpaca Trade objects into compact typed columns without building a dict per trade.
+
+    Args:
+        trades (list): Trade objects with timestamp, price, size, exchange, conditions and tape.
+
+    Returns:
+        pd.DataFrame: timestamp (UTC), price (float32), size (int32), exchange, conditions and tape (categorical).
+    """
+    count = len(trades)
+    return pd.DataFrame({
+        "timestamp": pd.to_datetime([trade.timestamp for trade in trades], utc=True),
+        "price": np.fromiter((trade.price for trade in trades), dtype=np.float32, count=count),
+        "size": np.fromiter((trade.size for trade in trades), dtype=np.int32, count=count),
+        "exchange": pd.Categorical([trade.exchange for trade in trades]),
+        "conditions": pd.Categorical([",".join(trade.conditions or []) for trade in trades]),
+        "tape": pd.Categorical([trade.tape for trade in trades]),
+    })
+
+
+def iter_trade_chunks(historical_data_client, symbol, start, end, chunk=pd.Timedelta(minutes=30)):
+    """
+    Fetches trades in consecutive time slices and yields each slice as a typed frame, so only one slice
+    of Trade objects is alive at a time.
+
+    Args:
+        historical_data_client: Alpaca StockHistoricalDataClient (or anything with `get_stock_trades`).
+        symbol (str): Ticker symbol.
+        start, end: Time range (str, datetime or pd.Timestamp; naive values are treated as UTC).
+        chunk (pd.Timedelta): Length of each slice.
+
+    Yields:
+        pd.DataFrame: Typed trades of one slice, in time order.
+    """
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    start = start.tz_localize('UTC') if start.tzinfo is None else start
+    end = end.tz_localize('UTC') if end.tzinfo is None else end
+
+    chunk_start = start
+    while chunk_start < end:
+        chunk_end = min(chunk_start + chunk, end)
+        trades_request = StockTradesRequest(
+            symbol_or_symbols=symbol,
+            start=chunk_start.to_pydatetime(),
+            end=chunk_end.to_pydatetime()
+        )
+        trades = historical_data_client.get_stock_trades(trades_request).data.get(symbol, [])
+
+        # Slice ends are inclusive, so drop trades already yielded at the boundary of the next slice
+        frame = trades_to_frame(trades)
+        if chunk_end < end:
+            frame = frame[frame['timestamp'] < chunk_end]
+        if not frame.empty:
+            yield frame.sort_values('timestamp', kind='stable').reset_index(drop=True)
+        chunk_start = chunk_end
+
+
+def reduce_runs(starts, opens, highs, lows, closes, volumes, counts, pvs):
+    """
+    Reduces consecutive runs of time-ordered rows into one bar each.
+
+    Args:
+        starts (np.array): Index of the first row of each run.
+        opens, highs, lows, closes, volumes, counts, pvs (np.array): Per-row open, high, low, close, volume,
+            trade count and price x volume.
+
+    Returns:
+        dict: Per-run open, high, low, close, volume, trade_count and pv arrays.
+    """
+    ends = np.r_[starts[1:], len(opens)] - 1
+    return dict(
+        open=opens[starts],
+        high=np.maximum.reduceat(highs, starts),
+        low=np.minimum.reduceat(lows, starts),
+        close=closes[ends],
+        volume=np.add.reduceat(volumes, starts),
+        trade_count=np.add.reduceat(counts, starts),
+        pv=np.add.reduceat(pvs, starts),
+    )
+
+
+class BarAggregator:
+    def __init__(self, interval='1min'):
+        """
+        Streaming reduction of time-ordered trades into OHLCV + VWAP bars of any interval.
+
+        Each `update` emits the bars completed by a chunk and keeps the partial state (open, high, low, close,
+        volume, trade count and price x volume) of the last bar, which the next chunk may still extend.
+
+        Args:
+            interval (str or pd.Timedelta): Bar length, e.g. '1min', '5min', '1h'.
+        """
+        self.interval = pd.Timedelta(interval).value
+        self._pending = None  # Partial state of the last, possibly incomplete, bar
+
+    def _combine(self, trades):
+        ts = pd.DatetimeIndex(pd.to_datetime(trades['timestamp'], utc=True)).as_unit('ns').asi8
+        price = trades['price'].to_numpy(dtype=np.float64)
+        size = trades['size'].to_numpy(dtype=np.float64)
+
+        parts = [(ts - ts % self.interval, price, price, price, price, size, np.ones(len(ts)), price * size)]
+        if self._pending is not None:
+            pending = self._pending
+            parts.insert(0, tuple(pending[key] for key in
+                                  ('bucket', 'open', 'high', 'low', 'close', 'volume', 'trade_count', 'pv')))
+        buckets, *columns = (np.concatenate(columns) for columns in zip(*parts))
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        state = reduce_runs(starts, *columns)
+        state['bucket'] = buckets[starts]
+        return state
+
+    @staticmethod
+    def _to_frame(state, rows):
+        volume = state['volume'][rows]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            vwap = np.where(volume > 0, state['pv'][rows] / volume, np.nan)
+        return pd.DataFrame({
+            'timestamp': pd.to_datetime(state['bucket'][rows], utc=True),
+            'open': state['open'][rows].astype(np.float32),
+            'high': state['high'][rows].astype(np.float32),
+            'low': state['low'][rows].astype(np.float32),
+            'close': state['close'][rows].astype(np.float32),
+            'volume': volume,
+            'trade_count': state['trade_count'][rows].astype(np.int64),
+            'vwap': vwap.astype(np.float32),
+        }, columns=BAR_COLUMNS)
+
+    def update(self, trades):
+        """
+        Adds a time-ordered chunk of trades.
+
+        Args:
+            trades (pd.DataFrame): Trades with 'timestamp', 'price' and 'size' columns.
+
+        Returns:
+            pd.DataFrame: Bars completed by this chunk (possibly empty).
+        """
+        if trades.empty:
+            return pd.DataFrame(columns=BAR_COLUMNS)
+
+        state = self._combine(trades)
+        last = len(state['bucket']) - 1
+        self._pending = {key: values[last:] for key, values in state.items()}
+        return self._to_frame(state, slice(0, last))
+
+    def finalize(self):
+        """ Returns the last partial bar, if any, and resets the aggregator. """
+        if self._pending is None:
+            return pd.DataFrame(columns=BAR_COLUMNS)
+        bars = self._to_frame(self._pending, slice(0, 1))
+        self._pending = None
+        return bars
+
+
+def aggregate_trades(chunks, interval='1min'):
+    """
+    Aggregates an iterable of time-ordered trade chunks into bars, holding only one chunk at a time.
+
+    Args:
+        chunks (iterable): Trade frames, e.g. from `iter_trade_chunks`.
+        interval (str or pd.Timedelta): Bar length.
+
+    Returns:
+        pd.DataFrame: OHLCV + VWAP bars.
+    """
+    aggregator = BarAggregator(interval)
+    bars = [aggregator.update(chunk) for chunk in chunks]
+    bars.append(aggregator.finalize())
+    bars = [frame for frame in bars if not frame.empty]
+    if not bars:
+        return pd.DataFrame(columns=BAR_COLUMNS)
+    return pd.concat(bars, ignore_index=True)
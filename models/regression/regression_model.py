@@ -1,12 +1,52 @@
 import numpy as np
-from sklearn.linear_model import LinearRegression
+
+# Singular values below this fraction of the largest count as zero, as with sklearn's LinearRegression (tol)
+RCOND = 1e-6
 
 class RegressionModel:
-    def __init__(self):
+    def __init__(self, verbose=False):
         """
         Initializes the RegressionModel class.
+
+        Every ticker/window pair is an ordinary least-squares fit with intercept, solved for all tickers
+        of a window in one call over their stacked design matrices.
         """
-        self.models = {}
+        self.tickers = []
+        self.ticker_index = {}
+        self.coefficients = {}  # window -> (tickers, targets, features), same layout as sklearn's coef_
+        self.intercepts = {}  # window -> (tickers, targets)
+        self.verbose = verbose
+
+    @staticmethod
+    def solve_batched(X, y):
+        """
+        Solves a stack of least-squares problems with intercept, each with np.linalg.lstsq on the centered data and
+        the rank cutoff of sklearn's LinearRegression. The SVD of X itself keeps the precision that the normal
+        equations lose on collinear price windows, and picks the same solution when a window has more days than samples.
+
+        Args:
+            X (np.array): Design matrices of shape (batch, samples, features).
+            y (np.array): Targets of shape (batch, samples, targets).
+
+        Returns:
+            coefficients (np.array): Shape (batch, targets, features).
+            intercepts (np.array): Shape (batch, targets).
+        """
+        X = np.asarray(X, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+
+        # Center so the intercept drops out of the normal equations
+        X_mean = X.mean(axis=1, keepdims=True)
+        y_mean = y.mean(axis=1, keepdims=True)
+        Xc = X - X_mean
+        yc = y - y_mean
+
+        # lstsq gives the minimum-norm solution when a ticker's design matrix is rank deficient
+        beta = np.stack([np.linalg.lstsq(Xc[i], yc[i], rcond=RCOND)[0]
+                         for i in range(len(X))])  # (batch, features, targets)
+        intercepts = (y_mean - X_mean @ beta)[:, 0, :]
+
+        return beta.transpose(0, 2, 1), intercepts
 
     def fit(self, preprocessed_data):
         """
@@ -18,30 +58,40 @@ class RegressionModel:
         Returns:
             dict: Dictionary of regression results for each ticker and time window.
         """
-        regression_results = {}
-
-        # Perform regression for each ticker and time window
-        for ticker, window_data in preprocessed_data.items():
-            self.models[ticker] = {}
-            regression_results[ticker] = {}
-
-            for window, data in window_data.items():
-                X, y = data["X"], data["y"]
-                model = LinearRegression()
-
-                # Fit the regression model
-                model.fit(X, y)
-
-                # Store the coefficients and intercept
-                self.models[ticker][window] = model
+        self.tickers = list(preprocessed_data.keys())
+        self.ticker_index = {ticker: i for i, ticker in enumerate(self.tickers)}
+        self.coefficients = {}
+        self.intercepts = {}
+
+        regression_results = {ticker: {} for ticker in self.tickers}
+        if not self.tickers:
+            return regression_results
+
+        # All tickers share the day axis, so a window's design matrices stack into one batch
+        windows = list(preprocessed_data[self.tickers[0]].keys())
+        for window in windows:
+            X = np.stack([preprocessed_data[ticker][window]["X"] for ticker in self.tickers])
+            y = np.stack([preprocessed_data[ticker][window]["y"] for ticker in self.tickers])
+
+            if X.shape[1] == 0:
+                print(f"Not enough days for a {window}-day window. Skipping.")
+                continue
+
+            coefficients, intercepts = self.solve_batched(X, y)
+            self.coefficients[window] = coefficients
+            self.intercepts[window] = intercepts
+
+            for i, ticker in enumerate(self.tickers):
                 regression_results[ticker][window] = {
-                    "coefficients": model.coef_,
-                    "intercept": model.intercept_
+                    "coefficients": coefficients[i],
+                    "intercept": intercepts[i]
                 }
 
-                print(f"Regression for {ticker}, {window}-day window completed.")
-                print(f"Coefficients: {model.coef_}, Intercept: {model.intercept_}")
+                if self.verbose:
+                    print(f"Regression for {ticker}, {window}-day window completed.")
+                    print(f"Coefficients: {coefficients[i]}, Intercept: {intercepts[i]}")
 
+        print(f"Regression fitted for {len(self.tickers)} tickers over windows {list(self.coefficients)}.")
         return regression_results
 
     def predict(self, ticker, window, X_new):
@@ -56,13 +106,38 @@ class RegressionModel:
         Returns:
             array: Predicted high prices.
         """
-        if ticker not in self.models or window not in self.models[ticker]:
+        if ticker not in self.ticker_index or window not in self.coefficients:
             raise ValueError(f"No regression model found for {ticker} with a {window}-day window.")
 
-        model = self.models[ticker][window]
+        i = self.ticker_index[ticker]
 
-        # Perform prediction using the regression model
+        # Perform prediction using the regression coefficients
         X_new = np.array(X_new).reshape(1, -1)  # Ensure X_new is 2D
-        y_pred = model.predict(X_new)
+        y_pred = X_new @ self.coefficients[window][i].T + self.intercepts[window][i]
 
         return y_pred
+
+    def predict_all(self, X_new):
+        """
+        Scores every ticker and window in one vectorized call.
+
+        Args:
+            X_new (dict): Maps window to open prices of shape (tickers, window) or (tickers, samples, window),
+                with tickers in the order used by `fit`.
+
+        Returns:
+            dict: Maps window to predicted high prices of shape (tickers, samples, window).
+        """
+        predictions = {}
+        for window, X in X_new.items():
+            if window not in self.coefficients:
+                raise ValueError(f"No regression model found with a {window}-day window.")
+
+            X = np.asarray(X, dtype=np.float64)
+            if X.ndim == 2:
+                X = X[:, np.newaxis, :]  # One sample per ticker
+
+            coefficients = self.coefficients[window]
+            predictions[window] = X @ coefficients.transpose(0, 2, 1) + self.intercepts[window][:, np.newaxis, :]
+
+        return predictions
@@ -0,0 +1,117 @@
+import os
+import random
+import threading
+import numpy as np
+import torch
+
+
+def snapshot(obj):
+    """ Detached CPU copy of a (nested) checkpoint, so training can keep updating the live tensors. """
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return {key: snapshot(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(snapshot(value) for value in obj)
+    return obj
+
+
+def atomic_save(obj, path):
+    """ torch.save to a temporary file that then replaces `path`, so a crash never leaves a truncated checkpoint. """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        torch.save(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def get_rng_state():
+    """ RNG states of torch (CPU and CUDA), numpy and random, so a resumed run draws the same numbers. """
+    return dict(torch=torch.get_rng_state(),
+                cuda=torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None,
+                numpy=np.random.get_state(),
+                random=random.getstate())
+
+
+def set_rng_state(state):
+    torch.set_rng_state(state['torch'])
+    if state['cuda'] is not None and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+    np.random.set_state(state['numpy'])
+    random.setstate(state['random'])
+
+
+def load_training_state(path, device=None):
+    """ Loads a full training-state checkpoint written by Trainer; None if there is none. """
+    if not os.path.exists(path):
+        return None
+    # Training states hold numpy and random RNG states, which weights_only loading rejects
+    return torch.load(path, map_location=device, weights_only=False)
+
+
+class CheckpointWriter:
+    def __init__(self):
+        """
+        Writes checkpoints on a background thread so torch.save never blocks a training epoch.
+        Every write goes to a temporary file that atomically replaces the target.
+
+        Only the newest pending checkpoint per path is kept: if training improves again before the previous
+        write started, the older snapshot is dropped instead of written. Pending checkpoints are written in the
+        order of their latest `save`, so a file saved before another one that refers to it is on disk first.
+        """
+        self._pending = {}  # path -> snapshot waiting to be written
+        self._condition = threading.Condition()
+        self._writing = False
+        self._closed = False
+        self.error = None
+        self.writes = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def save(self, obj, path):
+        """ Snapshots `obj` now and writes it to `path` in the background. """
+        state = snapshot(obj)
+        with self._condition:
+            if self._closed:
+                raise ValueError("Checkpoint writer is closed.")
+            self._pending.pop(path, None)  # Re-queued behind the checkpoints saved before it
+            self._pending[path] = state
+            self._condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                path = next(iter(self._pending))
+                state = self._pending.pop(path)
+                self._writing = True
+
+            try:
+                atomic_save(state, path)
+                self.writes += 1
+            except Exception as e:
+                self.error = e
+            finally:
+                with self._condition:
+                    self._writing = False
+                    self._condition.notify_all()
+
+    def flush(self):
+        """ Blocks until every pending checkpoint is on disk; re-raises a failed write. """
+        with self._condition:
+            while self._pending or self._writing:
+                self._condition.wait()
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def close(self):
+        self.flush()
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
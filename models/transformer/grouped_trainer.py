@@ -0,0 +1,271 @@
+import copy
+import os
+import time
+import torch
+import torch.optim as optim
+from torch.func import functional_call, stack_module_state, vmap
+from torch.nn.attention import SDPBackend, sdpa_kernel
+from models.transformer.checkpoint import (CheckpointWriter, atomic_save, get_rng_state, load_training_state,
+                                           set_rng_state)
+from models.transformer.trainer import split_sizes
+
+
+class GroupedTrainer:
+    def __init__(self, models, learning_rate, batch_size, epochs, model_save_paths, weight_decay=1e-5, noise_std=0.01,
+                 patience=5, validation_split=0.1, gap=None, max_time=None, checkpoint_path=None, resume=True,
+                 fingerprint=None):
+        """
+        Trains N same-shaped models at once by stacking their parameters and running one vmapped forward pass.
+
+        Every model keeps its own loss, Adam state (Adam is elementwise, so the stacked state is per model) and
+        early stopping. Models that stop are dropped from the stack, and each model's best weights are saved
+        to its own path as a regular state dict, so Inference loads them like weights from Trainer.
+
+        Like Trainer, early stopping follows the validation loss of a time-ordered split, and a full training-state
+        checkpoint of the group is written after every epoch and resumed from.
+
+        Args:
+            models (list): TransformerModel instances with identical architectures.
+            learning_rate (float): Learning rate for training.
+            batch_size (int): Batch size for training.
+            epochs (int): Maximum number of epochs.
+            model_save_paths (list): Weight path for each model.
+            weight_decay (float): Adam weight decay.
+            noise_std (float): Standard deviation of the Gaussian input noise.
+            patience (int): Epochs without improvement before a model stops.
+            validation_split (float): Fraction of the most recent samples held out to drive early stopping.
+            gap (int, optional): Samples dropped between the training and validation split, at least
+                window_size + horizon (default: the window length, see Trainer).
+            max_time (float, optional): Wall-clock budget in seconds for the whole group; no epoch is started that
+                would exceed it.
+            checkpoint_path (str, optional): Training-state checkpoint of the group (default: the first weight path
+                with a .group.ckpt extension). It is removed once training finishes.
+            resume (bool): Continue from the training-state checkpoint if one exists.
+            fingerprint (dict, optional): What the group is trained for (tickers, architecture, data range,
+                labels, ...), stored in the checkpoint; a checkpoint with another fingerprint is discarded.
+        """
+        if len(models) != len(model_save_paths):
+            raise ValueError("Each model needs a save path.")
+
+        self.learning_rate = learning_rate
+        self.batch_size = batch_size
+        self.epochs = epochs
+        self.model_save_paths = list(model_save_paths)
+        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        self.weight_decay = weight_decay
+        self.noise_std = noise_std
+        self.patience = patience
+        self.validation_split = validation_split
+        self.gap = gap
+        self.max_time = max_time
+        self.checkpoint_path = checkpoint_path or os.path.splitext(self.model_save_paths[0])[0] + ".group.ckpt"
+        self.resume = resume
+        self.fingerprint = fingerprint
+
+        for model in models:
+            model.to(self.device)
+            model.train()
+        params, buffers = stack_module_state(models)
+        self.params = {name: param.detach().requires_grad_() for name, param in params.items()}
+        self.buffers = buffers
+
+        # Stateless copy of the architecture used by functional_call
+        self.base_model = copy.deepcopy(models[0]).to('meta')
+
+        self.optimizer = optim.Adam(self.params.values(), lr=self.learning_rate, weight_decay=self.weight_decay)
+
+    def _forward(self, params, buffers, X):
+        return functional_call(self.base_model, (params, buffers), (X,))
+
+    def forward(self, X):
+        """ Runs every stacked model on its own input slice; X has shape (models, batch, time_steps, features). """
+        return vmap(self._forward, randomness='different')(self.params, self.buffers, X)
+
+    def model_state(self, position):
+        """ One stacked model as a regular state dict. """
+        state_dict = {name: param[position].detach().cpu().clone() for name, param in self.params.items()}
+        state_dict.update({name: buffer[position].cpu().clone() for name, buffer in self.buffers.items()})
+        return state_dict
+
+    def _keep(self, positions):
+        """ Drops stopped models from the stacked parameters and the optimizer state. """
+        index = torch.tensor(positions, device=self.device)
+        old_state = {name: self.optimizer.state.get(param, {}) for name, param in self.params.items()}
+
+        self.params = {name: param.detach()[index].clone().requires_grad_() for name, param in self.params.items()}
+        self.buffers = {name: buffer[index] for name, buffer in self.buffers.items()}
+        self.optimizer = optim.Adam(self.params.values(), lr=self.learning_rate, weight_decay=self.weight_decay)
+
+        for name, param in self.params.items():
+            state = old_state[name]
+            if state:
+                self.optimizer.state[param] = {key: value if value.dim() == 0 else value[index].clone()
+                                               for key, value in state.items()}
+
+    @staticmethod
+    def _batch(X, batch_idx, offsets):
+        """ The inputs of the given samples for every model; windows are gathered from day rows if `offsets`. """
+        if offsets is not None:
+            return X[:, batch_idx[:, None] + offsets]  # (models, batch, window_size, features)
+        return X[:, batch_idx]
+
+    def evaluate(self, X, y, sample_idx, offsets):
+        """ Mean loss of every stacked model over the given samples, in eval mode without gradients. """
+        total_loss = torch.zeros(X.shape[0], device=self.device)
+        self.base_model.eval()
+
+        # The encoder's fused fast path and fused attention kernels have no vmap batching rules (see StackedModels)
+        fastpath = torch.backends.mha.get_fastpath_enabled()
+        torch.backends.mha.set_fastpath_enabled(False)
+        try:
+            with torch.no_grad(), sdpa_kernel(SDPBackend.MATH):
+                for batch_idx in sample_idx.split(self.batch_size * 8):
+                    output = self.forward(self._batch(X, batch_idx, offsets))
+                    batch_loss = ((output - y[:, batch_idx]) ** 2).mean(dim=tuple(range(1, output.dim())))
+                    total_loss += batch_loss * len(batch_idx)
+        finally:
+            torch.backends.mha.set_fastpath_enabled(fastpath)
+            self.base_model.train()
+        return (total_loss / len(sample_idx)).tolist()
+
+    def training_state(self, epoch, active, best_loss, best_models, counter, epochs_run, elapsed):
+        """ Everything needed to continue training the group after the given epoch. """
+        return dict(params=self.params, buffers=self.buffers, optimizer=self.optimizer.state_dict(), epoch=epoch,
+                    active=active, best_loss=best_loss, best_models=best_models, counter=counter,
+                    epochs_run=epochs_run, elapsed=elapsed, rng=get_rng_state(), fingerprint=self.fingerprint)
+
+    def load_training_state(self):
+        """ Restores the group's training-state checkpoint; None if there is none or it was trained for another run. """
+        state = load_training_state(self.checkpoint_path, self.device)
+        if state is None:
+            return None
+        if state.get('fingerprint') != self.fingerprint:
+            print(f"Discarding {self.checkpoint_path}: it was written for other models or data settings.")
+            os.remove(self.checkpoint_path)
+            return None
+        self.params = {name: param.to(self.device).requires_grad_() for name, param in state['params'].items()}
+        self.buffers = {name: buffer.to(self.device) for name, buffer in state['buffers'].items()}
+        self.optimizer = optim.Adam(self.params.values(), lr=self.learning_rate, weight_decay=self.weight_decay)
+        self.optimizer.load_state_dict(state['optimizer'])
+        set_rng_state(state['rng'])
+        print(f"Resuming from {self.checkpoint_path} after epoch {state['epoch']}")
+        return state
+
+    def train(self, X, y, window_size=None):
+        """
+        Trains all models; X has shape (models, samples, time_steps, features) and y (models, samples, outputs).
+        With `window_size`, X instead holds each model's day rows, shape (models, days, features), and sample i is
+        the window of rows i to i + window_size, gathered per batch so the windows are never materialized at once.
+
+        Returns:
+            list: Number of epochs each model ran.
+        """
+        X = torch.as_tensor(X, dtype=torch.float32).to(self.device)
+        y = torch.as_tensor(y, dtype=torch.float32).to(self.device)
+        num_models, num_samples = y.shape[:2]
+        offsets = torch.arange(window_size, device=self.device) if window_size is not None else None
+
+        # Hold out the most recent samples, `gap` samples after the training ones
+        gap = self.gap if self.gap is not None else (window_size if window_size is not None else X.shape[2])
+        num_train, num_val = split_sizes(num_samples, gap, self.validation_split)
+        val_idx = torch.arange(num_samples - num_val, num_samples, device=self.device)
+
+        active = list(range(num_models))  # Original index of each model still in the stack
+        best_loss = [float('inf')] * num_models
+        best_models = [None] * num_models
+        counter = [0] * num_models
+        epochs_run = [0] * num_models
+        start_epoch = 0
+        elapsed = 0.0
+
+        state = self.load_training_state() if self.resume else None
+        if state is not None:
+            active, best_loss, best_models = state['active'], state['best_loss'], state['best_models']
+            counter, epochs_run = state['counter'], state['epochs_run']
+            start_epoch, elapsed = state['epoch'], state['elapsed']
+
+        checkpoint_writer = CheckpointWriter()
+        train_start = time.perf_counter() - elapsed  # The time budget covers earlier runs of a resumed training
+        epoch_time = 0.0
+
+        try:
+            for epoch in range(start_epoch, self.epochs):
+                if not active:
+                    break  # Resumed after every model had already stopped early
+
+                if self.max_time is not None and time.perf_counter() - train_start + epoch_time > self.max_time:
+                    print(f"Time budget of {self.max_time:.0f}s reached after {epoch} epochs")
+                    break
+
+                epoch_start = time.perf_counter()
+                index = torch.tensor(active, device=self.device)
+                X_active, y_active = X[index], y[index]
+
+                epoch_loss = torch.zeros(len(active), device=self.device)
+                num_batches = 0
+                for batch_idx in torch.randperm(num_train, device=self.device).split(self.batch_size):
+                    batch_X = self._batch(X_active, batch_idx, offsets)
+                    batch_y = y_active[:, batch_idx]
+                    self.optimizer.zero_grad()
+
+                    # Optionally add noise to input for regularization
+                    noisy_batch_X = batch_X + torch.randn_like(batch_X) * self.noise_std
+
+                    output = self.forward(noisy_batch_X)
+                    model_loss = ((output - batch_y) ** 2).mean(dim=tuple(range(1, output.dim())))  # MSE per model
+
+                    # Summing keeps each model's gradient equal to that of its own loss
+                    model_loss.sum().backward()
+                    self.optimizer.step()
+
+                    epoch_loss += model_loss.detach()
+                    num_batches += 1
+
+                avg_epoch_loss = (epoch_loss / num_batches).tolist()
+                if num_val:
+                    monitored_loss = self.evaluate(X_active, y_active, val_idx, offsets)
+                    print(f"Epoch [{epoch + 1}/{self.epochs}], {len(active)} models, "
+                          f"Mean loss: {sum(avg_epoch_loss) / len(avg_epoch_loss):.4f}, "
+                          f"Mean val loss: {sum(monitored_loss) / len(monitored_loss):.4f}")
+                else:
+                    monitored_loss = avg_epoch_loss
+                    print(f"Epoch [{epoch + 1}/{self.epochs}], {len(active)} models, "
+                          f"Mean loss: {sum(avg_epoch_loss) / len(avg_epoch_loss):.4f}")
+                epoch_time = time.perf_counter() - epoch_start
+
+                # Per-model early stopping logic
+                keep = []
+                for position, model_idx in enumerate(active):
+                    epochs_run[model_idx] = epoch + 1
+                    if monitored_loss[position] < best_loss[model_idx]:
+                        best_loss[model_idx] = monitored_loss[position]
+                        counter[model_idx] = 0
+                        best_models[model_idx] = self.model_state(position)
+                        checkpoint_writer.save(best_models[model_idx], self.model_save_paths[model_idx])
+                    else:
+                        counter[model_idx] += 1
+
+                    if counter[model_idx] < self.patience:
+                        keep.append(position)
+
+                if len(keep) < len(active):
+                    print(f"Early stopping triggered for {len(active) - len(keep)} models at epoch {epoch + 1}")
+                    active = [active[position] for position in keep]
+                    if keep:
+                        self._keep(keep)
+
+                checkpoint_writer.save(self.training_state(epoch + 1, active, best_loss, best_models, counter,
+                                                           epochs_run, time.perf_counter() - train_start),
+                                       self.checkpoint_path)
+        finally:
+            checkpoint_writer.close()
+
+        # Weight files may predate a resumed run, so every model's best weights are written before the group's
+        # training state that holds them is removed
+        for model_idx, best_model in enumerate(best_models):
+            if best_model is not None:
+                atomic_save(best_model, self.model_save_paths[model_idx])
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+        return epochs_run
@@ -1,29 +1,230 @@
+import copy
+import time
+import numpy as np
 import torch
+import torch.nn as nn
+from torch.func import functional_call, stack_module_state, vmap
+from torch.nn.attention import SDPBackend, sdpa_kernel
+from models.transformer.model import TransformerModel
+
+BACKENDS = ('eager', 'int8', 'traced')
+
+
+def as_input(X, device):
+    """
+    float32 tensor of X on `device`. Read-only arrays, e.g. the stride-trick window views of the processors,
+    are copied first, since torch can't share their memory.
+    """
+    X = np.asarray(X, dtype=np.float32)
+    if not (X.flags.writeable and X.flags.c_contiguous):
+        X = np.array(X, order='C')
+    return torch.from_numpy(X).to(device)
+
 
 class Inference:
-    def __init__(self, model, model_path, device=None, verbose=False):
+    def __init__(self, model, model_path=None, device=None, verbose=False, backend='eager'):
+        """
+        Wraps a model for inference. Weights are loaded from model_path if given; pass None for a model that
+        is already loaded, e.g. one from a ModelRegistry.
+
+        Backends:
+            eager: the fp32 model as is.
+            int8: a copy with dynamically quantized int8 Linear layers (CPU only).
+            traced: a frozen TorchScript graph traced per input shape.
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown inference backend '{backend}'. Choose one of {BACKENDS}.")
+
         self.model = model
         self.model_path = model_path
         self.device = device if device else torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        self.verbose = verbose
+        self.backend = backend
+
+        if backend == 'int8' and self.device.type != 'cpu':
+            raise ValueError("int8 dynamic quantization only runs on CPU.")
 
         self.model.to(self.device)
         self.model.eval()
-        self.load_model()
-        self.verbose = verbose
+        if self.model_path is not None:
+            self.load_model()
+
+        self._quantized = None
+        self._traced = {}  # Input shape -> traced graph
+
+    @classmethod
+    def from_pack(cls, weight_pack, ticker, device=None, verbose=False, backend='eager'):
+        """ Builds a ticker's model from a WeightPack and wraps it for inference. """
+        model = TransformerModel(**weight_pack.config(ticker))
+        model.load_state_dict(weight_pack.state_dict(ticker))
+        return cls(model, device=device, verbose=verbose, backend=backend)
 
     def load_model(self):
         """ Loads the saved model weights. """
         self.model.load_state_dict(torch.load(self.model_path, map_location=self.device, weights_only=True))
         self.model.eval()
+        self._quantized = None
+        self._traced = {}
+
+    def _backend_model(self, X, backend):
+        if backend == 'eager':
+            return self.model
+        if backend == 'int8':
+            if self._quantized is None:
+                self._quantized = torch.ao.quantization.quantize_dynamic(copy.deepcopy(self.model), {nn.Linear},
+                                                                         dtype=torch.qint8)
+            return self._quantized
+
+        # Traced graphs can bake in shapes, so keep one per input shape
+        if X.shape not in self._traced:
+            traced = torch.jit.trace(self.model, X, check_trace=False)
+            self._traced[X.shape] = torch.jit.freeze(traced)
+        return self._traced[X.shape]
+
+    def _forward(self, X, backend=None):
+        backend = backend or self.backend
+        with torch.no_grad():
+            X = as_input(X, self.device)
+            model = self._backend_model(X, backend)
+            if backend != 'int8':
+                return model(X)
+
+            # The encoder's fused fast path can't take quantized Linear weights, so run the regular path
+            fastpath = torch.backends.mha.get_fastpath_enabled()
+            torch.backends.mha.set_fastpath_enabled(False)
+            try:
+                return model(X)
+            finally:
+                torch.backends.mha.set_fastpath_enabled(fastpath)
 
     def predict(self, X):
         """ Predicts a continuous value for the input data. """
+        output = self._forward(X)
+
+        # Debugging: Print the raw model output to inspect the values
+        if self.verbose:
+            print(f"Model output: {output.cpu().numpy()}")
+
+        return output.cpu().numpy()  # Return the predicted values
+
+    @staticmethod
+    def rank_correlation(a, b):
+        """ Spearman rank correlation between two prediction vectors. """
+        ranks_a = np.argsort(np.argsort(a))
+        ranks_b = np.argsort(np.argsort(b))
+        if len(a) < 2 or ranks_a.std() == 0 or ranks_b.std() == 0:
+            return 1.0
+        return float(np.corrcoef(ranks_a, ranks_b)[0, 1])
+
+    def check_parity(self, X, atol=1e-2):
+        """
+        Compares this backend's outputs with the eager fp32 model on the same input.
+
+        Args:
+            X (np.array): Input windows of shape (samples, time_steps, features).
+            atol (float): Largest absolute difference still considered a match.
+
+        Returns:
+            dict: max_abs_error, rank_correlation (Spearman, over the first output) and passed.
+        """
+        expected = self._forward(X, 'eager').cpu().numpy()
+        actual = self._forward(X).cpu().numpy()
+        max_abs_error = float(np.abs(actual - expected).max()) if expected.size else 0.0
+        rank_correlation = self.rank_correlation(expected[:, 0], actual[:, 0])
+        return dict(backend=self.backend, max_abs_error=max_abs_error, rank_correlation=rank_correlation,
+                    passed=max_abs_error <= atol)
+
+    def benchmark(self, X, batch_size=256, repeats=20, warmup=3):
+        """
+        Measures the latency of one batch and the resulting throughput.
+
+        Args:
+            X (np.array): Input windows; the first `batch_size` are used.
+            batch_size (int): Samples per forward pass.
+            repeats (int): Timed forward passes.
+            warmup (int): Untimed passes first (tracing and quantization happen here).
+
+        Returns:
+            dict: backend, batch_size, median latency_ms and throughput in samples/sec.
+        """
+        batch = np.asarray(X[:batch_size])
+        for _ in range(warmup):
+            self._forward(batch)
+
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            self._forward(batch)
+            timings.append(time.perf_counter() - start)
+
+        latency = float(np.median(timings))
+        return dict(backend=self.backend, batch_size=len(batch), latency_ms=latency * 1e3,
+                    throughput=len(batch) / latency)
+
+
+class StackedModels:
+    def __init__(self, models, device=None):
+        """
+        N same-shaped eval-mode models with their parameters stacked once for vmapped inference, e.g. to score the
+        latest window of every ticker with that ticker's model. Keep it while the models stay loaded, so repeated
+        predictions don't restack the parameters.
+
+        Args:
+            models (list): Eval-mode TransformerModel instances with identical architectures.
+            device (torch.device, optional): Device to run on (default: that of the first model).
+        """
+        self.models = list(models)
+        self.device = device if device else next(self.models[0].parameters()).device
+        self.params, self.buffers = stack_module_state(self.models)
+        self.base_model = copy.deepcopy(self.models[0]).to('meta')
+
+    def matches(self, models):
+        """ True if this stack holds exactly these model instances, in this order. """
+        return len(models) == len(self.models) and all(a is b for a, b in zip(models, self.models))
+
+    def _forward(self, params, buffers, x):
+        return functional_call(self.base_model, (params, buffers), (x,))
+
+    def predict(self, X):
+        """
+        Runs every model on its own inputs in a single vmapped forward pass.
+
+        Args:
+            X (np.array): Inputs of shape (models, batch, time_steps, features).
+
+        Returns:
+            np.array: Outputs of shape (models, batch, outputs).
+        """
         with torch.no_grad():
-            X = torch.tensor(X, dtype=torch.float32).to(self.device)
-            output = self.model(X)
+            X = as_input(X, self.device)
+
+            # The encoder's fused fast path and the fused attention kernels have no vmap batching rules and would
+            # fall back to a loop over the models, so run the regular path with the composite math attention
+            fastpath = torch.backends.mha.get_fastpath_enabled()
+            torch.backends.mha.set_fastpath_enabled(False)
+            try:
+                with sdpa_kernel(SDPBackend.MATH):
+                    return vmap(self._forward)(self.params, self.buffers, X).cpu().numpy()
+            finally:
+                torch.backends.mha.set_fastpath_enabled(fastpath)
+
 
-            # Debugging: Print the raw model output to inspect the values
-            if self.verbose:
-                print(f"Model output: {output.cpu().numpy()}")
+def compare_backends(model, X, backends=BACKENDS, batch_size=256, repeats=20, atol=1e-2):
+    """
+    Runs the parity check and benchmark of every backend on the same model and input, and prints a summary,
+    so the fastest backend that keeps the ranking can be picked per host.
 
-            return output.cpu().numpy()  # Return the predicted values
+    Returns:
+        list: One dict per backend with parity and benchmark results.
+    """
+    device = torch.device('cpu')
+    results = []
+    for backend in backends:
+        inference = Inference(model, device=device, backend=backend)
+        result = inference.check_parity(X, atol)
+        result.update(inference.benchmark(X, batch_size, repeats))
+        results.append(result)
+        print(f"{backend:>6}: {result['latency_ms']:.2f} ms/batch of {result['batch_size']}, "
+              f"{result['throughput']:.0f} samples/sec, max abs error {result['max_abs_error']:.2e}, "
+              f"rank correlation {result['rank_correlation']:.4f}" + ("" if result['passed'] else " (parity FAILED)"))
+    return results
@@ -1,8 +1,10 @@
+import torch
 import torch.nn as nn
 
 
 class TransformerModel(nn.Module):
-    def __init__(self, input_size, num_heads, num_layers, hidden_dim):
+    def __init__(self, input_size, num_heads, num_layers, hidden_dim, num_outputs=1, normalize=False,
+                 dim_feedforward=2048):
         """
         Initializes the Transformer model for stock price prediction for a single ticker.
 
@@ -11,21 +13,34 @@ class TransformerModel(nn.Module):
             num_heads (int): Number of attention heads.
             num_layers (int): Number of Transformer layers.
             hidden_dim (int): Size of the hidden dimension.
+            num_outputs (int): Number of regression outputs, e.g. one per prediction horizon.
+            normalize (bool): Standardize inputs with per-feature mean and std buffers (see set_normalization),
+                which are saved with the weights so inference applies the same scaling as training.
+            dim_feedforward (int): Width of the encoder feed-forward layers (2048, PyTorch's default, for models
+                saved before shapes were planned).
         """
         super(TransformerModel, self).__init__()
 
+        if normalize:
+            self.register_buffer('input_mean', torch.zeros(input_size))
+            self.register_buffer('input_std', torch.ones(input_size))
+        else:
+            self.input_mean = None
+            self.input_std = None
+
         self.embedding = nn.Linear(input_size, hidden_dim)
 
         # Set batch_first=True to improve inference performance
         encoder_layers = nn.TransformerEncoderLayer(
             d_model=hidden_dim,
             nhead=num_heads,
+            dim_feedforward=dim_feedforward,
             dropout=0.3,
             batch_first=True  # Ensures batch_first=True for better performance
         )
 
         self.transformer_encoder = nn.TransformerEncoder(encoder_layers, num_layers)
-        self.fc_out = nn.Linear(hidden_dim, 1)  # Single output for regression
+        self.fc_out = nn.Linear(hidden_dim, num_outputs)  # One regression output per horizon
         self.dropout = nn.Dropout(p=0.3)  # Dropout layer
 
     def forward(self, src):
@@ -36,11 +51,26 @@ class TransformerModel(nn.Module):
             src (torch.Tensor): Input tensor with shape (batch_size, time_steps, input_size).
 
         Returns:
-            torch.Tensor: A single scalar prediction per batch for the regression task.
+            torch.Tensor: Predictions of shape (batch_size, num_outputs) for the regression task.
         """
+        if self.input_mean is not None:
+            src = (src - self.input_mean) / self.input_std  # Per-feature standardization
         src = self.embedding(src)  # Shape: (batch_size, time_steps, hidden_dim)
         src = self.transformer_encoder(src)  # Apply Transformer layers
         src = self.dropout(src)  # Apply dropout
         src = src.mean(dim=1)  # Global average pooling over time steps to reduce to (batch_size, hidden_dim)
-        output = self.fc_out(src)  # Single value output (batch_size, 1)
+        output = self.fc_out(src)  # Shape: (batch_size, num_outputs)
         return output
+
+    def set_normalization(self, mean, std):
+        """
+        Sets the per-feature input scaling of a model built with normalize=True.
+
+        Args:
+            mean (np.array): Feature means, shape (input_size,).
+            std (np.array): Feature standard deviations, shape (input_size,), without zeros.
+        """
+        if self.input_mean is None:
+            raise ValueError("The model was built without input normalization.")
+        self.input_mean.copy_(torch.as_tensor(mean, dtype=torch.float32))
+        self.input_std.copy_(torch.as_tensor(std, dtype=torch.float32))
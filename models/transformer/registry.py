@@ -0,0 +1,170 @@
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+import torch
+from models.transformer.model import TransformerModel
+from utils.model_size import find_best_head_size
+
+
+def metadata_path(model_path):
+    """ Returns the path of the architecture metadata stored next to a weight file. """
+    return os.path.splitext(model_path)[0] + ".json"
+
+
+def save_model_metadata(model_path, plan=None, settings=None, **config):
+    """
+    Stores the architecture parameters (input_size, num_heads, num_layers, hidden_dim, ...) next to the weights,
+    so the model can be rebuilt without recomputing them from freshly fetched data. `plan` records the shape
+    planner's cost estimate alongside them for reference, and `settings` the data and label settings the model was
+    trained with (see load_model_settings); neither is passed to the model.
+    """
+    if plan is not None:
+        config = dict(config, plan=plan)
+    if settings is not None:
+        config = dict(config, settings=settings)
+    with open(metadata_path(model_path), "w") as f:
+        json.dump(config, f, indent=2)
+
+
+def load_model_settings(model_path):
+    """ Returns the training settings recorded with a weight file, or None if it has no metadata or none recorded. """
+    path = metadata_path(model_path)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f).get('settings')
+
+
+def load_model_metadata(model_path, state_dict=None):
+    """
+    Loads the architecture parameters stored next to a weight file.
+
+    Weights saved before metadata was recorded fall back to the shapes in the state dict, including the number
+    of outputs, the feed-forward width and whether inputs are normalized. The head count cannot be read from the
+    weights, so it is recomputed from the input size with the heuristic such weights were built with.
+
+    Args:
+        model_path (str): Path to the weight file.
+        state_dict (dict, optional): Already loaded state dict, used for the fallback.
+
+    Returns:
+        dict: Keyword arguments for TransformerModel.
+    """
+    path = metadata_path(model_path)
+    if os.path.exists(path):
+        with open(path) as f:
+            config = json.load(f)
+        config.pop('plan', None)
+        config.pop('settings', None)
+        return config
+
+    if state_dict is None:
+        state_dict = torch.load(model_path, map_location='cpu', weights_only=True)
+
+    hidden_dim, input_size = state_dict['embedding.weight'].shape
+    layer_ids = {int(m.group(1)) for key in state_dict if (m := re.match(r'transformer_encoder\.layers\.(\d+)\.', key))}
+    num_heads = find_best_head_size(input_size)
+    if hidden_dim % num_heads != 0:
+        num_heads = 2
+    num_outputs = state_dict['fc_out.weight'].shape[0]
+    dim_feedforward = state_dict['transformer_encoder.layers.0.linear1.weight'].shape[0]
+    return dict(input_size=int(input_size), num_heads=num_heads, num_layers=len(layer_ids), hidden_dim=int(hidden_dim),
+                num_outputs=int(num_outputs), normalize='input_mean' in state_dict,
+                dim_feedforward=int(dim_feedforward))
+
+
+class ModelRegistry:
+    def __init__(self, memory_budget_mb=512, device=None, verbose=False):
+        """
+        Keeps loaded, eval-mode Transformer models in memory, evicting the least recently used ones
+        once their parameters exceed the memory budget.
+
+        Args:
+            memory_budget_mb (float): Maximum size of the cached parameters and buffers, in MB.
+            device (torch.device, optional): Device to load models onto (default: cuda if available).
+            verbose (bool): Print loads and evictions if True.
+        """
+        self.memory_budget = int(memory_budget_mb * 1024 ** 2)
+        self.device = device if device else torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        self.verbose = verbose
+
+        self._models = OrderedDict()  # model_path -> (model, config, nbytes)
+        self.memory_used = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_time = 0.0
+
+    @staticmethod
+    def model_nbytes(model):
+        tensors = list(model.parameters()) + list(model.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+
+    def _load(self, model_path, weight_pack=None):
+        if weight_pack is not None:
+            state_dict = weight_pack.state_dict(model_path)
+            config = weight_pack.config(model_path)
+        else:
+            state_dict = torch.load(model_path, map_location=self.device, weights_only=True)
+            config = load_model_metadata(model_path, state_dict)
+
+        model = TransformerModel(**config)
+        model.load_state_dict(state_dict)
+        model.to(self.device)
+        model.eval()
+        return model, config
+
+    def _evict(self):
+        while self.memory_used > self.memory_budget and len(self._models) > 1:
+            path, (_, _, nbytes) = self._models.popitem(last=False)
+            self.memory_used -= nbytes
+            self.evictions += 1
+            if self.verbose:
+                print(f"Evicted {path} from the model registry.")
+
+    def get(self, model_path, weight_pack=None):
+        """
+        Returns the eval-mode model for a weight file, loading it on a miss.
+
+        Args:
+            model_path (str): Path to the weight file, or the ticker when loading from a weight pack.
+            weight_pack (WeightPack, optional): Pack to load the ticker's weights from.
+
+        Returns:
+            tuple: (model, config) where config holds the architecture parameters.
+        """
+        key = (weight_pack.path, model_path) if weight_pack is not None else model_path
+        if key in self._models:
+            self.hits += 1
+            self._models.move_to_end(key)
+            model, config, _ = self._models[key]
+            return model, config
+
+        self.misses += 1
+        start = time.perf_counter()
+        model, config = self._load(model_path, weight_pack)
+        self.load_time += time.perf_counter() - start
+
+        nbytes = self.model_nbytes(model)
+        self._models[key] = (model, config, nbytes)
+        self.memory_used += nbytes
+        if self.verbose:
+            print(f"Loaded {model_path} into the model registry ({nbytes / 1e6:.2f} MB).")
+        self._evict()
+
+        return model, config
+
+    def clear(self):
+        self._models.clear()
+        self.memory_used = 0
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses, evictions=self.evictions, load_time=self.load_time,
+                    models=len(self._models), memory_used=self.memory_used)
+
+    def __str__(self):
+        return (f"Model registry: {self.hits} hits, {self.misses} misses, {self.evictions} evictions, "
+                f"{self.load_time:.2f}s loading, {len(self._models)} models in "
+                f"{self.memory_used / 1e6:.2f}/{self.memory_budget / 1e6:.2f} MB")
@@ -1,9 +1,50 @@
+import os
+import time
 import torch
 import torch.optim as optim
-from torch.utils.data import DataLoader, TensorDataset
+from torch.utils.data import DataLoader, Dataset, IterableDataset, Subset, TensorDataset
+from models.transformer.checkpoint import (CheckpointWriter, atomic_save, get_rng_state, load_training_state,
+                                           set_rng_state, snapshot)
+
+
+def split_sizes(num_samples, gap, validation_split=0.1):
+    """
+    Training and validation sample counts of a time-ordered split that drops `gap` samples between the two;
+    (num_samples, 0) if there are too few samples to split.
+    """
+    num_val = int(num_samples * validation_split)
+    num_train = num_samples - num_val - gap
+    if num_val == 0 or num_train <= 0:
+        return num_samples, 0
+    return num_train, num_val
+
 
 class Trainer:
-    def __init__(self, model, learning_rate, batch_size, epochs, model_save_path, weight_decay=1e-5, noise_std=0.01):
+    def __init__(self, model, learning_rate, batch_size, epochs, model_save_path, weight_decay=1e-5, noise_std=0.01,
+                 num_workers=0, validation_split=0.1, patience=5, max_time=None, checkpoint_path=None, resume=True,
+                 gap=None, fingerprint=None):
+        """
+        Args:
+            model (TransformerModel): Model to train.
+            learning_rate (float): Learning rate for training.
+            batch_size (int): Batch size for training.
+            epochs (int): Maximum number of epochs.
+            model_save_path (str): Where the best weights are saved.
+            weight_decay (float): Adam weight decay.
+            noise_std (float): Standard deviation of the Gaussian input noise.
+            num_workers (int): DataLoader worker processes prefetching batches.
+            validation_split (float): Fraction of the most recent samples held out to drive early stopping.
+            patience (int): Epochs without improvement before training stops.
+            max_time (float, optional): Wall-clock budget in seconds; no epoch is started that would exceed it.
+            checkpoint_path (str, optional): Full training-state checkpoint written after every epoch
+                (default: model_save_path with a .ckpt extension). It is removed once training finishes.
+            resume (bool): Continue from the training-state checkpoint if one exists.
+            gap (int, optional): Samples dropped between the training and validation split. Must be at least the
+                number of days from a window's first day to its label day, i.e. window_size + horizon
+                (default: the window length, enough only for labels inside the window).
+            fingerprint (dict, optional): What the model is trained for (architecture, data range, labels, ...),
+                stored in the training-state checkpoint; a checkpoint with another fingerprint is discarded.
+        """
         self.model = model
         self.learning_rate = learning_rate
         self.batch_size = batch_size
@@ -12,6 +53,14 @@ class Trainer:
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         self.weight_decay = weight_decay
         self.noise_std = noise_std  # Standard deviation for Gaussian noise
+        self.num_workers = num_workers  # DataLoader worker processes prefetching batches
+        self.validation_split = validation_split
+        self.patience = patience
+        self.max_time = max_time
+        self.checkpoint_path = checkpoint_path or os.path.splitext(model_save_path)[0] + ".ckpt"
+        self.resume = resume
+        self.gap = gap
+        self.fingerprint = fingerprint
 
         self.model.to(self.device)
         self.optimizer = optim.Adam(self.model.parameters(), lr=self.learning_rate, weight_decay=self.weight_decay)
@@ -22,44 +71,194 @@ class Trainer:
         noise = torch.randn(X.size()).to(self.device) * self.noise_std
         return X + noise
 
-    def train(self, X, y):
-        """ Trains the model using the provided input (X) and target (y) data. """
-        X = torch.tensor(X, dtype=torch.float32).to(self.device)
-        y = torch.tensor(y, dtype=torch.float32).to(self.device)  # Float type for regression
+    def split_validation(self, dataset):
+        """
+        Holds out the last `validation_split` of the samples, in order, so validation windows come after the training
+        windows in time. `gap` samples between the two are dropped (default: one window length); with a gap of
+        window_size + horizon, no training label falls inside a validation window.
+
+        Returns:
+            tuple: (train_dataset, validation_dataset), the latter None if there are too few samples to split.
+        """
+        num_samples = len(dataset)
+        gap = self.gap
+        if gap is None:
+            gap = dataset[0][0].shape[0] if num_samples else 0
+        num_train, num_val = self.split_sizes(num_samples, gap)
+        if num_val == 0:
+            return dataset, None
+        return Subset(dataset, range(num_train)), Subset(dataset, range(num_samples - num_val, num_samples))
+
+    def split_sizes(self, num_samples, gap):
+        """ Training and validation sample counts of the split; (num_samples, 0) if there are too few to split. """
+        return split_sizes(num_samples, gap, self.validation_split)
+
+    def evaluate(self, data_loader):
+        """ Mean loss over a data loader, computed in eval mode without gradients. """
+        self.model.eval()
+        total_loss = 0.0
+        num_samples = 0
+        with torch.no_grad():
+            for batch_X, batch_y in data_loader:
+                batch_X, batch_y = batch_X.to(self.device), batch_y.to(self.device)
+                total_loss += self.criterion(self.model(batch_X), batch_y).item() * batch_X.shape[0]
+                num_samples += batch_X.shape[0]
+        self.model.train()
+        return total_loss / max(num_samples, 1)
+
+    def training_state(self, epochs_run, best_loss, best_model, counter, elapsed):
+        """ Everything needed to continue training after the given epoch. """
+        return dict(model=self.model.state_dict(), optimizer=self.optimizer.state_dict(), epoch=epochs_run,
+                    best_loss=best_loss, best_model=best_model, counter=counter, elapsed=elapsed,
+                    rng=get_rng_state(), fingerprint=self.fingerprint)
+
+    def load_training_state(self):
+        """ Restores a training-state checkpoint; returns None if there is none or it was trained for another run. """
+        state = load_training_state(self.checkpoint_path, self.device)
+        if state is None:
+            return None
+        if state.get('fingerprint') != self.fingerprint:
+            print(f"Discarding {self.checkpoint_path}: it was written for other model or data settings.")
+            os.remove(self.checkpoint_path)
+            return None
+        self.model.load_state_dict(state['model'])
+        self.optimizer.load_state_dict(state['optimizer'])
+        set_rng_state(state['rng'])
+        print(f"Resuming from {self.checkpoint_path} after epoch {state['epoch']}")
+        return state
+
+    def train(self, X, y=None, validation_data=None):
+        """
+        Trains the model using the provided input (X) and target (y) data.
+        X may also be a torch Dataset yielding (window, label) pairs, e.g. a WindowDataset, in which case
+        windows are only materialized one batch at a time and y is ignored. An IterableDataset that yields whole
+        (windows, labels) batches, e.g. a StreamingWindowDataset, is streamed as is, with `num_workers` processes
+        prefetching batches; its `set_epoch` is called before every epoch so it can reshuffle.
+
+        Early stopping follows the validation loss: from `validation_data` if given, otherwise from a time-ordered
+        split of X. Streamed datasets are not split, so without `validation_data` they fall back to the training loss.
+        Improved weights and a full training-state checkpoint (model, Adam state, epoch, best loss, RNG states)
+        are written atomically by a background thread after every epoch, and training resumes from the latter.
+
+        Args:
+            X (np.array or Dataset): Input windows, or a dataset of (window, label) pairs.
+            y (np.array, optional): Labels of shape (samples, outputs) when X is an array, one column per model
+                output (e.g. per horizon); all outputs are trained together under one MSE loss.
+            validation_data (Dataset or tuple, optional): Held-out dataset or (X_val, y_val) arrays.
 
-        dataset = TensorDataset(X, y)
-        data_loader = DataLoader(dataset, batch_size=self.batch_size, shuffle=True)
+        Returns:
+            int: Number of epochs run before early stopping, the time budget or the epoch limit.
+        """
+        if isinstance(X, (Dataset, IterableDataset)):
+            dataset = X
+        else:
+            X = torch.tensor(X, dtype=torch.float32).to(self.device)
+            y = torch.tensor(y, dtype=torch.float32).to(self.device)  # Float type for regression
+            dataset = TensorDataset(X, y)
+
+        if isinstance(validation_data, tuple):
+            X_val, y_val = validation_data
+            validation_data = TensorDataset(torch.as_tensor(X_val, dtype=torch.float32),
+                                            torch.as_tensor(y_val, dtype=torch.float32))
+        elif validation_data is None and not isinstance(dataset, IterableDataset) and self.validation_split > 0:
+            dataset, validation_data = self.split_validation(dataset)
+
+        if isinstance(dataset, IterableDataset):
+            data_loader = DataLoader(dataset, batch_size=None, num_workers=self.num_workers,
+                                     pin_memory=self.device.type == 'cuda',
+                                     prefetch_factor=2 if self.num_workers > 0 else None)
+        else:
+            data_loader = DataLoader(dataset, batch_size=self.batch_size, shuffle=True, num_workers=self.num_workers)
+
+        # Validation needs no gradients, so it runs in larger batches
+        val_loader = None
+        if validation_data is not None:
+            val_loader = DataLoader(validation_data, batch_size=self.batch_size * 8)
 
         best_loss = float('inf')
-        patience = 5  # Early stopping patience
+        best_model = None
         counter = 0
+        epochs_run = 0
+        elapsed = 0.0
 
-        for epoch in range(self.epochs):
-            epoch_loss = 0.0
-            for batch_X, batch_y in data_loader:
-                self.optimizer.zero_grad()
+        state = self.load_training_state() if self.resume else None
+        if state is not None:
+            best_loss, best_model, counter = state['best_loss'], state['best_model'], state['counter']
+            epochs_run, elapsed = state['epoch'], state['elapsed']
+
+        checkpoint_writer = CheckpointWriter()
+        train_start = time.perf_counter() - elapsed  # The time budget covers earlier runs of a resumed training
+        epoch_time = 0.0
+
+        try:
+            for epoch in range(epochs_run, self.epochs):
+                if counter >= self.patience:
+                    break  # Resumed after the run had already stopped early
+
+                if self.max_time is not None and time.perf_counter() - train_start + epoch_time > self.max_time:
+                    print(f"Time budget of {self.max_time:.0f}s reached after {epoch} epochs")
+                    break
+
+                if hasattr(dataset, 'set_epoch'):
+                    dataset.set_epoch(epoch)
+
+                self.model.train()
+                epoch_loss = 0.0
+                num_batches = 0
+                num_samples = 0
+                epoch_start = time.perf_counter()
+                for batch_X, batch_y in data_loader:
+                    batch_X, batch_y = batch_X.to(self.device), batch_y.to(self.device)
+                    self.optimizer.zero_grad()
+
+                    # Optionally add noise to input for regularization
+                    noisy_batch_X = self.add_noise(batch_X)
+
+                    output = self.model(noisy_batch_X)
+                    loss = self.criterion(output, batch_y)  # MSELoss for regression
+                    loss.backward()
+                    self.optimizer.step()
+                    epoch_loss += loss.item()
+                    num_batches += 1
+                    num_samples += batch_X.shape[0]
+
+                avg_epoch_loss = epoch_loss / max(num_batches, 1)
+                samples_per_sec = num_samples / max(time.perf_counter() - epoch_start, 1e-9)
 
-                # Optionally add noise to input for regularization
-                noisy_batch_X = self.add_noise(batch_X)
+                if val_loader is not None:
+                    monitored_loss = self.evaluate(val_loader)
+                    print(f"Epoch [{epoch+1}/{self.epochs}], Loss: {avg_epoch_loss:.4f}, "
+                          f"Val Loss: {monitored_loss:.4f}, {samples_per_sec:.0f} samples/sec")
+                else:
+                    monitored_loss = avg_epoch_loss
+                    print(f"Epoch [{epoch+1}/{self.epochs}], Loss: {avg_epoch_loss:.4f}, "
+                          f"{samples_per_sec:.0f} samples/sec")
+                epoch_time = time.perf_counter() - epoch_start
+                epochs_run = epoch + 1
 
-                output = self.model(noisy_batch_X)
-                loss = self.criterion(output, batch_y)  # MSELoss for regression
-                loss.backward()
-                self.optimizer.step()
-                epoch_loss += loss.item()
+                # Early stopping logic
+                if monitored_loss < best_loss:
+                    best_loss = monitored_loss
+                    counter = 0
+                    best_model = snapshot(self.model.state_dict())
+                    checkpoint_writer.save(best_model, self.model_save_path)
+                else:
+                    counter += 1
 
-            avg_epoch_loss = epoch_loss / len(data_loader)
+                checkpoint_writer.save(self.training_state(epochs_run, best_loss, best_model, counter,
+                                                           time.perf_counter() - train_start), self.checkpoint_path)
 
-            print(f"Epoch [{epoch+1}/{self.epochs}], Loss: {avg_epoch_loss:.4f}")
+                if counter >= self.patience:
+                    print(f"Early stopping triggered at epoch {epoch + 1}")
+                    break
+        finally:
+            checkpoint_writer.close()
 
-            # Early stopping logic
-            if avg_epoch_loss < best_loss:
-                best_loss = avg_epoch_loss
-                counter = 0
-                torch.save(self.model.state_dict(), self.model_save_path)
-            else:
-                counter += 1
+        # The weight file may predate a resumed run, so the best weights are always written before the training state
+        # that holds them is removed
+        if best_model is not None:
+            atomic_save(best_model, self.model_save_path)
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
 
-            if counter >= patience:
-                print(f"Early stopping triggered at epoch {epoch + 1}")
-                break
+        return epochs_run
@@ -0,0 +1,130 @@
+import glob
+import json
+import os
+import struct
+import numpy as np
+import torch
+from models.transformer.registry import load_model_metadata
+
+MAGIC = b"STWPACK1"
+ALIGNMENT = 64
+
+
+class WeightPack:
+    def __init__(self, path):
+        """
+        Read-only view of a weight pack: every ticker's state dict and architecture metadata in one indexed file.
+
+        Layout: 8-byte magic, 8-byte little-endian header length, JSON header, then the raw tensor bytes,
+        each tensor aligned to 64 bytes. The header maps each ticker to its config and to the dtype, shape
+        and offset of each tensor. The data section is memory-mapped, so a tensor's pages are only read
+        from disk when it is first accessed.
+
+        Args:
+            path (str): Path to the pack file.
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a weight pack.")
+            (header_size,) = struct.unpack("<Q", f.read(8))
+            self.header = json.loads(f.read(header_size))
+
+        # Copy-on-write mapping gives writable arrays for torch without ever touching the file
+        self._data = np.memmap(path, dtype=np.uint8, mode='c')
+        self._state_dicts = {}
+
+    @property
+    def tickers(self):
+        return list(self.header["models"])
+
+    def __contains__(self, ticker):
+        return ticker in self.header["models"]
+
+    def config(self, ticker):
+        """ Returns the architecture parameters (keyword arguments for TransformerModel) of a ticker's model. """
+        if ticker not in self:
+            raise KeyError(f"No weights for {ticker} in {self.path}.")
+        return dict(self.header["models"][ticker]["config"])
+
+    def state_dict(self, ticker):
+        """ Returns a ticker's state dict as tensors backed by the memory-mapped file. """
+        if ticker not in self:
+            raise KeyError(f"No weights for {ticker} in {self.path}.")
+
+        if ticker not in self._state_dicts:
+            state_dict = {}
+            for name, entry in self.header["models"][ticker]["tensors"].items():
+                start = self.header["data_offset"] + entry["offset"]
+                buffer = self._data[start:start + entry["nbytes"]]
+                array = buffer.view(np.dtype(entry["dtype"])).reshape(entry["shape"])
+                state_dict[name] = torch.from_numpy(array)
+            self._state_dicts[ticker] = state_dict
+        return self._state_dicts[ticker]
+
+    @staticmethod
+    def build(out_path, model_paths):
+        """
+        Writes a weight pack from per-ticker weight files.
+
+        Args:
+            out_path (str): Path of the pack to write.
+            model_paths (dict): Maps each ticker to its `.pth` state dict.
+        """
+        models = {}
+        blobs = []
+        offset = 0
+        for ticker, model_path in model_paths.items():
+            state_dict = torch.load(model_path, map_location='cpu', weights_only=True)
+            tensors = {}
+            for name, tensor in state_dict.items():
+                array = np.ascontiguousarray(tensor.numpy())
+                padding = -offset % ALIGNMENT
+                blobs.append(b"\0" * padding)
+                offset += padding
+
+                tensors[name] = dict(dtype=array.dtype.str, shape=list(array.shape), offset=offset,
+                                     nbytes=array.nbytes)
+                blobs.append(array.tobytes())
+                offset += array.nbytes
+            models[ticker] = dict(config=load_model_metadata(model_path, state_dict), tensors=tensors)
+
+        # The data offset depends on the header size, so it is fixed up after serializing once
+        header = dict(models=models, data_offset=0)
+        prefix_size = len(MAGIC) + 8
+        header_bytes = json.dumps(header).encode()
+        data_offset = prefix_size + len(header_bytes) + 32
+        data_offset += -data_offset % ALIGNMENT
+        header["data_offset"] = data_offset
+        header_bytes = json.dumps(header).encode().ljust(data_offset - prefix_size)
+
+        tmp_path = out_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<Q", len(header_bytes)))
+            f.write(header_bytes)
+            for blob in blobs:
+                f.write(blob)
+        os.replace(tmp_path, out_path)
+
+    @classmethod
+    def build_from_dir(cls, weights_dir="weights/transformer", out_path="weights/transformer.pack",
+                       suffix="_model.pth"):
+        """
+        Packs every `{ticker}{suffix}` file in a directory.
+
+        Returns:
+            WeightPack: The pack that was written.
+        """
+        model_paths = {}
+        for model_path in sorted(glob.glob(os.path.join(weights_dir, f"*{suffix}"))):
+            ticker = os.path.basename(model_path)[:-len(suffix)]
+            model_paths[ticker] = model_path
+
+        cls.build(out_path, model_paths)
+        print(f"Packed {len(model_paths)} models into {out_path}.")
+        return cls(out_path)
+
+
+if __name__ == "__main__":
+    WeightPack.build_from_dir()
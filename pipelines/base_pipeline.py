@@ -1,10 +1,14 @@
+import os
 from abc import ABC, abstractmethod
+import pandas as pd
 from data.fetcher import StockDataFetcher
 from connection.client import APIConnection
+from data.processor.dense import BAR_FEATURES
 
 
 class BasePipeline(ABC):
-    def __init__(self, start_date, end_date, window_size, pred_days, ticker=None):
+    def __init__(self, start_date, end_date, window_size, pred_days, ticker=None, bar_cache=None,
+                 processor_state_dir=None):
         """
         Base Pipeline class for shared functionality.
 
@@ -14,6 +18,9 @@ class BasePipeline(ABC):
             window_size (int): Number of days to consider for training.
             pred_days (int): Days ahead to predict.
             ticker (str or list): Ticker symbol or list of ticker symbols.
+            bar_cache (BarCache, optional): On-disk bar store to serve repeat fetches from.
+            processor_state_dir (str, optional): Directory for incremental preprocessing state. Later runs then
+                fetch and preprocess only the days after the last stored one.
         """
         self.api_connection = APIConnection()
 
@@ -29,19 +36,22 @@ class BasePipeline(ABC):
         self.end_date = end_date
         self.window_size = window_size
         self.pred_days = pred_days
+        self.bar_cache = bar_cache
+        self.processor_state_dir = processor_state_dir
+        self.data_processor = None  # Processor of the last preprocessing, holding its feature statistics
 
-    def fetch_and_preprocess_data(self, processor_class):
+    def fetch_data(self, start_date=None):
         """
-        Fetches and preprocesses stock data for the provided tickers using the processor class.
+        Fetches stock data for the provided tickers.
 
         Args:
-            processor_class: Processor class to handle the data preprocessing.
+            start_date (str, optional): Fetch from this date instead of the pipeline's start date.
 
         Returns:
-            Preprocessed data.
+            pd.DataFrame: Bars for all tickers.
         """
-        # Fetch stock data
-        data_fetcher = StockDataFetcher(self.api_connection, start_date=self.start_date, end_date=self.end_date)
+        data_fetcher = StockDataFetcher(self.api_connection, start_date=start_date or self.start_date,
+                                        end_date=self.end_date, cache=self.bar_cache)
         stock_data = data_fetcher.fetch_data(self.tickers)
 
         # Check if data is empty or incomplete
@@ -49,10 +59,53 @@ class BasePipeline(ABC):
             raise ValueError(
                 f"Fetched data for tickers {self.tickers} is empty. Please check the stock symbol(s) or date range."
             )
+        return stock_data
+
+    def fetch_and_preprocess_data(self, processor_class, **processor_kwargs):
+        """
+        Fetches and preprocesses stock data for the provided tickers using the processor class.
+
+        Args:
+            processor_class: Processor class to handle the data preprocessing.
+            **processor_kwargs: Extra keyword arguments for the processor, e.g. horizons.
+
+        Returns:
+            Preprocessed data.
+        """
+        data_processor = processor_class(window_size=self.window_size, pred_days=self.pred_days, **processor_kwargs)
+
+        if self.processor_state_dir is None:
+            # Fetch stock data and preprocess it from scratch
+            stock_data = self.fetch_data()
+            preprocessed_data = data_processor.preprocess(stock_data, self.tickers)
+        else:
+            # Only fetch the days after the ones already in the processor state
+            state_dir = os.path.join(self.processor_state_dir, processor_class.__name__)
+            state = data_processor.open_state(state_dir, self.tickers, len(BAR_FEATURES) * len(self.tickers),
+                                              self.start_date)
+            start_date = None
+            if state.last_timestamp is not None:
+                start_date = (state.last_timestamp + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+
+            stock_data = None
+            if start_date is not None and start_date > self.end_date:
+                print("No new days for the processor state: the end date is already covered.")
+            else:
+                try:
+                    stock_data = self.fetch_data(start_date=start_date)
+                except ValueError as e:
+                    if state.num_days == 0:
+                        raise
+                    print(f"No new days for the processor state: {e}")
+
+            if stock_data is None:
+                preprocessed_data = data_processor.preprocess_state(state, self.tickers)
+            else:
+                preprocessed_data = data_processor.preprocess_incremental(stock_data, self.tickers, state_dir,
+                                                                          self.start_date)
 
-        # Preprocess the data
-        data_processor = processor_class(window_size=self.window_size, pred_days=self.pred_days)
-        preprocessed_data = data_processor.preprocess(stock_data, self.tickers)
+        # Kept for the feature statistics of what was preprocessed, used for input normalization
+        self.data_processor = data_processor
 
         if not preprocessed_data:
             raise ValueError("Preprocessed data is empty. Check if there are valid trading days in the given range.")
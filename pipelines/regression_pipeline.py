@@ -4,11 +4,12 @@ from pipelines.base_pipeline import BasePipeline
 
 
 class RegressionPipeline(BasePipeline):
-    def __init__(self, start_date, end_date, window_size, pred_days, ticker=None):
+    def __init__(self, start_date, end_date, window_size, pred_days, ticker=None, bar_cache=None,
+                 processor_state_dir=None):
         """
         Initializes the Regression Pipeline.
         """
-        super().__init__(start_date, end_date, window_size, pred_days, ticker)
+        super().__init__(start_date, end_date, window_size, pred_days, ticker, bar_cache, processor_state_dir)
         self.regression_model = None
 
     def train_model(self):
@@ -0,0 +1,106 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import torch
+
+
+def _init_worker(threads_per_worker):
+    """ Caps torch's thread pools so concurrent workers don't oversubscribe the cores. """
+    torch.set_num_threads(threads_per_worker)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # Already set in this process
+
+
+def _run_job(job_fn, ticker, job_kwargs):
+    """ Runs one ticker's job and reports its outcome instead of raising, so one failure can't stop the batch. """
+    start = time.perf_counter()
+    try:
+        epochs = job_fn(ticker, **job_kwargs)
+        status, error = "completed", None
+    except Exception as e:
+        epochs, status, error = None, "failed", f"{type(e).__name__}: {e}"
+    return dict(ticker=ticker, status=status, epochs=epochs, wall_time=time.perf_counter() - start, error=error)
+
+
+class TrainingScheduler:
+    def __init__(self, job_fn, max_workers=None, threads_per_worker=1, is_complete=None):
+        """
+        Runs per-ticker training jobs on a process pool.
+
+        Args:
+            job_fn (callable): Module-level function called as `job_fn(ticker, **job_kwargs)`; it may return the
+                number of epochs it ran.
+            max_workers (int, optional): Number of worker processes (default: cores // threads_per_worker).
+            threads_per_worker (int): Torch intra-op threads per worker.
+            is_complete (callable, optional): `is_complete(ticker)` returns True if the ticker already has a
+                complete checkpoint, in which case it is skipped. This lets a crashed batch resume.
+        """
+        self.job_fn = job_fn
+        self.threads_per_worker = threads_per_worker
+        self.max_workers = max_workers or max(1, (os.cpu_count() or 1) // threads_per_worker)
+        self.is_complete = is_complete
+
+    def run(self, tickers, **job_kwargs):
+        """
+        Trains every ticker that doesn't have a complete checkpoint yet.
+
+        Args:
+            tickers (list): Ticker symbols to train.
+            **job_kwargs: Keyword arguments passed to every job.
+
+        Returns:
+            list: One dict per ticker with ticker, status ('completed', 'failed' or 'skipped'), epochs,
+                wall_time and error.
+        """
+        results = []
+        pending = []
+        for ticker in tickers:
+            if self.is_complete is not None and self.is_complete(ticker):
+                print(f"Skipping {ticker}: checkpoint already complete.")
+                results.append(dict(ticker=ticker, status="skipped", epochs=None, wall_time=0.0, error=None))
+            else:
+                pending.append(ticker)
+
+        # Spawn rather than fork: forking after torch has started its thread pools can deadlock
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(self.threads_per_worker,)) as executor:
+            futures = {executor.submit(_run_job, self.job_fn, ticker, job_kwargs): ticker for ticker in pending}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # The worker process itself died (e.g. out of memory)
+                    result = dict(ticker=futures[future], status="failed", epochs=None, wall_time=None,
+                                  error=f"{type(e).__name__}: {e}")
+                print(self.format_result(result))
+                results.append(result)
+
+        order = {ticker: i for i, ticker in enumerate(tickers)}
+        results.sort(key=lambda result: order[result["ticker"]])
+        self.print_summary(results)
+        return results
+
+    @staticmethod
+    def format_result(result):
+        line = f"{result['ticker']}: {result['status']}"
+        if result["wall_time"]:
+            line += f" in {result['wall_time']:.1f}s"
+        if result["epochs"] is not None:
+            line += f", {result['epochs']} epochs"
+        if result["error"]:
+            line += f" ({result['error']})"
+        return line
+
+    @staticmethod
+    def print_summary(results):
+        counts = {}
+        for result in results:
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+        total_time = sum(result["wall_time"] or 0.0 for result in results)
+        print(f"Scheduled {len(results)} tickers: "
+              + ", ".join(f"{count} {status}" for status, count in counts.items())
+              + f", {total_time:.1f}s of job time.")
@@ -1,20 +1,130 @@
+import json
+import os
+import numpy as np
+from data.calendar import default_calendar
 from models.transformer.model import TransformerModel
-from models.transformer.trainer import Trainer
-from models.transformer.inference import Inference
-from utils.model_size import verify_labels
+from models.transformer.trainer import Trainer, split_sizes
+from models.transformer.grouped_trainer import GroupedTrainer
+from models.transformer.inference import Inference, StackedModels
+from models.transformer.registry import ModelRegistry, load_model_settings, save_model_metadata
+from data.processor.features import RAW_SCHEMA
+from data.processor.normalization import RunningStats
+from utils.model_size import format_plan, plan_transformer_shape, verify_labels
 from data.processor.processors import TransformerProcessor as StockDataTransformerProcessor
+from data.feature_store import StreamingWindowDataset
+from data.processor.windows import WindowDataset, window_rows
 from pipelines.base_pipeline import BasePipeline
 
 
+def training_settings(start_date, end_date, window_size, horizons, label_target='high_open',
+                      label_normalization='minmax', feature_schema=None, normalize_inputs=True, shape_budget=None):
+    """
+    The data, label and architecture settings a Transformer is trained with, in their JSON form so they compare
+    equal to the ones stored with a checkpoint.
+
+    Returns:
+        dict: start_date, end_date, window_size, horizons, target, normalization, features, normalize_inputs and
+        shape_budget.
+    """
+    schema = feature_schema if feature_schema is not None else RAW_SCHEMA
+    settings = dict(start_date=str(start_date), end_date=str(end_date), window_size=int(window_size),
+                    horizons=[int(h) for h in horizons], target=label_target, normalization=label_normalization,
+                    features=list(schema.features), normalize_inputs=bool(normalize_inputs),
+                    shape_budget=dict(shape_budget or {}))
+    return json.loads(json.dumps(settings))
+
+
 class TransformerPipeline(BasePipeline):
-    def __init__(self, start_date, end_date, window_size, pred_days, ticker=None, model_save_path="stock_model.pth"):
+    def __init__(self, start_date, end_date, window_size, pred_days, ticker=None, model_save_path="stock_model.pth",
+                 bar_cache=None, model_registry=None, inference_backend='eager',
+                 processor_state_dir=None, horizons=None, label_target='high_open', label_normalization='minmax',
+                 feature_schema=None, normalize_inputs=True, shape_budget=None):
         """
         Initializes the Transformer Pipeline.
+        Pass a shared ModelRegistry to keep loaded models warm across pipelines, and an inference backend
+        ('eager', 'int8' or 'traced', see Inference) to pick the fastest mode for the host.
+        Pass `horizons`, e.g. [1, 3, 5], to label and train every horizon at once with one output per horizon
+        (default: [pred_days]). `label_target` and `label_normalization` pick label definitions registered in
+        data.processor.labels, and `feature_schema` (FeatureSchema) the model's input features. With
+        `normalize_inputs`, trained models standardize their inputs with per-ticker, per-feature statistics of the
+        training days (without the validation tail), which are stored with the weights as buffers. Model shapes are
+        picked by a compute-aware planner under `shape_budget` (max_flops, max_params, max_memory_mb, ... of
+        utils.model_size.plan_transformer_shape), and the plan and its estimated cost are recorded in the metadata.
         """
-        super().__init__(start_date, end_date, window_size, pred_days, ticker)
+        super().__init__(start_date, end_date, window_size, pred_days, ticker, bar_cache, processor_state_dir)
         self.model_save_path = model_save_path
+        self.model_registry = model_registry if model_registry is not None else ModelRegistry()
+        self.inference_backend = inference_backend
+        self.horizons = list(horizons) if horizons else [pred_days]
+        self.shape_budget = dict(shape_budget or {})
+        self.processor_options = dict(horizons=self.horizons, target=label_target, normalization=label_normalization,
+                                      feature_schema=feature_schema, shape_budget=self.shape_budget)
+        self.normalize_inputs = normalize_inputs
+        self.stacked_models = {}  # Architecture -> StackedModels of the last predict_latest, reused while unchanged
+        self.settings = training_settings(start_date, end_date, window_size, self.horizons, label_target,
+                                          label_normalization, feature_schema, normalize_inputs, self.shape_budget)
+
+    @property
+    def validation_gap(self):
+        """ Samples between the training and validation split so no training label reaches a validation window. """
+        return self.window_size + max(self.horizons)
+
+    @staticmethod
+    def match_input_size(X, input_size):
+        """
+        Zero-pads the feature axis of X up to the input size the model was built with.
+        """
+        if X.shape[-1] > input_size:
+            raise ValueError(f"Input has {X.shape[-1]} features but the model expects {input_size}.")
+        if X.shape[-1] < input_size:
+            X = np.pad(X, ((0, 0), (0, 0), (0, input_size - X.shape[-1])), 'constant')
+        return X
 
-    def train_model(self, learning_rate=0.001, batch_size=32, epochs=50):
+    def build_model(self, input_size, num_outputs, stats=None):
+        """
+        Builds a TransformerModel in the shape the planner picks under the pipeline's shape budget and, if given,
+        sets its input scaling from `stats` (see set_input_scaling).
+
+        Returns:
+            tuple: (model, config), config holding the architecture parameters and the shape plan to save as metadata.
+        """
+        plan = plan_transformer_shape(input_size, self.window_size, num_outputs, **self.shape_budget)
+        print(f"Transformer shape: {format_plan(plan)}")
+
+        config = dict(input_size=plan['input_size'], num_heads=plan['num_heads'], num_layers=plan['num_layers'],
+                      hidden_dim=plan['hidden_dim'], dim_feedforward=plan['dim_feedforward'], num_outputs=num_outputs,
+                      normalize=self.normalize_inputs)
+        model = TransformerModel(**config)
+        if stats is not None:
+            self.set_input_scaling(model, stats)
+        return model, dict(config, plan=dict(plan, window_size=self.window_size, budget=self.shape_budget))
+
+    def set_input_scaling(self, model, stats):
+        """ Sets the model's input scaling from the statistics of its training rows, if inputs are normalized. """
+        if self.normalize_inputs:
+            model.set_normalization(*stats.scale())
+
+    def check_model_inputs(self, name, config, settings=None):
+        """
+        Raises a ValueError if a model was trained on other input features than the pipeline's feature schema builds,
+        or its stored input statistics are for another number of features.
+
+        Args:
+            name (str): Ticker or weight path, for the error message.
+            config (dict): The model's architecture parameters.
+            settings (dict, optional): Training settings stored with the model (see training_settings); models saved
+                without them are only checked against their statistics.
+        """
+        features = self.settings['features']
+        trained = (settings or {}).get('features')
+        if trained is not None and trained != features:
+            raise ValueError(f"The model of {name} was trained on features {trained}, but the pipeline's feature "
+                             f"schema builds {features}. Predict with the schema it was trained with.")
+        if config.get('normalize') and config['input_size'] != len(features):
+            raise ValueError(f"The model of {name} stores input statistics for {config['input_size']} features, but "
+                             f"the pipeline's feature schema builds {len(features)}.")
+
+    def train_model(self, learning_rate=0.001, batch_size=32, epochs=50, max_time=None):
         """
         Trains the Transformer model on the preprocessed data.
 
@@ -22,39 +132,285 @@ class TransformerPipeline(BasePipeline):
             learning_rate (float): Learning rate for training.
             batch_size (int): Batch size for training.
             epochs (int): Number of epochs to train.
+            max_time (float, optional): Wall-clock training budget in seconds.
+
+        Returns:
+            int: Number of epochs run.
         """
-        X, y, tickers, input_size, num_heads, hidden_dim = self.fetch_and_preprocess_data(StockDataTransformerProcessor)
+        X, y, tickers, input_size, _, _ = self.fetch_and_preprocess_data(
+            StockDataTransformerProcessor, **self.processor_options)
 
         # Verify the labels
         verify_labels(y)
 
-        # Initialize the model
-        model = TransformerModel(input_size=input_size, num_heads=num_heads, num_layers=4, hidden_dim=hidden_dim)
+        # Initialize the model with one output per label column (horizon and ticker)
+        model, config = self.build_model(input_size, y.shape[1])
 
         # Initialize the trainer
         trainer = Trainer(model=model, learning_rate=learning_rate, batch_size=batch_size, epochs=epochs,
-                          model_save_path=self.model_save_path)
+                          model_save_path=self.model_save_path, max_time=max_time, gap=self.validation_gap,
+                          fingerprint=dict(self.settings, tickers=tickers, model=config))
+
+        # Scale inputs by the statistics of the days the training windows cover, leaving out the validation tail
+        if self.normalize_inputs:
+            num_train, _ = trainer.split_sizes(len(X), self.validation_gap)
+            self.set_input_scaling(model, self.data_processor.training_stats(num_train + X.shape[1] - 1))
+
+        # Train the model on windows served from the day rows, so only one batch of windows is materialized at a time
+        epochs_run = trainer.train(WindowDataset(window_rows(X), X.shape[1], y))
+
+        # Record the architecture so inference can rebuild the model without refetching data
+        save_model_metadata(self.model_save_path, settings=self.settings, **config)
+        return epochs_run
+
+    def train_grouped(self, learning_rate=0.001, batch_size=32, epochs=50,
+                      model_path_template="weights/transformer/{ticker}_model.pth", max_time=None):
+        """
+        Trains one model per ticker, stacking same-shaped tickers into a GroupedTrainer so they train together.
+        Each group is split, checkpointed and fingerprinted like a `train_model` run.
+
+        Args:
+            learning_rate (float): Learning rate for training.
+            batch_size (int): Batch size for training.
+            epochs (int): Number of epochs to train.
+            model_path_template (str): Weight path per ticker, formatted with `ticker`.
+            max_time (float, optional): Wall-clock training budget per group in seconds.
+
+        Returns:
+            dict: Number of epochs run for each trained ticker.
+        """
+        stock_data = self.fetch_data()
+
+        data_processor = StockDataTransformerProcessor(window_size=self.window_size, pred_days=self.pred_days,
+                                                       **self.processor_options)
+        processed = data_processor.preprocess_batch(stock_data, self.tickers)
+        print("Data preprocessing complete.")
+
+        # Tickers can only share a stack if their inputs and architectures match
+        groups = {}
+        for ticker, (X, y, input_size, num_heads, hidden_dim) in processed.items():
+            groups.setdefault((X.shape, y.shape, input_size, num_heads, hidden_dim), []).append(ticker)
+
+        epochs_run = {}
+        for (_, y_shape, input_size, num_heads, hidden_dim), group in groups.items():
+            print(f"Training {len(group)} tickers together: {group}")
+            # Day rows rather than windows: the trainer gathers each batch's windows from them
+            rows = np.stack([window_rows(processed[ticker][0]) for ticker in group])
+
+            # Every ticker's model is scaled by the statistics of its own training days, without the validation tail
+            num_train, _ = split_sizes(y_shape[0], self.validation_gap)
+            built = [self.build_model(input_size, y_shape[1],
+                                      RunningStats.from_rows(ticker_rows[:num_train + self.window_size - 1])
+                                      if self.normalize_inputs else None)
+                     for ticker_rows in rows]
+            models = [model for model, _ in built]
+            model_paths = [model_path_template.format(ticker=ticker) for ticker in group]
+
+            trainer = GroupedTrainer(models=models, learning_rate=learning_rate, batch_size=batch_size, epochs=epochs,
+                                     model_save_paths=model_paths, gap=self.validation_gap, max_time=max_time,
+                                     fingerprint=dict(self.settings, tickers=group, model=built[0][1]))
+            y = np.stack([processed[ticker][1] for ticker in group])
+            group_epochs = trainer.train(rows, y, window_size=self.window_size)
+
+            for ticker, model_path, (_, config), ticker_epochs in zip(group, model_paths, built, group_epochs):
+                epochs_run[ticker] = ticker_epochs
+                if ticker_epochs == 0:
+                    # Not trained (time budget), so the ticker must not count as complete for these settings
+                    continue
+                save_model_metadata(model_path, settings=self.settings, **config)
+
+        return epochs_run
 
-        # Train the model
-        trainer.train(X, y)
+    def train_from_store(self, feature_store, learning_rate=0.001, batch_size=32, epochs=50,
+                         model_path_template="weights/transformer/{ticker}_model.pth", streaming=False, num_workers=0,
+                         max_time=None):
+        """
+        Trains one model per ticker on windows read from a FeatureStore instead of freshly fetched data.
+        The processor reads one ticker's windows and labels from the store at a time (see preprocess_store), so the
+        universe never has to fit in RAM. With `streaming`, shuffled batches of raw bar windows are read shard by
+        shard through a StreamingWindowDataset instead, prefetched by `num_workers` DataLoader workers.
+
+        Args:
+            feature_store (FeatureStore): Disk-backed dense feature store covering the tickers.
+            learning_rate (float): Learning rate for training.
+            batch_size (int): Batch size for training.
+            epochs (int): Number of epochs to train.
+            model_path_template (str): Weight path per ticker, formatted with `ticker`.
+            streaming (bool): Stream shuffled shard batches instead of sampling single windows.
+            num_workers (int): DataLoader worker processes prefetching batches.
+            max_time (float, optional): Wall-clock training budget per ticker in seconds.
+
+        Returns:
+            dict: Number of epochs run for each trained ticker.
+        """
+        data_processor = StockDataTransformerProcessor(window_size=self.window_size, pred_days=self.pred_days,
+                                                       **self.processor_options)
+        if streaming and not data_processor.feature_schema.is_raw:
+            raise ValueError("Streamed feature store batches serve raw bar columns; train with the default feature "
+                             "schema or without streaming.")
+
+        epochs_run = {}
+        for ticker in self.tickers:
+            if streaming:
+                if ticker not in feature_store.ticker_index:
+                    print(f"Ticker {ticker} is not in the feature store. Skipping.")
+                    continue
+                dataset = StreamingWindowDataset(feature_store, self.window_size, self.horizons, batch_size, [ticker],
+                                                 target=data_processor.target,
+                                                 normalization=data_processor.normalization)
+                if dataset.num_samples == 0:
+                    print(f"No valid sequences for ticker {ticker}. Skipping.")
+                    continue
+
+                # Architecture from the shape of a single window view
+                _, input_size, _, _ = data_processor.adjust_for_transformer(
+                    feature_store.windows(ticker, self.window_size, 1), len(self.horizons))
+                dataset.input_size = input_size
+                rows = feature_store.ticker_values(ticker)
+            else:
+                processed = data_processor.preprocess_store(feature_store, [ticker])
+                if ticker not in processed:
+                    continue
+                X, y, input_size, _, _ = processed[ticker]
+                rows = window_rows(X)
+                dataset = WindowDataset(rows, self.window_size, y)
+
+            model_path = model_path_template.format(ticker=ticker)
+            model, config = self.build_model(input_size, len(self.horizons))
+            trainer = Trainer(model=model, learning_rate=learning_rate, batch_size=batch_size, epochs=epochs,
+                              model_save_path=model_path, num_workers=num_workers, max_time=max_time,
+                              gap=self.validation_gap,
+                              fingerprint=dict(self.settings, tickers=[ticker], model=config, streaming=streaming))
+
+            # Scale inputs by the rows of the training windows; streamed datasets are not split
+            if self.normalize_inputs:
+                num_train = (dataset.num_samples if streaming
+                             else trainer.split_sizes(len(dataset), self.validation_gap)[0])
+                self.set_input_scaling(model, RunningStats.from_rows(rows[:num_train + self.window_size - 1]))
+            epochs_run[ticker] = trainer.train(dataset)
+
+            save_model_metadata(model_path, settings=self.settings, **config)
+
+        return epochs_run
 
     def predict(self):
         """
         Runs the prediction using the trained Transformer model.
         """
-        X, _, tickers, input_size, num_heads, hidden_dim = self.fetch_and_preprocess_data(StockDataTransformerProcessor)
+        X, _, tickers, _, _, _ = self.fetch_and_preprocess_data(StockDataTransformerProcessor,
+                                                                **self.processor_options)
 
-        # Initialize the model
-        model = TransformerModel(input_size=input_size, num_heads=num_heads, num_layers=4, hidden_dim=hidden_dim)
+        # Get the loaded model; its architecture comes from the stored metadata
+        model, config = self.model_registry.get(self.model_save_path)
 
         # Initialize the inference engine
-        inference_engine = Inference(model=model, model_path=self.model_save_path)
+        inference_engine = Inference(model=model, backend=self.inference_backend)
 
         # Perform inference and get the predictions
-        predictions = inference_engine.predict(X)
+        predictions = inference_engine.predict(self.match_input_size(X, config['input_size']))
 
         # Display predictions
         for i, pred in enumerate(predictions):
             print(f"Prediction for day {i + 1}: Predicted Value: {pred}")
 
         return predictions
+
+    def predict_batch(self, model_path_template="weights/transformer/{ticker}_model.pth", weight_pack=None):
+        """
+        Runs every ticker's Transformer model after a single fetch and a single preprocessing pass.
+
+        Args:
+            model_path_template (str): Weight path per ticker, formatted with `ticker`.
+            weight_pack (WeightPack, optional): Load weights from this pack instead of per-ticker files.
+
+        Returns:
+            dict: Maps each ticker to its array of predictions (tickers without data or weights are left out).
+        """
+        stock_data = self.fetch_data()
+
+        data_processor = StockDataTransformerProcessor(window_size=self.window_size, pred_days=self.pred_days,
+                                                       **self.processor_options)
+        processed = data_processor.preprocess_batch(stock_data, self.tickers)
+        print("Data preprocessing complete.")
+
+        predictions = {}
+        for ticker, (X, _, _, _, _) in processed.items():
+            if weight_pack is not None:
+                if ticker not in weight_pack:
+                    print(f"No weights found for {ticker} in {weight_pack.path}. Skipping.")
+                    continue
+                model, config = self.model_registry.get(ticker, weight_pack)
+            else:
+                model_path = model_path_template.format(ticker=ticker)
+                if not os.path.exists(model_path):
+                    print(f"No weights found for {ticker} at {model_path}. Skipping.")
+                    continue
+                model, config = self.model_registry.get(model_path)
+
+            inference_engine = Inference(model=model, backend=self.inference_backend)
+            predictions[ticker] = inference_engine.predict(self.match_input_size(X, config['input_size']))
+
+        print(self.model_registry)
+        return predictions
+
+    def predict_latest(self, model_path_template="weights/transformer/{ticker}_model.pth", weight_pack=None,
+                       history_margin=2):
+        """
+        Scores only the most recent window of every ticker. Just the last `window_size` sessions before the end date
+        (plus the feature schema's lookback, and `history_margin` in case the latest bar is not published yet) are
+        fetched, and all tickers whose models share an architecture run in one vmapped forward pass.
+
+        Args:
+            model_path_template (str): Weight path per ticker, formatted with `ticker`.
+            weight_pack (WeightPack, optional): Load weights from this pack instead of per-ticker files.
+            history_margin (int): Extra sessions fetched beyond the window.
+
+        Returns:
+            dict: Maps each ticker to its prediction, shape (1, outputs) (tickers without data or weights are left out).
+        """
+        data_processor = StockDataTransformerProcessor(window_size=self.window_size, pred_days=self.pred_days,
+                                                       **self.processor_options)
+        history = self.window_size + data_processor.feature_schema.lookback + history_margin
+        sessions = default_calendar().sessions_before(self.end_date, history)
+        stock_data = self.fetch_data(start_date=sessions[0].strftime('%Y-%m-%d'))
+
+        latest = data_processor.preprocess_latest(stock_data, self.tickers)
+
+        # Tickers can only share a forward pass if their architectures match
+        groups = {}
+        for ticker, (window, last_timestamp) in latest.items():
+            if weight_pack is not None:
+                if ticker not in weight_pack:
+                    print(f"No weights found for {ticker} in {weight_pack.path}. Skipping.")
+                    continue
+                model, config = self.model_registry.get(ticker, weight_pack)
+                settings = None  # Weight packs keep only the architecture
+            else:
+                model_path = model_path_template.format(ticker=ticker)
+                if not os.path.exists(model_path):
+                    print(f"No weights found for {ticker} at {model_path}. Skipping.")
+                    continue
+                model, config = self.model_registry.get(model_path)
+                settings = load_model_settings(model_path)
+            self.check_model_inputs(ticker, config, settings)
+
+            X = self.match_input_size(window[None], config['input_size'])
+            groups.setdefault(json.dumps(config, sort_keys=True), []).append((ticker, model, X))
+
+        predictions = {}
+        stacked_models = {}
+        for key, group in groups.items():
+            # Restack only if the group's models changed since the last call (e.g. a ticker was added or reloaded)
+            models = [model for _, model, _ in group]
+            stack = self.stacked_models.get(key)
+            if stack is None or not stack.matches(models):
+                stack = StackedModels(models)
+            stacked_models[key] = stack
+
+            outputs = stack.predict(np.stack([X for _, _, X in group]))
+            for (ticker, _, _), output in zip(group, outputs):
+                predictions[ticker] = output
+        self.stacked_models = stacked_models  # Stacks of groups no longer scored would keep their models alive
+
+        print(self.model_registry)
+        return predictions
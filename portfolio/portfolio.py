@@ -1,16 +1,19 @@
 from portfolio.ticker import Ticker
 from typing import Optional
 from alpaca.data.timeframe import TimeFrame
+from data.batch_fetcher import BatchBarFetcher
 
 class Portfolio:
-    def __init__(self, api_connection):
+    def __init__(self, api_connection, batch_fetcher=None, bar_cache=None):
         self.api_connection = api_connection
+        self.batch_fetcher = batch_fetcher or BatchBarFetcher(api_connection.historical_data_client)
+        self.bar_cache = bar_cache  # Optional BarCache; every timeframe is then resampled from cached minute bars
         self.tickers = {}
 
     def add_ticker(self, symbol: str):
         """Add a new ticker to the portfolio."""
         if symbol not in self.tickers:
-            self.tickers[symbol] = Ticker(symbol, self.api_connection)
+            self.tickers[symbol] = Ticker(symbol, self.api_connection, self.bar_cache)
 
     def remove_ticker(self, symbol: str):
         """Remove a ticker from the portfolio."""
@@ -21,9 +24,18 @@ class Portfolio:
         """Retrieve a ticker from the portfolio."""
         return self.tickers.get(symbol, None)
 
-    def fetch_data_for_all(self, start_date: str, end_date: str, timeframe=TimeFrame.Minute):
-        """Fetch stock data for all tickers in the portfolio."""
+    def fetch_data_for_all(self, start_date: str, end_date: str, timeframe=TimeFrame.Minute,
+                           session_aligned: bool = False):
+        """Fetch stock data for all tickers in the portfolio with batched multi-symbol requests."""
+        start, end = f"{start_date}T00:00:00Z", f"{end_date}T23:59:59Z"
+        if self.bar_cache is not None:
+            df = self.bar_cache.get_resampled(list(self.tickers), timeframe, start, end, session_aligned)
+        else:
+            df = self.batch_fetcher.fetch(list(self.tickers), timeframe, start, end)
+        by_symbol = dict(tuple(df.groupby('symbol'))) if not df.empty else {}
+
         data = {}
         for symbol, ticker in self.tickers.items():
-            data[symbol] = ticker.fetch_stock_data(start_date, end_date, timeframe)
+            symbol_df = by_symbol.get(symbol, df.iloc[0:0])
+            data[symbol] = ticker.prepare_bars(symbol_df.reset_index(drop=True))
         return data
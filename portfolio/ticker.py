@@ -1,13 +1,15 @@
 import pandas as pd
-from datetime import datetime
 import pytz
 from alpaca.data.timeframe import TimeFrame
-from alpaca.data.requests import StockBarsRequest, StockTradesRequest
+from alpaca.data.requests import StockBarsRequest
+from data.calendar import EASTERN, default_calendar
+from data.ticks import aggregate_trades, iter_trade_chunks
 
 class Ticker:
-    def __init__(self, symbol: str, api_connection):
+    def __init__(self, symbol: str, api_connection, bar_cache=None):
         self.symbol = symbol
         self.api_connection = api_connection
+        self.bar_cache = bar_cache  # Optional BarCache; bars are then resampled from cached minute bars
 
     @staticmethod
     def utc_to_eastern(utc_dt):
@@ -16,15 +18,20 @@ class Ticker:
         return utc_dt.astimezone(eastern_tz)
 
     def is_trading_hour(self, utc_timestamp):
-        """Check if a timestamp is within trading hours."""
-        et_timestamp = self.utc_to_eastern(utc_timestamp)
-        return datetime(1900, 1, 1, 9, 30).time() <= et_timestamp.time() <= datetime(1900, 1, 1, 16, 0).time()
+        """Check if a timestamp is within a regular session (holidays and half days included)."""
+        return bool(default_calendar().is_trading([utc_timestamp])[0])
 
-    def fetch_stock_data(self, start_date: str, end_date: str, timeframe=TimeFrame.Minute) -> pd.DataFrame:
-        """Fetch minute-level stock data (bars) for the given symbol."""
+    def fetch_stock_data(self, start_date: str, end_date: str, timeframe=TimeFrame.Minute,
+                         session_aligned: bool = False) -> pd.DataFrame:
+        """Fetch stock data (bars) for the given symbol, from cached minute bars if a bar cache is set."""
         start_date_formatted = f"{start_date}T00:00:00Z"
         end_date_formatted = f"{end_date}T23:59:59Z"
 
+        if self.bar_cache is not None:
+            bars = self.bar_cache.get_resampled(self.symbol, timeframe, start_date_formatted, end_date_formatted,
+                                                session_aligned)
+            return self.prepare_bars(bars)
+
         bars_request = StockBarsRequest(
             symbol_or_symbols=self.symbol,
             timeframe=timeframe,
@@ -33,30 +40,34 @@ class Ticker:
         )
 
         bars = self.api_connection.historical_data_client.get_stock_bars(bars_request)
-        df = bars.df.reset_index()
+        return self.prepare_bars(bars.df.reset_index())
 
-        # Convert timestamps to Eastern time and check trading hours
+    def prepare_bars(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Convert bar timestamps to Eastern time and tag trading hours."""
         if 'timestamp' in df.columns:
-            df['timestamp'] = pd.to_datetime(df['timestamp'], utc=True).apply(self.utc_to_eastern)
-            df['is_trading'] = df['timestamp'].apply(self.is_trading_hour)
+            timestamps = pd.to_datetime(df['timestamp'], utc=True)
+            df['is_trading'] = default_calendar().is_trading(timestamps)  # Vectorized session lookup
+            df['timestamp'] = timestamps.dt.tz_convert(EASTERN)
         return df
 
-    def fetch_high_resolution_data(self, start_date: str, end_date: str) -> pd.DataFrame:
-        """Fetch high-resolution (trades) data for a given symbol."""
-        trades_request = StockTradesRequest(
-            symbol_or_symbols=self.symbol,
-            start=start_date,
-            end=end_date
-        )
-        trades = self.api_connection.historical_data_client.get_stock_trades(trades_request)
-
-        high_res_data = pd.DataFrame([{
-            "timestamp": trade.timestamp,
-            "price": trade.price,
-            "size": trade.size,
-            "exchange": trade.exchange,
-            "conditions": trade.conditions,
-            "tape": trade.tape
-        } for trade in trades.df[self.symbol]])
-
-        return high_res_data
+    def fetch_high_resolution_data(self, start_date: str, end_date: str,
+                                   chunk=pd.Timedelta(minutes=30)) -> pd.DataFrame:
+        """Fetch high-resolution (trades) data for a given symbol as typed columns, one time slice at a time."""
+        chunks = list(iter_trade_chunks(self.api_connection.historical_data_client, self.symbol,
+                                        start_date, end_date, chunk))
+        if not chunks:
+            return pd.DataFrame(columns=["timestamp", "price", "size", "exchange", "conditions", "tape"])
+
+        # union_categoricals keeps exchange/conditions/tape categorical across slices
+        for column in ("exchange", "conditions", "tape"):
+            categories = pd.api.types.union_categoricals([c[column] for c in chunks]).categories
+            for c in chunks:
+                c[column] = c[column].cat.set_categories(categories)
+        return pd.concat(chunks, ignore_index=True)
+
+    def fetch_trade_bars(self, start_date: str, end_date: str, interval='1min',
+                         chunk=pd.Timedelta(minutes=30)) -> pd.DataFrame:
+        """Aggregate trades into OHLCV + VWAP bars of any interval without holding all trades in memory."""
+        chunks = iter_trade_chunks(self.api_connection.historical_data_client, self.symbol,
+                                   start_date, end_date, chunk)
+        return self.prepare_bars(aggregate_trades(chunks, interval))
@@ -1,7 +1,11 @@
 from pipelines.pipelines import TransformerPipeline, RegressionPipeline
+from connection.client import APIConnection
+from data.cache import BarCache
+import numpy as np
 import pandas as pd
 
-def predict_single_ticker(ticker, start_date, end_date, window_size, pred_days, _model_type):
+def predict_single_ticker(ticker, start_date, end_date, window_size, pred_days, _model_type, bar_cache=None,
+                          model_registry=None):
     """
     Predicts stock prices for a single ticker and returns the results based on the model type (Transformer or Regression).
 
@@ -12,16 +16,19 @@ def predict_single_ticker(ticker, start_date, end_date, window_size, pred_days,
         window_size (int): Number of days to consider for training.
         pred_days (int): Days ahead to predict.
         _model_type (str): The type of model to use ('transformer' or 'regression').
+        bar_cache (BarCache, optional): On-disk bar store to fetch through.
+        model_registry (ModelRegistry, optional): Registry of loaded models to reuse (transformer only).
 
     Returns:
         list: List of predicted values for the given ticker.
     """
     if _model_type == 'transformer':
         pipeline = TransformerPipeline(start_date=start_date, end_date=end_date, window_size=window_size, pred_days=pred_days,
-                                       ticker=ticker, model_save_path=f"weights/transformer/{ticker}_model.pth")
+                                       ticker=ticker, model_save_path=f"weights/transformer/{ticker}_model.pth",
+                                       bar_cache=bar_cache, model_registry=model_registry)
     elif _model_type == 'regression':
         pipeline = RegressionPipeline(start_date=start_date, end_date=end_date, window_size=window_size, pred_days=pred_days,
-                                      ticker=ticker)
+                                      ticker=ticker, bar_cache=bar_cache)
     else:
         raise ValueError("Invalid model_type. Please choose 'transformer' or 'regression'.")
 
@@ -34,7 +41,9 @@ def predict_single_ticker(ticker, start_date, end_date, window_size, pred_days,
         return []
 
 
-def batch_predict_tickers(_tickers, start_date, end_date, window_size, pred_days, model_type):
+def batch_predict_tickers(_tickers, start_date, end_date, window_size, pred_days, model_type, bar_cache=None,
+                          model_registry=None, weight_pack=None, inference_backend='eager', latest_only=False,
+                          horizons=None, output=0):
     """
     Predicts stock prices for a list of tickers and ranks them by day based on the model type (Transformer or Regression).
 
@@ -45,36 +54,79 @@ def batch_predict_tickers(_tickers, start_date, end_date, window_size, pred_days
         window_size (int): Number of days to consider for training.
         pred_days (int): Days ahead to predict.
         model_type (str): The type of model to use ('transformer' or 'regression').
+        bar_cache (BarCache, optional): On-disk bar store shared by all tickers (default: cache/bars).
+        model_registry (ModelRegistry, optional): Registry of loaded models to reuse across calls (transformer only).
+        weight_pack (WeightPack, optional): Pack to load all transformer weights from instead of per-ticker files.
+        inference_backend (str): Transformer inference backend: 'eager', 'int8' or 'traced'.
+        latest_only (bool): Only score each ticker's most recent window, fetching just the history it needs
+            (transformer only).
+        horizons (list, optional): Horizons the transformer models were trained on (default: [pred_days]).
+        output (int): Model output to rank by, e.g. the index of a horizon in `horizons`.
 
     Returns:
         pd.DataFrame: DataFrame containing the rank and predicted values of stocks by day.
     """
-    results_by_day = {}
-
-    for ticker in _tickers:
-        print(f"Starting prediction for {ticker} using {model_type} model")
+    if bar_cache is None:
+        bar_cache = BarCache(APIConnection().historical_data_client)
+
+    if model_type == 'transformer':
+        # Fetch and preprocess the whole universe once, then run each ticker's model
+        print(f"Starting batch prediction for {len(_tickers)} tickers using {model_type} model")
+        pipeline = TransformerPipeline(start_date=start_date, end_date=end_date, window_size=window_size,
+                                       pred_days=pred_days, ticker=list(_tickers), bar_cache=bar_cache,
+                                       model_registry=model_registry, inference_backend=inference_backend,
+                                       horizons=horizons)
         try:
-            predictions = predict_single_ticker(ticker, start_date, end_date, window_size, pred_days, model_type)
-
-            # Store predictions by day for ranking
-            for day, value in enumerate(predictions):
-                if day not in results_by_day:
-                    results_by_day[day] = []
-                results_by_day[day].append((ticker, value))
+            if latest_only:
+                predictions_by_ticker = pipeline.predict_latest(weight_pack=weight_pack)
+            else:
+                predictions_by_ticker = pipeline.predict_batch(weight_pack=weight_pack)
         except ValueError as e:
-            print(f"Error during prediction for {ticker}: {e}")
-            print("Continuing with next ticker...")
+            print(f"Error during batch prediction: {e}")
+            predictions_by_ticker = {}
+    else:
+        predictions_by_ticker = {}
+        for ticker in _tickers:
+            print(f"Starting prediction for {ticker} using {model_type} model")
+            try:
+                predictions_by_ticker[ticker] = predict_single_ticker(ticker, start_date, end_date, window_size,
+                                                                      pred_days, model_type, bar_cache)
+            except ValueError as e:
+                print(f"Error during prediction for {ticker}: {e}")
+                print("Continuing with next ticker...")
+
+    print(bar_cache.stats)
+
+    return rank_predictions(predictions_by_ticker, output)
 
-    # Rank the tickers by their predicted values for each day
-    ranked_results = []
-    for day, ticker_values in results_by_day.items():
-        ranked_ticker_values = sorted(ticker_values, key=lambda x: x[1], reverse=True)  # Sort by value
-        for rank, (ticker, value) in enumerate(ranked_ticker_values, 1):
-            ranked_results.append({"Day": day + 1, "Ticker": ticker, "Predicted Value": value, "Rank": rank})
 
-    # Convert the ranked results into a DataFrame
-    return pd.DataFrame(ranked_results)
+def rank_predictions(predictions_by_ticker, output=0):
+    """
+    Ranks tickers by their predicted values for each day.
+
+    Args:
+        predictions_by_ticker (dict): Maps each ticker to its predictions, one row per day.
+        output (int): Column of multi-output predictions to rank by.
 
+    Returns:
+        pd.DataFrame: DataFrame with Day, Ticker, Predicted Value and Rank columns, sorted by day and rank.
+    """
+    frames = []
+    for ticker, predictions in predictions_by_ticker.items():
+        predictions = np.asarray(predictions, dtype=np.float32)
+        if predictions.size == 0:
+            continue
+        values = predictions.reshape(len(predictions), -1)[:, output]
+        frames.append(pd.DataFrame({"Day": np.arange(1, len(values) + 1), "Ticker": ticker,
+                                    "Predicted Value": values}))
+
+    if not frames:
+        return pd.DataFrame(columns=["Day", "Ticker", "Predicted Value", "Rank"])
+
+    # Rank within each day; ties keep the ticker order, like a stable descending sort
+    ranked_df = pd.concat(frames, ignore_index=True)
+    ranked_df["Rank"] = ranked_df.groupby("Day")["Predicted Value"].rank(method="first", ascending=False).astype(int)
+    return ranked_df.sort_values(["Day", "Rank"], kind="stable").reset_index(drop=True)
 
 if __name__ == "__main__":
     from data.tickers import tickers
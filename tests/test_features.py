@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+from data.processor.features import FeatureSchema, pct_change, rolling_std
+
+SCHEMA = FeatureSchema(('open', 'close', 'sma_5', 'ema_5', 'rsi_5', 'volatility_5', 'return_1', 'vwap_dev'))
+
+
+def make_bars(num_days, num_tickers, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, (num_days, num_tickers)), axis=0))
+    bars = np.stack([close, close * 1.01, close * 0.99, close, np.full_like(close, 1e6), np.full_like(close, 1e3),
+                     close], axis=2)
+    return bars.astype(np.float32)
+
+
+def test_halted_days_match_single_ticker_features():
+    bars = make_bars(60, 3)
+    mask = np.ones(bars.shape[:2], dtype=bool)
+    mask[20:25, 1] = False
+    bars[~mask] = 0
+
+    features = SCHEMA.compute(bars, mask)
+
+    traded = mask[:, 1]
+    alone = SCHEMA.compute(bars[traded, 1][:, None])[:, 0]
+    np.testing.assert_array_equal(features[traded, 1], alone)
+    # Indicators carry the last traded day's values through the halt, bar columns keep the zero fill
+    np.testing.assert_array_equal(features[20:25, 1, 2:], np.repeat(features[19:20, 1, 2:], 5, axis=0))
+    assert not features[20:25, 1, :2].any()
+    np.testing.assert_array_equal(SCHEMA.compute(bars), features)
+
+
+def test_rolling_std_keeps_precision_on_price_levels():
+    x = 1e6 + np.random.default_rng(0).normal(0, 1e-2, (300, 2))
+    expected = np.stack([x[max(day - 19, 0):day + 1].std(axis=0) for day in range(len(x))])
+    np.testing.assert_allclose(rolling_std(x, 20), expected, rtol=1e-6)
+
+
+def test_pct_change_rejects_zero_periods():
+    with pytest.raises(ValueError):
+        pct_change(np.ones(5), 0)
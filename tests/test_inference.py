@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+import torch
+from data.processor.windows import sliding_windows
+from models.transformer.inference import Inference, StackedModels
+from models.transformer.model import TransformerModel
+
+
+def make_model(seed):
+    torch.manual_seed(seed)
+    model = TransformerModel(input_size=3, num_heads=2, num_layers=1, hidden_dim=8, dim_feedforward=16)
+    return model.eval()
+
+
+@pytest.mark.filterwarnings('error')
+def test_read_only_windows_predict_without_warnings():
+    rows = np.random.default_rng(0).normal(size=(40, 3)).astype(np.float32)
+    X = sliding_windows(rows, 5)
+    assert not X.flags.writeable
+
+    models = [make_model(0), make_model(1)]
+    expected = np.stack([Inference(model).predict(np.array(X)) for model in models])
+
+    np.testing.assert_array_equal(Inference(models[0]).predict(X), expected[0])
+    stacked = StackedModels(models).predict(np.broadcast_to(X, (2,) + X.shape))
+    np.testing.assert_allclose(stacked, expected, atol=1e-5)
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+from data.processor.dense import BAR_FEATURES
+from data.processor.processors import RegressionProcessor
+
+
+def make_bars(tickers, days, stopped=None):
+    """ Bar frame of random-walk prices for `tickers`; tickers in `stopped` have no bars from that day on. """
+    rng = np.random.default_rng(0)
+    frames = []
+    for ticker in tickers:
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, len(days))))
+        frame = pd.DataFrame(dict(symbol=ticker, timestamp=days, open=close, high=close * 1.01, low=close * 0.99,
+                                  close=close, volume=1e6, trade_count=1e3, vwap=close))
+        if stopped and ticker in stopped:
+            frame = frame[frame['timestamp'] < stopped[ticker]]
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)[['symbol', 'timestamp', *BAR_FEATURES]]
+
+
+def test_rerun_without_new_final_days(tmp_path):
+    # One ticker stopped trading inside the grace period, so the days since are held back on every run
+    tickers = ['AAA', 'BBB', 'CCC']
+    end = pd.Timestamp.now(tz='UTC').normalize() - pd.Timedelta(days=2)
+    days = pd.bdate_range(end=end, periods=120) + pd.Timedelta(hours=5)
+    stock_data = make_bars(tickers, days, stopped={'CCC': days[-2]})
+
+    first = RegressionProcessor(10, 1).preprocess_incremental(stock_data, tickers, str(tmp_path))
+    second = RegressionProcessor(10, 1).preprocess_incremental(stock_data, tickers, str(tmp_path))
+
+    for ticker in tickers:
+        for window in first[ticker]:
+            assert np.array_equal(first[ticker][window]['X'], second[ticker][window]['X'])
+    assert len(first['AAA'][5]['X']) == len(days) - 2 - 5
+
+
+def test_state_rebuilt_for_another_start_date(tmp_path):
+    tickers = ['AAA', 'BBB']
+    days = pd.bdate_range('2023-01-02', periods=120, tz='UTC') + pd.Timedelta(hours=5)
+    stock_data = make_bars(tickers, days)
+
+    RegressionProcessor(10, 1).preprocess_incremental(stock_data, tickers, str(tmp_path), '2023-01-01')
+    later = stock_data[stock_data['timestamp'] >= days[40]]
+    rebuilt = RegressionProcessor(10, 1).preprocess_incremental(later, tickers, str(tmp_path), '2023-03-01')
+
+    assert len(rebuilt['AAA'][5]['X']) == len(days) - 40 - 5
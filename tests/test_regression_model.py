@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+from data.processor.windows import sliding_windows
+from models.regression.regression_model import RegressionModel
+
+# The reference is the sklearn LinearRegression fit the model replaced; sklearn is no runtime requirement
+LinearRegression = pytest.importorskip('sklearn.linear_model').LinearRegression
+
+
+def open_high_data(num_days, tickers=('AAA', 'BBB', 'CCC'), windows=(5, 15, 30, 90)):
+    """ Open-high windows of slow random walks around 3000, as the regression processor builds them. """
+    rng = np.random.default_rng(num_days)
+    data = {}
+    for ticker in tickers:
+        open_ = (3000 * np.exp(np.cumsum(rng.normal(0, 0.0005, num_days)))).astype(np.float32)
+        high = (open_ * np.exp(np.abs(rng.normal(0, 0.0005, num_days)))).astype(np.float32)
+        data[ticker] = {window: {"X": sliding_windows(open_, window, num_days - window),
+                                 "y": sliding_windows(high, window, num_days - window)} for window in windows}
+    return data
+
+
+def test_matches_sklearn_linear_regression():
+    # With 150 days the 90-day window has fewer samples than features, so the rank cutoff decides the solution
+    for num_days in (150, 250):
+        data = open_high_data(num_days)
+        results = RegressionModel().fit(data)
+
+        for ticker, windows in data.items():
+            for window, pair in windows.items():
+                expected = LinearRegression().fit(pair["X"].astype(np.float64), pair["y"].astype(np.float64))
+                assert np.allclose(results[ticker][window]["coefficients"], expected.coef_, atol=1e-6)
+                assert np.allclose(results[ticker][window]["intercept"], expected.intercept_, atol=1e-3)
@@ -0,0 +1,50 @@
+import os
+import numpy as np
+import torch
+from models.transformer.checkpoint import atomic_save
+from models.transformer.grouped_trainer import GroupedTrainer
+from models.transformer.model import TransformerModel
+from models.transformer.trainer import Trainer
+
+
+def make_trainer(model_path):
+    torch.manual_seed(0)
+    model = TransformerModel(input_size=3, num_heads=2, num_layers=1, hidden_dim=8, dim_feedforward=16)
+    return Trainer(model, learning_rate=1e-3, batch_size=8, epochs=3, model_save_path=str(model_path), patience=2,
+                   validation_split=0)
+
+
+def test_resume_replaces_stale_weights(tmp_path):
+    model_path = tmp_path / "model.pth"
+    rng = np.random.default_rng(0)
+    X, y = rng.normal(size=(32, 5, 3)), rng.normal(size=(32, 1))
+
+    # A training state that had already stopped early, next to weights left by another run
+    trainer = make_trainer(model_path)
+    best_model = {key: value.clone() for key, value in trainer.model.state_dict().items()}
+    atomic_save(trainer.training_state(2, 1.0, best_model, trainer.patience, 0.0), trainer.checkpoint_path)
+    stale = {key: torch.zeros_like(value) for key, value in best_model.items()}
+    torch.save(stale, model_path)
+
+    make_trainer(model_path).train(X, y)
+
+    saved = torch.load(model_path)
+    assert all(torch.equal(saved[key], best_model[key]) for key in best_model)
+
+
+def test_grouped_trainer_discards_checkpoint_of_other_settings(tmp_path):
+    torch.manual_seed(0)
+    models = [TransformerModel(input_size=3, num_heads=2, num_layers=1, hidden_dim=8, dim_feedforward=16)
+              for _ in range(2)]
+    paths = [str(tmp_path / f"{ticker}_model.pth") for ticker in ('AAA', 'BBB')]
+    rows = np.random.default_rng(0).normal(size=(2, 64, 3))
+    y = np.random.default_rng(1).normal(size=(2, 60, 1))
+
+    trainer = GroupedTrainer(models, learning_rate=1e-3, batch_size=8, epochs=2, model_save_paths=paths, gap=6,
+                             fingerprint=dict(end_date='2024-01-01'))
+    atomic_save(dict(trainer.training_state(1, [0, 1], [0.0, 0.0], [None, None], [0, 0], [1, 1], 0.0),
+                     fingerprint=dict(end_date='2023-01-01')), trainer.checkpoint_path)
+
+    assert trainer.train(rows, y, window_size=5) == [2, 2]
+    assert not os.path.exists(trainer.checkpoint_path)
+    assert all(os.path.exists(path) for path in paths)
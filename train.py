@@ -1,8 +1,17 @@
+from functools import partial
 from pipelines.pipelines import RegressionPipeline, TransformerPipeline
+from pipelines.transformer_pipeline import training_settings
+from pipelines.scheduler import TrainingScheduler
+from connection.client import APIConnection
+from data.cache import BarCache
+from data.fetcher import StockDataFetcher
+from models.transformer.registry import load_model_settings
+
+MODEL_PATH_TEMPLATE = "weights/transformer/{ticker}_model.pth"
 
 
 def train_single_ticker(ticker, start_date, end_date, window_size, pred_days, learning_rate, batch_size, epochs,
-                        model_type):
+                        model_type, bar_cache=None, model_save_path=None, max_time=None, horizons=None):
     """
     Trains a model for a single ticker based on the selected model type (Transformer or Regression).
 
@@ -16,27 +25,57 @@ def train_single_ticker(ticker, start_date, end_date, window_size, pred_days, le
         batch_size (int): Batch size for training (only for Transformer).
         epochs (int): Number of epochs for training (only for Transformer).
         model_type (str): The type of model to use ('transformer' or 'regression').
+        bar_cache (BarCache, optional): On-disk bar store to fetch through.
+        model_save_path (str, optional): Where to save the Transformer weights (default: weights/transformer).
+        max_time (float, optional): Wall-clock training budget in seconds (only for Transformer).
+        horizons (list, optional): Days ahead of each Transformer output, trained together (default: [pred_days]).
+
+    Returns:
+        int: Number of epochs run (Transformer only).
     """
+    epochs_run = None
     if model_type == 'transformer':
         # Initialize the Transformer pipeline
         pipeline = TransformerPipeline(start_date=start_date, end_date=end_date, window_size=window_size,
-                                       pred_days=pred_days, ticker=ticker)
+                                       pred_days=pred_days, ticker=ticker, bar_cache=bar_cache,
+                                       model_save_path=model_save_path or MODEL_PATH_TEMPLATE.format(ticker=ticker),
+                                       horizons=horizons)
         # Train the Transformer model
-        pipeline.train_model(learning_rate=learning_rate, batch_size=batch_size, epochs=epochs)
+        epochs_run = pipeline.train_model(learning_rate=learning_rate, batch_size=batch_size, epochs=epochs,
+                                          max_time=max_time)
     elif model_type == 'regression':
         # Initialize the Regression pipeline
         pipeline = RegressionPipeline(start_date=start_date, end_date=end_date, window_size=window_size,
-                                      pred_days=pred_days, ticker=ticker)
+                                      pred_days=pred_days, ticker=ticker, bar_cache=bar_cache)
         # Train the Regression model
         pipeline.train_model()
     else:
         raise ValueError("Invalid model_type. Please choose 'transformer' or 'regression'.")
 
     print(f"Training completed for {ticker} using {model_type} model.")
+    return epochs_run
+
+
+def train_ticker_job(ticker, cache_dir, **kwargs):
+    """
+    Scheduler job: trains one ticker in a worker process with its own bar cache handle.
+    """
+    bar_cache = BarCache(APIConnection().historical_data_client, cache_dir=cache_dir)
+    return train_single_ticker(ticker, bar_cache=bar_cache, **kwargs)
+
+
+def is_checkpoint_complete(ticker, settings):
+    """
+    A ticker's Transformer checkpoint is complete once its metadata is written, which happens after training ends,
+    and only for a run with the same settings (see training_settings): a new date range, window or horizons
+    retrains it.
+    """
+    return load_model_settings(MODEL_PATH_TEMPLATE.format(ticker=ticker)) == settings
 
 
 def batch_train_tickers(_tickers, start_date, end_date, window_size, pred_days, learning_rate, batch_size, epochs,
-                        model_type):
+                        model_type, bar_cache=None, workers=1, threads_per_worker=1, resume=True, grouped=False,
+                        max_time=None, horizons=None):
     """
     Trains models for a list of tickers and saves each model based on the selected model type (Transformer or Regression).
 
@@ -50,16 +89,68 @@ def batch_train_tickers(_tickers, start_date, end_date, window_size, pred_days,
         batch_size (int): Batch size for training (only for Transformer).
         epochs (int): Number of epochs for training (only for Transformer).
         model_type (str): The type of model to use ('transformer' or 'regression').
+        bar_cache (BarCache, optional): On-disk bar store shared by all tickers (default: cache/bars).
+        workers (int): Number of worker processes for Transformer training; 1 trains in this process.
+        threads_per_worker (int): Torch intra-op threads per worker process.
+        resume (bool): Skip tickers whose Transformer checkpoint is already complete for these settings.
+        grouped (bool): Train all Transformer tickers together with stacked, vmapped models in this process.
+        max_time (float, optional): Wall-clock training budget per ticker, or per group of grouped tickers, in seconds
+            (only for Transformer).
+        horizons (list, optional): Days ahead of each Transformer output, trained together (default: [pred_days]).
     """
+    if bar_cache is None:
+        bar_cache = BarCache(APIConnection().historical_data_client)
+
+    # A ticker only counts as done if it was trained for this run's dates, window and labels
+    settings = training_settings(start_date, end_date, window_size, horizons or [pred_days])
+    is_complete = partial(is_checkpoint_complete, settings=settings)
+
+    if model_type == 'transformer' and grouped:
+        pending = [ticker for ticker in _tickers if not (resume and is_complete(ticker))]
+        print(f"Starting grouped training for {len(pending)} tickers ({len(_tickers) - len(pending)} already complete)")
+        if pending:
+            pipeline = TransformerPipeline(start_date=start_date, end_date=end_date, window_size=window_size,
+                                           pred_days=pred_days, ticker=pending, bar_cache=bar_cache,
+                                           horizons=horizons)
+            epochs_run = pipeline.train_grouped(learning_rate=learning_rate, batch_size=batch_size, epochs=epochs,
+                                                model_path_template=MODEL_PATH_TEMPLATE, max_time=max_time)
+            for ticker, ticker_epochs in epochs_run.items():
+                print(f"{ticker}: {ticker_epochs} epochs")
+        print(bar_cache.stats)
+        print("Batch training completed.")
+        return
+
+    if model_type == 'transformer' and workers > 1:
+        # Fetch the whole universe once so workers only read from the cache
+        try:
+            StockDataFetcher(None, start_date=start_date, end_date=end_date, cache=bar_cache).fetch_data(_tickers)
+        except ValueError as e:
+            print(f"Error during prefetch: {e}")
+
+        scheduler = TrainingScheduler(train_ticker_job, max_workers=workers, threads_per_worker=threads_per_worker,
+                                      is_complete=is_complete if resume else None)
+        scheduler.run(_tickers, cache_dir=bar_cache.cache_dir, start_date=start_date, end_date=end_date,
+                      window_size=window_size, pred_days=pred_days, learning_rate=learning_rate,
+                      batch_size=batch_size, epochs=epochs, model_type=model_type, max_time=max_time,
+                      horizons=horizons)
+        print(bar_cache.stats)
+        print("Batch training completed.")
+        return
+
     for ticker in _tickers:
+        if model_type == 'transformer' and resume and is_complete(ticker):
+            print(f"Skipping {ticker}: checkpoint already complete.")
+            continue
+
         print(f"Starting training for {ticker} with {model_type} model")
         try:
             train_single_ticker(ticker, start_date, end_date, window_size, pred_days, learning_rate, batch_size, epochs,
-                                model_type)
+                                model_type, bar_cache, max_time=max_time, horizons=horizons)
         except ValueError as e:
             print(f"Error during training for {ticker}: {e}")
             print("Continuing with next ticker...")
 
+    print(bar_cache.stats)
     print("Batch training completed.")
 
 
@@ -69,7 +160,8 @@ if __name__ == "__main__":
     # Choose model type ('transformer' or 'regression')
     model_type = 'transformer'  # Change to 'regression' to train using the regression model
 
-    # Train models for all tickers
+    # Train models for all tickers, one after another in this process. Pass e.g. workers=4, threads_per_worker=2
+    # to train on a process pool, and max_time to cap the training time per ticker
     batch_train_tickers(_tickers=tickers, start_date="2022-01-01", end_date="2022-10-01",
                         window_size=5, pred_days=1, learning_rate=0.0001,
                         batch_size=32, epochs=500, model_type=model_type)
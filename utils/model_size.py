@@ -1,7 +1,12 @@
 import numpy as np
-from sympy import divisors
 
-# Helper function to find the least common divisor and pad if necessary
+# Embedding widths the shape planner considers, smallest first
+HIDDEN_DIMS = (8, 16, 24, 32, 48, 64, 96, 128, 192, 256)
+# Default forward-pass budget per time step of a sample, so longer windows get a proportionally larger budget
+DEFAULT_FLOPS_PER_STEP = 2.5e5
+
+
+# Legacy heuristic the processor used to pick the head count; still needed to rebuild weights saved without metadata
 def find_best_head_size(input_size):
     # Try common even divisors starting from an ideal 64
     for divisor in range(64, 1, -1):
@@ -11,15 +16,96 @@ def find_best_head_size(input_size):
     return 2
 
 
-# Function to pad the input if the size is not ideal
-def pad_input(x, input_size):
-    num_samples, time_steps, _ = x.shape
-    padding_size = (64 - (input_size % 64)) if input_size % 64 != 0 else 0
-    if padding_size > 0:
-        new_input_size = input_size + padding_size
-        X_padded = np.pad(x, ((0, 0), (0, 0), (0, padding_size)), 'constant')
-        return X_padded, new_input_size
-    return x, input_size
+def transformer_cost(input_size, hidden_dim, num_heads, num_layers, dim_feedforward, window_size, num_outputs=1,
+                     batch_size=32):
+    """
+    Estimates the cost of a TransformerModel shape.
+
+    Args:
+        input_size (int): Number of input features.
+        hidden_dim (int): Embedding width.
+        num_heads (int): Attention heads.
+        num_layers (int): Encoder layers.
+        dim_feedforward (int): Width of the encoder feed-forward layers.
+        window_size (int): Time steps per sample.
+        num_outputs (int): Regression outputs.
+        batch_size (int): Training batch size the memory estimate is for.
+
+    Returns:
+        dict: flops (forward pass per sample, 2 per multiply-add), params, and memory_bytes (fp32 weights,
+        gradients and Adam moments plus the activations of one training batch).
+    """
+    h, f, t = hidden_dim, dim_feedforward, window_size
+
+    # Per time step: embedding, then per layer the q/k/v/out projections, attention scores and weighted sum
+    # over the window, and the feed-forward block
+    layer_flops = 2 * (4 * h * h + 2 * t * h + 2 * h * f)
+    flops = t * (2 * input_size * h + num_layers * layer_flops) + 2 * h * num_outputs
+
+    layer_params = (4 * h * h + 4 * h) + (2 * h * f + f + h) + 4 * h  # Attention, feed-forward, two LayerNorms
+    params = (input_size * h + h) + num_layers * layer_params + (h * num_outputs + num_outputs)
+
+    # Activations kept for backward per layer and sample: projections, attention maps and the feed-forward hidden
+    activations = num_layers * t * (8 * h + num_heads * t + 2 * f)
+    memory_bytes = 4 * (4 * params + batch_size * activations)
+
+    return dict(flops=int(flops), params=int(params), memory_bytes=int(memory_bytes))
+
+
+def plan_transformer_shape(input_size, window_size, num_outputs=1, num_layers=4, max_flops=None, max_params=None,
+                           max_memory_mb=None, batch_size=32, head_dim=8, ff_ratio=4):
+    """
+    Picks the widest TransformerModel shape whose estimated cost fits the budget. The embedding layer maps any
+    number of input features to the hidden width, so inputs are never padded; the head count is the largest
+    power of two (up to 8) with heads at least `head_dim` wide, and the feed-forward width follows from a fixed ratio.
+
+    Args:
+        input_size (int): Number of input features.
+        window_size (int): Time steps per sample.
+        num_outputs (int): Regression outputs.
+        num_layers (int): Encoder layers.
+        max_flops (float, optional): Forward FLOPs per sample (default: DEFAULT_FLOPS_PER_STEP per time step).
+        max_params (int, optional): Parameter limit.
+        max_memory_mb (float, optional): Training memory limit in MB (see transformer_cost).
+        batch_size (int): Training batch size for the memory estimate.
+        head_dim (int): Width of each attention head.
+        ff_ratio (int): Feed-forward width as a multiple of the hidden width.
+
+    Returns:
+        dict: The shape (input_size, num_heads, num_layers, hidden_dim, dim_feedforward) and its estimated flops,
+        params and memory_bytes.
+    """
+    if max_flops is None:
+        max_flops = DEFAULT_FLOPS_PER_STEP * window_size
+
+    plans = []
+    for hidden_dim in HIDDEN_DIMS:
+        # Power-of-two head counts divide every planned width and keep PyTorch's fast attention paths
+        num_heads = 1
+        while num_heads < 8 and hidden_dim % (num_heads * 2) == 0 and hidden_dim // (num_heads * 2) >= head_dim:
+            num_heads *= 2
+        shape = dict(input_size=int(input_size), num_heads=num_heads, num_layers=num_layers, hidden_dim=hidden_dim,
+                     dim_feedforward=hidden_dim * ff_ratio)
+        cost = transformer_cost(window_size=window_size, num_outputs=num_outputs, batch_size=batch_size, **shape)
+        plans.append(dict(shape, **cost))
+
+    fits = [plan for plan in plans
+            if plan['flops'] <= max_flops
+            and (max_params is None or plan['params'] <= max_params)
+            and (max_memory_mb is None or plan['memory_bytes'] <= max_memory_mb * 1024 ** 2)]
+    if not fits:
+        print(f"No transformer shape fits the budget; using the smallest (hidden_dim={plans[0]['hidden_dim']}).")
+        return plans[0]
+    return fits[-1]
+
+
+def format_plan(plan):
+    """ One-line summary of a shape plan and its estimated cost. """
+    return (f"hidden_dim={plan['hidden_dim']}, heads={plan['num_heads']}, layers={plan['num_layers']}, "
+            f"feedforward={plan['dim_feedforward']}, input={plan['input_size']}: "
+            f"{plan['flops'] / 1e6:.2f} MFLOPs/sample, {plan['params'] / 1e3:.1f}k params, "
+            f"{plan['memory_bytes'] / 1024 ** 2:.1f} MB training memory")
+
 
 # Verify the output labels before training
 def verify_labels(y):